@@ -1,73 +1,72 @@
+import time
+_import_started = time.perf_counter()
+
 import json
-import os
-import hashlib
-import psycopg2
 from typing import Dict, Any
 
+import db
+import instrumentation
+import rate_limit
+import runtime
+import tokens
+from passwords import hash_password, verify_password
+
+router = runtime.Router('GET, POST')
+router.recover(db.overload_response)
+_limiter = rate_limit.limiter_from_env(db.connection)
+
+
+@instrumentation.instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Аутентификация администратора
     Args: event - httpMethod, body с password
-    Returns: HTTP response с токеном или ошибкой
+          попытки ограничены по IP и в целом (429 с Retry-After); GET ?action=stats - состояние лимитера (с токеном администратора)
+    Returns: HTTP response с подписанным токеном (X-Auth-Token для пишущих запросов) или ошибкой
     '''
-    method: str = event.get('httpMethod', 'GET')
+    return router.dispatch(event)
+
+
+@router.route('GET', 'stats')
+@tokens.admin_required
+def get_stats(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    return runtime.json_response({'rate_limit': _limiter.stats(), 'db_pool': db.stats()})
+
+
+@router.route('POST')
+def login(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    retry_after = _limiter.check(rate_limit.client_ip(event))
+    if retry_after is not None:
+        return rate_limit.too_many_requests(retry_after)
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    body_data = json.loads(event.get('body', '{}'))
+    password = body_data.get('password', '')
     
-    if method == 'POST':
-        body_data = json.loads(event.get('body', '{}'))
-        password = body_data.get('password', '')
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    with db.connection() as conn:
         cur = conn.cursor()
-        
-        cur.execute('SELECT password_hash FROM admin LIMIT 1')
+        cur.execute('SELECT id, password_hash FROM admin LIMIT 1')
         result = cur.fetchone()
         
+        verified = False
         if result:
-            stored_hash = result[0]
-            password_hash = hashlib.sha256(password.encode('utf-8')).hexdigest()
-            
-            if password_hash == stored_hash:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'success': True, 'token': 'admin-authenticated'}),
-                    'isBase64Encoded': False
-                }
-        
+            admin_id, stored_hash = result
+            verified, needs_rehash = verify_password(password, stored_hash)
+            if verified and needs_rehash:
+                cur.execute(
+                    'UPDATE admin SET password_hash = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s',
+                    (hash_password(password), admin_id)
+                )
+                conn.commit()
+                instrumentation.log('info', 'auth.password_rehashed')
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 401,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'success': False, 'error': 'Неверный пароль'}),
-            'isBase64Encoded': False
-        }
     
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    if verified:
+        if not tokens.enabled():
+            instrumentation.log('error', 'auth.keys_missing')
+            return runtime.json_response({'success': False, 'error': 'Token signing is not configured'}, 503)
+        return runtime.json_response({'success': True, **tokens.issue()})
+    
+    return runtime.json_response({'success': False, 'error': 'Неверный пароль'}, 401)
+
+
+instrumentation.imported(_import_started)
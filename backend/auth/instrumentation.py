@@ -0,0 +1,221 @@
+'''
+Замеры фаз обработки запроса: заголовок Server-Timing, гистограммы инстанса и структурные логи
+с порогом уровня и выборкой
+Функции в backend/* деплоятся по отдельности, поэтому модуль лежит копией в каждой из них
+
+Фазы: cold (импорт модулей при холодном старте), db_connect, db_query, upstream, serialize, total
+'''
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial, wraps
+from typing import Any, Callable, Dict, Iterator, Optional
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+LOG_LEVEL_NAME = os.environ.get('LOG_LEVEL', 'info').lower()
+LOG_LEVEL = LEVELS.get(LOG_LEVEL_NAME, LEVELS['info'])
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.1'))
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '1000'))
+# Имя маршрута берётся из action запроса; сверх лимита гистограммы сливаются в 'other'
+MAX_HISTOGRAMS = int(os.environ.get('METRICS_MAX_HISTOGRAMS', '256'))
+
+# Верхние границы корзин гистограмм, мс
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_started_at = time.time()
+_cold_ms: Optional[float] = None
+_cold_pending = False
+
+
+class Trace:
+    '''Суммарные длительности фаз одного запроса, мс; фазы из потоков пула складываются'''
+
+    __slots__ = ('route', 'started', 'phases', '_lock')
+
+    def __init__(self, route: str):
+        self.route = route
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + ms
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float) -> None:
+        index = 0
+        while index < len(BUCKETS_MS) and ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def quantile(self, fraction: float) -> float:
+        '''Верхняя граница корзины, в которую попадает квантиль (для последней - максимум)'''
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return float(BUCKETS_MS[index]) if index < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum_ms': round(self.total, 3),
+            'max_ms': round(self.max, 3),
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'buckets': {str(bound): count for bound, count in zip(list(BUCKETS_MS) + ['inf'], self.counts)}
+        }
+
+
+_current: 'contextvars.ContextVar[Optional[Trace]]' = contextvars.ContextVar('trace', default=None)
+_histograms: Dict[str, Histogram] = {}
+_lock = threading.Lock()
+
+
+def imported(started: float) -> None:
+    '''Вызывается в конце index.py со значением perf_counter() из его первой строки - длительность импорта'''
+    global _cold_ms, _cold_pending
+    if _cold_ms is None:
+        _cold_ms = (time.perf_counter() - started) * 1000
+        _cold_pending = True
+
+
+def observe(name: str, ms: float) -> None:
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            if len(_histograms) >= MAX_HISTOGRAMS:
+                name = 'other'
+            histogram = _histograms.get(name) or _histograms.setdefault(name, Histogram())
+        histogram.observe(ms)
+
+
+def add(name: str, seconds: float) -> None:
+    '''Добавляет длительность фазы к текущему запросу; вне запроса ничего не делает'''
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds * 1000)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(name, time.perf_counter() - started)
+
+
+def bind(fn: Callable[..., Any]) -> Callable[..., Any]:
+    '''Переносит текущий запрос в поток пула: executor.submit(bind(fn), ...); на каждый submit - свой вызов bind'''
+    return partial(contextvars.copy_context().run, fn)
+
+
+def log(level: str, event: str, **fields: Any) -> None:
+    '''Структурная строка лога в stdout, если уровень не ниже LOG_LEVEL'''
+    if LEVELS[level] < LOG_LEVEL:
+        return
+    trace = _current.get()
+    record = {'level': level, 'event': event}
+    if trace is not None:
+        record['route'] = trace.route
+    record.update(fields)
+    print(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def sampled() -> bool:
+    return LOG_SAMPLE_RATE >= 1 or random.random() < LOG_SAMPLE_RATE
+
+
+def route_name(event: Dict[str, Any]) -> str:
+    if 'httpMethod' not in event:
+        return 'trigger'
+    params = event.get('queryStringParameters') or {}
+    return f"{event['httpMethod']} {params.get('action') or '/'}"
+
+
+def _server_timing(phases: Dict[str, float]) -> str:
+    return ', '.join(f'{name};dur={ms:.1f}' for name, ms in phases.items())
+
+
+def instrumented(handler: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    '''
+    Обёртка handler: собирает фазы запроса, добавляет Server-Timing, пишет гистограммы маршрута
+    и выборочную строку лога (медленные запросы и ошибки логируются всегда)
+    '''
+    @wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        global _cold_pending
+        trace = Trace(route_name(event))
+        token = _current.set(trace)
+        response: Optional[Dict[str, Any]] = None
+        error: Optional[str] = None
+        try:
+            response = handler(event, context)
+            return response
+        except Exception as e:
+            error = f'{type(e).__name__}: {str(e)}'
+            raise
+        finally:
+            _current.reset(token)
+            total_ms = (time.perf_counter() - trace.started) * 1000
+            phases = dict(trace.phases)
+            if _cold_pending:
+                _cold_pending = False
+                phases['cold'] = _cold_ms or 0.0
+            phases['total'] = total_ms
+
+            for name, ms in phases.items():
+                observe(f'{trace.route} {name}', ms)
+
+            status = response.get('statusCode', 200) if response is not None else 500
+            if response is not None:
+                headers = response.setdefault('headers', {})
+                headers['Server-Timing'] = _server_timing(phases)
+                headers['Timing-Allow-Origin'] = '*'
+
+            if status >= 500:
+                level = 'error'
+            elif total_ms >= SLOW_REQUEST_MS:
+                level = 'warning'
+            else:
+                level = 'info' if sampled() else ''
+            if level:
+                fields: Dict[str, Any] = {'status': status, 'phases': {name: round(ms, 2) for name, ms in phases.items()}}
+                if error:
+                    fields['error'] = error
+                log(level, 'request', route=trace.route, **fields)
+
+    return wrapper
+
+
+def metrics() -> Dict[str, Any]:
+    with _lock:
+        histograms = {name: histogram.snapshot() for name, histogram in sorted(_histograms.items())}
+    return {
+        'uptime_s': round(time.time() - _started_at, 1),
+        'cold_start_ms': round(_cold_ms, 2) if _cold_ms is not None else None,
+        'log_level': LOG_LEVEL_NAME,
+        'log_sample_rate': LOG_SAMPLE_RATE,
+        'histograms': histograms
+    }
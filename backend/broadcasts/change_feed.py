@@ -0,0 +1,77 @@
+'''
+Лента изменений статуса трансляций для long-poll и SSE
+Все ожидающие запросы инстанса делят одну проверку версии раз в poll_interval
+'''
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class ChangeFeed:
+    '''
+    Хранит последнюю известную версию (max(status_version) в broadcasts);
+    wait_for_change блокируется, пока версия не станет больше since или не выйдет таймаут
+    '''
+
+    def __init__(self, load_version: Callable[[], int], poll_interval: float = 2.0):
+        self._load_version = load_version
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._refreshing = False
+        self._waiters = 0
+        self._refreshes = 0
+
+    def _refresh_if_stale(self) -> int:
+        with self._cond:
+            while self._refreshing and self._version is None:
+                self._cond.wait()
+            fresh = time.monotonic() - self._checked_at < self.poll_interval
+            if self._version is not None and (fresh or self._refreshing):
+                return self._version
+            self._refreshing = True
+
+        try:
+            version = self._load_version()
+        except Exception:
+            with self._cond:
+                self._refreshing = False
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            self._version = version
+            self._checked_at = time.monotonic()
+            self._refreshing = False
+            self._refreshes += 1
+            self._cond.notify_all()
+        return version
+
+    def current(self) -> int:
+        return self._refresh_if_stale()
+
+    def wait_for_change(self, since: int, timeout: float) -> int:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._waiters += 1
+
+        try:
+            while True:
+                version = self._refresh_if_stale()
+                remaining = deadline - time.monotonic()
+                if version > since or remaining <= 0:
+                    return version
+                with self._cond:
+                    self._cond.wait(min(remaining, self.poll_interval))
+        finally:
+            with self._cond:
+                self._waiters -= 1
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        with self._cond:
+            return {
+                'version': self._version,
+                'waiters': self._waiters,
+                'refreshes': self._refreshes
+            }
@@ -0,0 +1,191 @@
+'''
+Circuit breaker для запросов к платформе: closed / open / half-open по доле ошибок в скользящем окне,
+адаптивный таймаут по p95 задержки успешных запросов и ограничение одновременных запросов
+'''
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Tuple, TypeVar
+
+import instrumentation
+
+T = TypeVar('T')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    '''Запрос не выполнялся: цепь разомкнута или исчерпан лимит одновременных запросов'''
+
+    def __init__(self, name: str, reason: str, retry_after: float = 0.0):
+        super().__init__(f'{name}: {reason}')
+        self.name = name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _percentile(values: Deque[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window: float = 60.0,
+        min_requests: int = 5,
+        failure_rate: float = 0.5,
+        open_seconds: float = 30.0,
+        max_concurrency: int = 8,
+        min_timeout: float = 1.5,
+        max_timeout: float = 10.0,
+        timeout_multiplier: float = 3.0,
+        latency_samples: int = 200
+    ):
+        self.name = name
+        self.window = window
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.max_concurrency = max_concurrency
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._in_flight = 0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._latencies: Deque[float] = deque(maxlen=latency_samples)
+        self._counters: Dict[str, int] = {
+            'calls': 0,
+            'failures': 0,
+            'rejected': 0,
+            'opened': 0
+        }
+
+    def _prune(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _open(self, now: float) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self._counters['opened'] += 1
+        instrumentation.log('warning', 'breaker.opened', platform=self.name)
+
+    def timeout(self) -> float:
+        '''p95 успешных запросов * multiplier в пределах [min_timeout, max_timeout]'''
+        with self._lock:
+            if len(self._latencies) < 10:
+                return self.max_timeout
+            p95 = _percentile(self._latencies, 0.95)
+        return max(self.min_timeout, min(self.max_timeout, p95 * self.timeout_multiplier))
+
+    def _admit(self) -> bool:
+        '''Пропускает вызов или поднимает CircuitOpen; True - вызов является пробным в half-open'''
+        now = time.monotonic()
+        with self._lock:
+            if self._state == OPEN:
+                elapsed = now - self._opened_at
+                if elapsed < self.open_seconds:
+                    self._counters['rejected'] += 1
+                    raise CircuitOpen(self.name, 'circuit open', self.open_seconds - elapsed)
+                self._state = HALF_OPEN
+
+            probe = self._state == HALF_OPEN
+            if probe and self._probe_in_flight:
+                self._counters['rejected'] += 1
+                raise CircuitOpen(self.name, 'half-open probe in flight', 1.0)
+            if self._in_flight >= self.max_concurrency:
+                self._counters['rejected'] += 1
+                raise CircuitOpen(self.name, 'too many concurrent requests', 1.0)
+
+            if probe:
+                self._probe_in_flight = True
+            self._in_flight += 1
+            self._counters['calls'] += 1
+            return probe
+
+    def _record(self, probe: bool, ok: bool, latency: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            if probe:
+                self._probe_in_flight = False
+
+            if ok:
+                self._latencies.append(latency)
+            else:
+                self._counters['failures'] += 1
+
+            if probe:
+                if ok:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    instrumentation.log('info', 'breaker.closed', platform=self.name)
+                else:
+                    self._open(now)
+                return
+
+            self._outcomes.append((now, ok))
+            self._prune(now)
+            if self._state == CLOSED and len(self._outcomes) >= self.min_requests:
+                failures = sum(1 for _, success in self._outcomes if not success)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._open(now)
+
+    def call(self, fn: Callable[[float], T]) -> T:
+        '''fn получает текущий адаптивный таймаут; исключение из fn считается отказом'''
+        probe = self._admit()
+        timeout = self.timeout()
+        started = time.monotonic()
+        try:
+            result = fn(timeout)
+        except Exception:
+            self._record(probe, False, time.monotonic() - started)
+            raise
+        self._record(probe, True, time.monotonic() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            result: Dict[str, Any] = dict(self._counters)
+            result['state'] = self._state
+            result['in_flight'] = self._in_flight
+            result['window_requests'] = len(self._outcomes)
+            result['window_failures'] = sum(1 for _, success in self._outcomes if not success)
+            latencies = list(self._latencies)
+
+        if latencies:
+            samples: Deque[float] = deque(latencies)
+            result['latency_p50'] = round(_percentile(samples, 0.5), 4)
+            result['latency_p95'] = round(_percentile(samples, 0.95), 4)
+        result['timeout'] = round(self.timeout(), 3)
+        return result
+
+
+def breaker_from_env(name: str) -> CircuitBreaker:
+    '''
+    BREAKER_WINDOW, BREAKER_MIN_REQUESTS, BREAKER_FAILURE_RATE, BREAKER_OPEN_SECONDS, BREAKER_MAX_CONCURRENCY,
+    UPSTREAM_MIN_TIMEOUT / UPSTREAM_READ_TIMEOUT - границы адаптивного таймаута
+    '''
+    return CircuitBreaker(
+        name,
+        window=float(os.environ.get('BREAKER_WINDOW', '60')),
+        min_requests=int(os.environ.get('BREAKER_MIN_REQUESTS', '5')),
+        failure_rate=float(os.environ.get('BREAKER_FAILURE_RATE', '0.5')),
+        open_seconds=float(os.environ.get('BREAKER_OPEN_SECONDS', '30')),
+        max_concurrency=int(os.environ.get('BREAKER_MAX_CONCURRENCY', '8')),
+        min_timeout=float(os.environ.get('UPSTREAM_MIN_TIMEOUT', '1.5')),
+        max_timeout=float(os.environ.get('UPSTREAM_READ_TIMEOUT', '10'))
+    )
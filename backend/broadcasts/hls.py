@@ -0,0 +1,170 @@
+'''
+Разбор и переписывание HLS-плейлистов (m3u8), подпись ссылок релея и короткий кэш плейлистов
+'''
+import hashlib
+import hmac
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+# Теги, в которых ссылка лежит в атрибуте URI="..."; True - ссылка на плейлист, False - на сегмент/ключ
+URI_TAGS = {
+    '#EXT-X-MEDIA:': True,
+    '#EXT-X-I-FRAME-STREAM-INF:': True,
+    '#EXT-X-KEY:': False,
+    '#EXT-X-SESSION-KEY:': False,
+    '#EXT-X-MAP:': False,
+    '#EXT-X-PRELOAD-HINT:': False,
+    '#EXT-X-PART:': False
+}
+URI_ATTRIBUTE = re.compile(r'URI="([^"]*)"')
+
+Variant = Dict[str, Any]
+
+
+def parse_attributes(value: str) -> Dict[str, str]:
+    '''Список атрибутов тега: KEY=VALUE через запятую, значения в кавычках могут содержать запятые'''
+    attributes: Dict[str, str] = {}
+    position = 0
+    while position < len(value):
+        equals = value.find('=', position)
+        if equals < 0:
+            break
+        name = value[position:equals].strip()
+        position = equals + 1
+        if value[position:position + 1] == '"':
+            end = value.find('"', position + 1)
+            end = len(value) if end < 0 else end
+            attributes[name] = value[position + 1:end]
+            position = value.find(',', end)
+        else:
+            end = value.find(',', position)
+            end = len(value) if end < 0 else end
+            attributes[name] = value[position:end].strip()
+            position = end
+        if position < 0:
+            break
+        position += 1
+    return attributes
+
+
+def is_master(text: str) -> bool:
+    return '#EXT-X-STREAM-INF' in text
+
+
+def is_endlist(text: str) -> bool:
+    return '#EXT-X-ENDLIST' in text
+
+
+def target_duration(text: str) -> Optional[float]:
+    for line in text.splitlines():
+        if line.startswith('#EXT-X-TARGETDURATION:'):
+            return _number(line.split(':', 1)[1].strip(), float)
+    return None
+
+
+def rewrite_playlist(text: str, base_url: str, rewrite: Callable[[str, bool], str]) -> str:
+    '''
+    Делает все ссылки плейлиста абсолютными относительно base_url и пропускает их через rewrite(url, is_playlist)
+    is_playlist - ссылка на вложенный плейлист (вариант master-плейлиста, альтернативная дорожка)
+    '''
+    master = is_master(text)
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            lines.append(line)
+        elif stripped.startswith('#'):
+            for tag, is_playlist in URI_TAGS.items():
+                if stripped.startswith(tag):
+                    stripped = URI_ATTRIBUTE.sub(lambda match: f'URI="{rewrite(urljoin(base_url, match.group(1)), is_playlist)}"', stripped)
+                    break
+            lines.append(stripped)
+        else:
+            lines.append(rewrite(urljoin(base_url, stripped), master))
+    return '\n'.join(lines) + '\n'
+
+
+def sign_url(url: str, secret: str) -> str:
+    return hmac.new(secret.encode('utf-8'), url.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+
+def verify_url(url: str, signature: str, secret: str) -> bool:
+    return hmac.compare_digest(sign_url(url, secret), signature or '')
+
+
+def _number(value: Optional[str], cast: Any) -> Any:
+    try:
+        return cast(value) if value else None
+    except ValueError:
+        return None
+
+
+def parse_master(text: str, base_url: str) -> List[Variant]:
+    '''
+    Варианты master-плейлиста от лучшего к худшему: по высоте кадра, затем по битрейту
+    URI вариантов разрешаются относительно base_url
+    '''
+    variants: List[Variant] = []
+    pending: Optional[Dict[str, str]] = None
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            pending = parse_attributes(line[len('#EXT-X-STREAM-INF:'):])
+            continue
+        if not line or line.startswith('#') or pending is None:
+            continue
+
+        width, _, height = (pending.get('RESOLUTION') or '').partition('x')
+        variants.append({
+            'url': urljoin(base_url, line),
+            'bandwidth': _number(pending.get('BANDWIDTH'), int),
+            'average_bandwidth': _number(pending.get('AVERAGE-BANDWIDTH'), int),
+            'width': _number(width, int),
+            'height': _number(height, int),
+            'frame_rate': _number(pending.get('FRAME-RATE'), float),
+            'codecs': pending.get('CODECS'),
+            'name': pending.get('NAME') or pending.get('VIDEO')
+        })
+        pending = None
+
+    variants.sort(key=lambda variant: (variant['height'] or 0, variant['bandwidth'] or 0), reverse=True)
+    return variants
+
+
+class PlaylistCache:
+    '''In-process LRU по URL плейлиста; у каждой записи свой срок жизни'''
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[Any, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {'hits': 0, 'misses': 0}
+
+    def get(self, url: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None or entry[1] <= time.monotonic():
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(url)
+            self._counters['hits'] += 1
+            return entry[0]
+
+    def set(self, url: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[url] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = dict(self._counters)
+            result['entries'] = len(self._entries)
+        result['max_entries'] = self.max_entries
+        return result
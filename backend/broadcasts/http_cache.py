@@ -0,0 +1,88 @@
+'''
+Условные GET для публичных списков: ETag и Last-Modified из дешёвого токена версии таблицы
+Модуль лежит копией в каждой функции, которая отдаёт кэшируемые списки
+'''
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+
+from runtime import get_header
+
+CACHE_CONTROL = os.environ.get('LISTING_CACHE_CONTROL', 'public, max-age=10, stale-while-revalidate=30')
+
+Version = Tuple[int, Optional[datetime]]
+
+
+def table_version(cur: Any, *tables: str) -> Version:
+    '''
+    (число строк, max(updated_at)) - меняется при любой вставке, правке или удалении
+    Для представления из нескольких таблиц - сумма строк и общий максимум одним запросом
+    '''
+    if len(tables) == 1:
+        cur.execute(f'SELECT COUNT(*), MAX(updated_at) FROM {tables[0]}')
+    else:
+        parts = ' UNION ALL '.join(f'SELECT COUNT(*) AS row_count, MAX(updated_at) AS updated_at FROM {table}' for table in tables)
+        cur.execute(f'SELECT SUM(row_count)::bigint, MAX(updated_at) FROM ({parts}) AS versions')
+    count, updated_at = cur.fetchone()
+    return count, updated_at
+
+
+def validators(version: Version, params: Optional[Dict[str, Any]] = None, collection: bool = True) -> Dict[str, str]:
+    '''
+    ETag и Cache-Control для представления; параметры запроса входят в ETag
+    Last-Modified - только для одной строки (collection=False): удаление из списка не двигает max(updated_at),
+    и If-Modified-Since по нему отдал бы устаревший 304; для списков валидатор - только ETag с числом строк
+    '''
+    count, updated_at = version
+    query = '&'.join(f'{key}={value}' for key, value in sorted((params or {}).items()))
+    stamp = updated_at.isoformat() if updated_at else ''
+    digest = hashlib.sha1(f'{count}|{stamp}|{query}'.encode('utf-8')).hexdigest()[:20]
+
+    headers = {
+        'ETag': f'W/"{digest}"',
+        'Cache-Control': CACHE_CONTROL
+    }
+    if updated_at and not collection:
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        headers['Last-Modified'] = format_datetime(updated_at.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def is_not_modified(event: Dict[str, Any], headers: Dict[str, str]) -> bool:
+    '''If-None-Match (слабое сравнение) имеет приоритет над If-Modified-Since'''
+    if_none_match = get_header(event, 'If-None-Match')
+    if if_none_match is not None:
+        etag = _strip_weak(headers['ETag'])
+        return any(tag.strip() == '*' or _strip_weak(tag) == etag for tag in if_none_match.split(','))
+
+    if_modified_since = get_header(event, 'If-Modified-Since')
+    if if_modified_since and 'Last-Modified' in headers:
+        try:
+            last_modified = parsedate_to_datetime(headers['Last-Modified'])
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+def not_modified_response(headers: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {
+            **headers,
+            'Access-Control-Allow-Origin': '*',
+            # тот же Vary, что у 200 из снимков, иначе кэш может отдать сжатое тело не тому клиенту
+            'Vary': 'Accept-Encoding'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
@@ -0,0 +1,115 @@
+'''
+Разбор расписания в формате iCalendar (RFC 5545) в операции create для bulk.write
+Событие: UID -> external_id, SUMMARY -> title, URL -> video_url, DTSTART -> scheduled_date/scheduled_time
+в часовом поясе трансляций; поддерживаются UTC (Z), TZID=... и "плавающее" локальное время
+DTSTART в другой форме отмечает своё событие ошибкой (invalid), остальные события импортируются
+'''
+import re
+from datetime import date, datetime, timezone, tzinfo
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+Property = Tuple[str, Dict[str, str], str]
+
+# strptime принимает и усечённое 20250101T1200, поэтому форма проверяется целиком
+DATE_VALUE = re.compile(r'\d{8}')
+DATE_TIME_VALUE = re.compile(r'\d{8}T\d{6}Z?')
+
+
+def _unfold(text: str) -> List[str]:
+    '''Строки, перенесённые по RFC 5545 (продолжение начинается с пробела или табуляции), склеиваются'''
+    lines: List[str] = []
+    for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        if line[:1] in (' ', '\t') and lines:
+            lines[-1] += line[1:]
+        elif line:
+            lines.append(line)
+    return lines
+
+
+def _parse_line(line: str) -> Property:
+    '''NAME;PARAM=VALUE:значение -> (NAME, {PARAM: VALUE}, значение); двоеточие в кавычках параметра не разделитель'''
+    quoted = False
+    for position, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ':' and not quoted:
+            head, value = line[:position], line[position + 1:]
+            break
+    else:
+        raise ValueError(f'Invalid iCalendar line: {line[:40]}')
+
+    name, *params = head.split(';')
+    parameters = {}
+    for param in params:
+        key, _, param_value = param.partition('=')
+        parameters[key.upper()] = param_value.strip('"')
+    return name.upper(), parameters, value
+
+
+def _unescape(value: str) -> str:
+    result = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            escaped = next(chars, '')
+            result.append('\n' if escaped in ('n', 'N') else escaped)
+        else:
+            result.append(char)
+    return ''.join(result)
+
+
+def _start(value: str, parameters: Dict[str, str], local_zone: tzinfo) -> Tuple[date, Optional[str]]:
+    '''(дата, время HH:MM:SS или None для событий на весь день) в часовом поясе трансляций; ValueError - не та форма'''
+    if parameters.get('VALUE') == 'DATE' or len(value) == 8:
+        if not DATE_VALUE.fullmatch(value):
+            raise ValueError('expected YYYYMMDD')
+        return datetime.strptime(value, '%Y%m%d').date(), None
+    if not DATE_TIME_VALUE.fullmatch(value):
+        raise ValueError('expected YYYYMMDDTHHMMSS, YYYYMMDDTHHMMSSZ or YYYYMMDD')
+
+    if value.endswith('Z'):
+        moment = datetime.strptime(value[:-1], '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc)
+    else:
+        moment = datetime.strptime(value, '%Y%m%dT%H%M%S')
+        zone_name = parameters.get('TZID')
+        try:
+            zone = ZoneInfo(zone_name) if zone_name else local_zone
+        except (ZoneInfoNotFoundError, ValueError):
+            zone = local_zone
+        moment = moment.replace(tzinfo=zone)
+
+    moment = moment.astimezone(local_zone)
+    return moment.date(), moment.time().isoformat()
+
+
+def parse_events(text: str, local_zone: tzinfo) -> List[Dict[str, Any]]:
+    '''VEVENT -> операция create; событие без DTSTART или SUMMARY попадает в результат с ошибкой от bulk'''
+    operations: List[Dict[str, Any]] = []
+    event: Optional[Dict[str, Any]] = None
+
+    for line in _unfold(text):
+        name, parameters, value = _parse_line(line)
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event = {'op': 'create'}
+        elif name == 'END' and value.upper() == 'VEVENT' and event is not None:
+            operations.append(event)
+            event = None
+        elif event is None:
+            continue
+        elif name == 'UID':
+            event['external_id'] = value
+        elif name == 'SUMMARY':
+            event['title'] = _unescape(value)
+        elif name == 'URL':
+            event['video_url'] = value
+        elif name == 'DTSTART':
+            try:
+                scheduled_date, scheduled_time = _start(value, parameters, local_zone)
+            except ValueError as e:
+                event['invalid'] = f'DTSTART {value!r}: {e}'
+                continue
+            event['scheduled_date'] = scheduled_date.isoformat()
+            event['scheduled_time'] = scheduled_time
+
+    return operations
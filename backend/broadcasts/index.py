@@ -1,316 +1,824 @@
+import time
+_import_started = time.perf_counter()
+
 import json
 import os
-import psycopg2
-import urllib.request
-import urllib.error
-from typing import Dict, Any, Optional
+import re
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import closing
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import quote
+from zoneinfo import ZoneInfo
+
+import bulk
+import db
+import instrumentation
+import runtime
+import snapshots
+import tokens
+from change_feed import ChangeFeed
+from circuit_breaker import CircuitOpen, breaker_from_env
+from hls import PlaylistCache, is_endlist, is_master, parse_master, rewrite_playlist, sign_url, target_duration, verify_url
+from http_cache import is_not_modified, not_modified_response, table_version, validators
+from ical import parse_events
+from live_poller import poll_live_status
+from page_scan import scan
+from pagination import cursor_date, cursor_int, cursor_time, decode_cursor, encode_cursor, parse_limit
+from singleflight import FlightTimeout, SingleFlight
+from stream_cache import MemoryBackend, cache_from_env
+from upstream import UpstreamClient, UpstreamError
+
+KICK_BASE_URL = os.environ.get('KICK_BASE_URL', 'https://kick.com')
+TWITCH_BASE_URL = os.environ.get('TWITCH_BASE_URL', 'https://www.twitch.tv')
+VK_BASE_URL = os.environ.get('VK_BASE_URL', 'https://vk.com')
+
+RESOLVE_TIMEOUT = float(os.environ.get('STREAM_RESOLVE_TIMEOUT', '12'))
+BATCH_RESOLVE_WORKERS = int(os.environ.get('BATCH_RESOLVE_WORKERS', '8'))
+BATCH_RESOLVE_DEADLINE = float(os.environ.get('BATCH_RESOLVE_DEADLINE', '8'))
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '50'))
+LIVE_POLL_BATCH_SIZE = int(os.environ.get('LIVE_POLL_BATCH_SIZE', '20'))
+LIVE_POLL_CONCURRENCY = int(os.environ.get('LIVE_POLL_CONCURRENCY', '4'))
+LIVE_POLL_CACHE_TTL = float(os.environ.get('LIVE_POLL_CACHE_TTL', '90'))
+LAST_GOOD_TTL = float(os.environ.get('STREAM_LAST_GOOD_TTL', '3600'))
+LAST_GOOD_MAX_ENTRIES = int(os.environ.get('STREAM_LAST_GOOD_MAX_ENTRIES', '1024'))
+HLS_MANIFEST_TTL = float(os.environ.get('HLS_MANIFEST_TTL', '10'))
+HLS_MANIFEST_TIMEOUT = float(os.environ.get('HLS_MANIFEST_TIMEOUT', '3'))
+HLS_MANIFEST_MAX_ENTRIES = int(os.environ.get('HLS_MANIFEST_MAX_ENTRIES', '256'))
+HLS_RELAY_SECRET = os.environ.get('HLS_RELAY_SECRET', '')
+HLS_RELAY_BASE_URL = os.environ.get('HLS_RELAY_BASE_URL', '')
+HLS_MASTER_TTL = float(os.environ.get('HLS_MASTER_TTL', '30'))
+HLS_MEDIA_DEFAULT_TTL = float(os.environ.get('HLS_MEDIA_DEFAULT_TTL', '2'))
+HLS_VOD_TTL = float(os.environ.get('HLS_VOD_TTL', '300'))
+BROADCASTS_TIMEZONE = ZoneInfo(os.environ.get('BROADCASTS_TIMEZONE', 'Europe/Moscow'))
+BROADCASTS_MAX_LIMIT = 100
+FEED_POLL_INTERVAL = float(os.environ.get('FEED_POLL_INTERVAL', '2'))
+FEED_MAX_WAIT = float(os.environ.get('FEED_MAX_WAIT', '20'))
+FEED_MAX_CHANGES = 100
+FEED_SSE_RETRY_MS = int(os.environ.get('FEED_SSE_RETRY_MS', '1000'))
+HOME_UPCOMING_LIMIT = int(os.environ.get('HOME_UPCOMING_LIMIT', '20'))
+HOME_NEWS_LIMIT = int(os.environ.get('HOME_NEWS_LIMIT', '12'))
+PUBLIC_READ_TIMEOUT_MS = int(os.environ.get('PUBLIC_READ_TIMEOUT_MS', '3000'))
+
+# Варианты картинки из конвейера news/images.py, если они построены для текущего image_url
+NEWS_SRCSET = "CASE WHEN image_variants->>'source' = md5(image_url) THEN image_variants->'srcset' END AS image_srcset"
+
+# Ключ сортировки расписания; совпадает с выражениями индекса idx_broadcasts_schedule
+SCHEDULE_DATE = "COALESCE(scheduled_date, DATE '0001-01-01')"
+SCHEDULE_TIME = "COALESCE(scheduled_time, TIME '00:00')"
+
+BROADCASTS_TABLE = bulk.Table('broadcasts', {
+    'title': bulk.Field(bulk.parse_text, 'text'),
+    'video_url': bulk.Field(bulk.parse_text, 'text', default=''),
+    'is_live': bulk.Field(bulk.parse_bool, 'boolean', default=False),
+    'scheduled_time': bulk.Field(bulk.parse_time, 'time'),
+    'scheduled_date': bulk.Field(bulk.parse_date, 'date')
+}, required=('title',))
+IMPORT_FORMATS = ('csv', 'ics')
 
+TWITCH_LIVE_PATTERNS = [b'isLiveBroadcast', b'"isLive":true']
+# В порядке приоритета, как их перебирал прежний разбор страницы целиком
+VK_URL_PATTERNS = [
+    re.compile(rb'"url(\d+)":"([^"]+\.m3u8[^"]*)"'),
+    re.compile(rb'"hls":"([^"]+\.m3u8[^"]*)"'),
+    re.compile(rb'"url(\d+)":"([^"]+\.mp4[^"]*)"'),
+    re.compile(rb'\\u0022url\d+\\u0022:\\u0022([^\\]+)'),
+    re.compile(rb'"player_urls":\[([^\]]+)\]')
+]
+
+_stream_cache = cache_from_env(db.connection)
+_upstream = UpstreamClient()
+_resolve_flights = SingleFlight(default_timeout=RESOLVE_TIMEOUT)
+# Последняя живая ссылка канала: отдаётся, пока платформа недоступна или цепь разомкнута
+_last_good = MemoryBackend(max_entries=LAST_GOOD_MAX_ENTRIES)
+_manifests = PlaylistCache(max_entries=HLS_MANIFEST_MAX_ENTRIES)
+_playlists = PlaylistCache(max_entries=HLS_MANIFEST_MAX_ENTRIES)
+_change_feed = ChangeFeed(lambda: load_status_version(), poll_interval=FEED_POLL_INTERVAL)
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_RESOLVE_WORKERS, thread_name_prefix='resolve')
+
+router = runtime.Router('GET, POST, PUT, DELETE')
+router.recover(db.overload_response)
+
+
+@instrumentation.instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Управление трансляциями и получение прямых ссылок на стримы
-    Args: event - httpMethod GET/POST/PUT/DELETE, queryParams для get-stream
+    Args: event - httpMethod GET/POST/PUT/DELETE, queryParams для get-stream (channel, platform, variants, relay),
+          релея hls (u, sig) и фильтров списка (from, to, live, upcoming, limit, cursor);
+          action=home - эфир, ближайшие трансляции и новости главной одним ответом;
+          событие таймер-триггера запускает опрос статусов
+          POST/PUT/DELETE (кроме get-streams) требуют токен из auth в X-Auth-Token
     Returns: HTTP response с данными или результатом
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
+    if 'httpMethod' not in event and event.get('messages'):
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
+            'body': json.dumps(run_live_poll()),
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
+    return router.dispatch(event)
+
+
+@router.route('GET', 'stats')
+def get_stats(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    return runtime.json_response({
+        'stream_cache': _stream_cache.stats(),
+        'resolve_flights': _resolve_flights.stats(),
+        'db_pool': db.stats(),
+        'snapshots': snapshots.stats(),
+        'change_feed': _change_feed.stats(),
+        'upstream': _upstream.stats(),
+        'manifests': _manifests.stats(),
+        'relay_playlists': _playlists.stats(),
+        'breakers': {platform: breaker.stats() for platform, breaker in _breakers.items()}
+    })
+
+
+@router.route('GET', 'metrics')
+def get_metrics(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    return runtime.json_response(instrumentation.metrics())
+
+
+@router.route('GET', 'get-stream')
+def get_stream(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    channel = params.get('channel', '')
+    platform = params.get('platform', 'kick').lower()
     
-    if method == 'GET':
-        params = event.get('queryStringParameters') or {}
-        action = params.get('action')
-        
-        if action == 'get-stream':
-            channel = params.get('channel', '')
-            platform = params.get('platform', 'kick').lower()
-            
-            if not channel:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Channel parameter required'}),
-                    'isBase64Encoded': False
-                }
-            
-            stream_url: Optional[str] = None
-            
-            if platform == 'kick':
-                stream_url = get_kick_stream(channel)
-            elif platform == 'twitch':
-                stream_url = get_twitch_stream(channel)
-            elif platform == 'vk':
-                stream_url = get_vk_stream(channel)
-            else:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Unsupported platform'}),
-                    'isBase64Encoded': False
-                }
-            
-            if not stream_url:
-                return {
-                    'statusCode': 404,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Stream not found or offline'}),
-                    'isBase64Encoded': False
-                }
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'stream_url': stream_url,
-                    'channel': channel,
-                    'platform': platform
-                }),
-                'isBase64Encoded': False
-            }
-        
-        cur.execute('''
-            SELECT id, title, video_url, is_live, scheduled_time, scheduled_date 
-            FROM broadcasts 
-            ORDER BY scheduled_date DESC, scheduled_time DESC
-        ''')
-        rows = cur.fetchall()
-        broadcasts = []
-        for row in rows:
-            broadcasts.append({
-                'id': row[0],
-                'title': row[1],
-                'video_url': row[2],
-                'is_live': row[3],
-                'scheduled_time': str(row[4]) if row[4] else None,
-                'scheduled_date': str(row[5]) if row[5] else None
-            })
+    if not channel:
+        return runtime.error(400, 'Channel parameter required')
+    
+    if platform not in RESOLVERS:
+        return runtime.error(400, 'Unsupported platform')
+    
+    try:
+        stream_url: Optional[str] = resolve_stream(platform, channel)
+    except CircuitOpen as e:
+        return runtime.error(503, f'{platform} is temporarily unavailable', {'Retry-After': str(max(1, int(e.retry_after + 0.5)))})
+    except FlightTimeout:
+        return runtime.error(504, 'Stream resolution timed out')
+    except Exception as e:
+        instrumentation.log('warning', 'resolve.failed', platform=platform, channel=channel, error=str(e))
+        return runtime.error(502, 'Stream resolution failed')
+    
+    if not stream_url:
+        return runtime.error(404, 'Stream not found or offline')
+    
+    result = {
+        'stream_url': stream_url,
+        'channel': channel,
+        'platform': platform
+    }
+    if params.get('variants') in ('1', 'true'):
+        result['variants'] = get_variants(stream_url)
+    # относительная ссылка релея годится только внутри плейлиста, браузер разрешил бы её от адреса сайта
+    if params.get('relay') in ('1', 'true') and HLS_RELAY_SECRET and HLS_RELAY_BASE_URL and '.m3u8' in stream_url:
+        result['relay_url'] = relay_url(stream_url)
+    
+    return runtime.json_response(result)
+
+
+@router.route('GET')
+def list_broadcasts(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        date_from = date.fromisoformat(params['from']) if params.get('from') else None
+        date_to = date.fromisoformat(params['to']) if params.get('to') else None
+        limit = parse_limit(params.get('limit'), BROADCASTS_MAX_LIMIT)
+        cursor = decode_cursor(params.get('cursor'), (cursor_date, cursor_time, cursor_int))
+    except ValueError as e:
+        return runtime.error(400, str(e))
+    
+    upcoming = params.get('upcoming') == 'true'
+    etag_params = dict(params)
+    conditions: List[str] = []
+    query_args: List[Any] = []
+    
+    if params.get('live') == 'true':
+        conditions.append('is_live')
+    if upcoming:
+        now = datetime.now(BROADCASTS_TIMEZONE)
+        conditions.append(f'({SCHEDULE_DATE}, {SCHEDULE_TIME}) >= (%s, %s)')
+        query_args.extend([now.date(), now.time().replace(microsecond=0)])
+        # выборка "от текущего момента" меняется со временем, поэтому минута входит в ETag
+        etag_params['now'] = now.strftime('%Y-%m-%dT%H:%M')
+    if date_from:
+        conditions.append(f'{SCHEDULE_DATE} >= %s')
+        query_args.append(date_from)
+    if date_to:
+        conditions.append(f'{SCHEDULE_DATE} <= %s')
+        query_args.append(date_to)
+    if cursor:
+        conditions.append(f'({SCHEDULE_DATE}, {SCHEDULE_TIME}, id) {">" if upcoming else "<"} (%s::date, %s::time, %s)')
+        query_args.extend(cursor)
+    
+    direction = 'ASC' if upcoming else 'DESC'
+    query = 'SELECT id, title, video_url, is_live, scheduled_time, scheduled_date, stream_url FROM broadcasts'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += f' ORDER BY {SCHEDULE_DATE} {direction}, {SCHEDULE_TIME} {direction}, id {direction}'
+    if limit:
+        query += ' LIMIT %s'
+        query_args.append(limit + 1)
+    
+    with db.connection(replica=db.public_read(event), statement_timeout=PUBLIC_READ_TIMEOUT_MS) as conn:
+        cur = conn.cursor()
+        cache_headers = validators(table_version(cur, 'broadcasts'), etag_params)
+        if is_not_modified(event, cache_headers):
+            cur.close()
+            return not_modified_response(cache_headers)
         
+        snapshot = snapshots.get(cache_headers['ETag'])
+        if snapshot is None:
+            cur.execute(query, query_args)
+            rows = cur.fetchall()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'broadcasts': broadcasts}),
-            'isBase64Encoded': False
-        }
     
-    if method == 'POST':
-        body_data = json.loads(event.get('body', '{}'))
-        title = body_data.get('title')
-        video_url = body_data.get('video_url')
-        is_live = body_data.get('is_live', False)
-        scheduled_time = body_data.get('scheduled_time')
-        scheduled_date = body_data.get('scheduled_date')
+    response_headers = {**runtime.JSON_HEADERS, **cache_headers}
+    if snapshot is not None:
+        return snapshots.respond(snapshot, event, response_headers)
+    
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([str(last[5] or date.min), str(last[4] or '00:00:00'), last[0]])
+    
+    broadcasts = []
+    for row in rows:
+        broadcasts.append({
+            'id': row[0],
+            'title': row[1],
+            'video_url': row[2],
+            'is_live': row[3],
+            'scheduled_time': str(row[4]) if row[4] else None,
+            'scheduled_date': str(row[5]) if row[5] else None,
+            'stream_url': row[6]
+        })
+    
+    snapshot = snapshots.put(cache_headers['ETag'], {'broadcasts': broadcasts, 'next_cursor': next_cursor})
+    return snapshots.respond(snapshot, event, response_headers)
+
+
+@router.route('GET', 'home')
+def get_home(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Главная страница одним ответом: трансляции в эфире, ближайшие трансляции и последние новости
+    Версия обеих таблиц - один запрос, все три выборки - второй, собранный в JSON самой базой;
+    при совпадении ETag со снимком инстанса второй запрос не выполняется
+    '''
+    now = datetime.now(BROADCASTS_TIMEZONE)
+    # как в списке upcoming=true: выборка "от текущего момента" меняется со временем
+    etag_params = {'action': 'home', 'now': now.strftime('%Y-%m-%dT%H:%M')}
+    broadcast_columns = '''
+        id, title, video_url, is_live, scheduled_time::text AS scheduled_time,
+        scheduled_date::text AS scheduled_date, stream_url
+    '''
+    
+    with db.connection(replica=db.public_read(event), statement_timeout=PUBLIC_READ_TIMEOUT_MS) as conn:
+        cur = conn.cursor()
+        cache_headers = validators(table_version(cur, 'broadcasts', 'news'), etag_params)
+        if is_not_modified(event, cache_headers):
+            cur.close()
+            return not_modified_response(cache_headers)
         
+        snapshot = snapshots.get(cache_headers['ETag'])
+        if snapshot is None:
+            cur.execute(f'''
+                SELECT json_build_object(
+                    'live', COALESCE((
+                        SELECT json_agg(b) FROM (
+                            SELECT {broadcast_columns} FROM broadcasts
+                            WHERE is_live
+                            ORDER BY {SCHEDULE_DATE} DESC, {SCHEDULE_TIME} DESC, id DESC
+                        ) AS b
+                    ), '[]'::json),
+                    'upcoming', COALESCE((
+                        SELECT json_agg(b) FROM (
+                            SELECT {broadcast_columns} FROM broadcasts
+                            WHERE NOT is_live AND ({SCHEDULE_DATE}, {SCHEDULE_TIME}) >= (%s, %s)
+                            ORDER BY {SCHEDULE_DATE}, {SCHEDULE_TIME}, id
+                            LIMIT %s
+                        ) AS b
+                    ), '[]'::json),
+                    'news', COALESCE((
+                        SELECT json_agg(n) FROM (
+                            SELECT id, title, excerpt, image_url, {NEWS_SRCSET}, published_date::text AS published_date FROM news
+                            ORDER BY published_date DESC, id DESC
+                            LIMIT %s
+                        ) AS n
+                    ), '[]'::json)
+                )::text
+            ''', (now.date(), now.time().replace(microsecond=0), HOME_UPCOMING_LIMIT, HOME_NEWS_LIMIT))
+            body = cur.fetchone()[0]
+        cur.close()
+    
+    response_headers = {**runtime.JSON_HEADERS, **cache_headers}
+    if snapshot is None:
+        snapshot = snapshots.put_json(cache_headers['ETag'], body)
+    return snapshots.respond(snapshot, event, response_headers)
+
+
+@router.route('POST', 'poll-live')
+@tokens.admin_required
+def poll_live(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    return runtime.json_response(run_live_poll())
+
+
+@router.route('POST', 'get-streams')
+def get_streams(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    body_data = json.loads(event.get('body') or '{}')
+    entries = body_data.get('streams') if isinstance(body_data, dict) else body_data
+    
+    if not isinstance(entries, list) or len(entries) > BATCH_MAX_ITEMS:
+        return runtime.error(400, f'Expected a list of up to {BATCH_MAX_ITEMS} streams')
+    
+    return runtime.json_response({'streams': resolve_streams(entries, BATCH_RESOLVE_DEADLINE)})
+
+
+@router.route('POST')
+@tokens.admin_required
+def create_broadcast(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    body_data = json.loads(event.get('body') or '{}')
+    title = body_data.get('title')
+    video_url = body_data.get('video_url')
+    is_live = body_data.get('is_live', False)
+    scheduled_time = body_data.get('scheduled_time')
+    scheduled_date = body_data.get('scheduled_date')
+    
+    with db.connection() as conn:
+        cur = conn.cursor()
         cur.execute('''
             INSERT INTO broadcasts (title, video_url, is_live, scheduled_time, scheduled_date)
             VALUES (%s, %s, %s, %s, %s)
             RETURNING id
         ''', (title, video_url, is_live, scheduled_time, scheduled_date))
-        
+    
         new_id = cur.fetchone()[0]
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'success': True, 'id': new_id}),
-            'isBase64Encoded': False
-        }
+    snapshots.invalidate()
     
-    if method == 'PUT':
-        body_data = json.loads(event.get('body', '{}'))
-        broadcast_id = body_data.get('id')
-        title = body_data.get('title')
-        video_url = body_data.get('video_url')
-        is_live = body_data.get('is_live', False)
-        scheduled_time = body_data.get('scheduled_time')
-        scheduled_date = body_data.get('scheduled_date')
-        
+    return runtime.json_response({'success': True, 'id': new_id}, 201)
+
+
+@router.route('PUT')
+@tokens.admin_required
+def update_broadcast(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    body_data = json.loads(event.get('body', '{}'))
+    broadcast_id = body_data.get('id')
+    title = body_data.get('title')
+    video_url = body_data.get('video_url')
+    is_live = body_data.get('is_live', False)
+    scheduled_time = body_data.get('scheduled_time')
+    scheduled_date = body_data.get('scheduled_date')
+    
+    with db.connection() as conn:
+        cur = conn.cursor()
         cur.execute('''
             UPDATE broadcasts 
             SET title = %s, video_url = %s, is_live = %s, 
                 scheduled_time = %s, scheduled_date = %s, updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
         ''', (title, video_url, is_live, scheduled_time, scheduled_date, broadcast_id))
-        
+    
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'success': True}),
-            'isBase64Encoded': False
-        }
+    snapshots.invalidate()
     
-    if method == 'DELETE':
-        body_data = json.loads(event.get('body', '{}'))
-        broadcast_id = body_data.get('id')
-        
+    return runtime.json_response({'success': True})
+
+
+@router.route('DELETE')
+@tokens.admin_required
+def delete_broadcast(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    body_data = json.loads(event.get('body', '{}'))
+    broadcast_id = body_data.get('id')
+    
+    with db.connection() as conn:
+        cur = conn.cursor()
         cur.execute('DELETE FROM broadcasts WHERE id = %s', (broadcast_id,))
         conn.commit()
         cur.close()
-        conn.close()
+    snapshots.invalidate()
+    
+    return runtime.json_response({'success': True})
+
+
+@router.route('POST', 'bulk')
+@tokens.admin_required
+def bulk_write(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    body_data = json.loads(event.get('body') or '{}')
+    operations = body_data.get('operations') if isinstance(body_data, dict) else body_data
+    return bulk.write(BROADCASTS_TABLE, operations, snapshots.invalidate)
+
+
+@router.route('POST', 'import')
+@tokens.admin_required
+def import_broadcasts(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    import_format = params.get('format', 'csv')
+    if import_format not in IMPORT_FORMATS:
+        return runtime.error(400, f'format must be one of {", ".join(IMPORT_FORMATS)}')
+    
+    try:
+        text = bulk.request_text(event)
+        operations = bulk.parse_csv(text) if import_format == 'csv' else parse_events(text, BROADCASTS_TIMEZONE)
+    except ValueError as e:
+        return runtime.error(400, f'Invalid {import_format} file: {e}')
+    
+    return bulk.write(BROADCASTS_TABLE, operations, snapshots.invalidate)
+
+
+def load_status_version() -> int:
+    '''Версия и строки ленты читаются с мастера: версия с него и строки с отстающей реплики потеряли бы изменения'''
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT COALESCE(MAX(status_version), 0) FROM broadcasts')
+        version = cur.fetchone()[0]
+        cur.close()
+    return version
+
+
+@router.route('GET', 'changes')
+def get_changes(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Long-poll ленты изменений stream_url/is_live: since (или Last-Event-ID от EventSource) - последняя версия клиента,
+    platform+channel или ids сужают выборку; без since отдаётся текущая версия и текущее состояние выборки
+    При Accept: text/event-stream ответ оформляется как SSE, EventSource сам переподключается с новой версией
+    '''
+    try:
+        since_value = runtime.get_header(event, 'Last-Event-ID') or params.get('since')
+        since = int(since_value) if since_value else None
+        wait_for = max(0.0, min(float(params.get('wait') or FEED_MAX_WAIT), FEED_MAX_WAIT))
+        ids = [int(value) for value in params['ids'].split(',')] if params.get('ids') else None
+    except ValueError:
+        return runtime.error(400, 'since, wait and ids must be numeric')
+    
+    conditions: List[str] = []
+    query_args: List[Any] = []
+    if params.get('platform') and params.get('channel'):
+        conditions.append('platform = %s AND lower(channel) = lower(%s)')
+        query_args.extend([params['platform'].lower(), params['channel']])
+    if ids:
+        conditions.append('id = ANY(%s)')
+        query_args.append(ids)
+    
+    if since is None:
+        version = _change_feed.current()
+        load_rows = bool(conditions)
+    else:
+        version = _change_feed.wait_for_change(since, wait_for)
+        load_rows = version > since
+        conditions.append('status_version > %s')
+        query_args.append(since)
+    
+    changes = []
+    if load_rows:
+        with db.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f'''
+                SELECT id, platform, channel, is_live, stream_url, status_version
+                FROM broadcasts
+                WHERE {' AND '.join(conditions)}
+                ORDER BY status_version
+                LIMIT %s
+            ''', query_args + [FEED_MAX_CHANGES])
+            rows = cur.fetchall()
+            cur.close()
         
+        for row in rows:
+            changes.append({
+                'id': row[0],
+                'platform': row[1],
+                'channel': row[2],
+                'is_live': row[3],
+                'stream_url': row[4],
+                'status_version': row[5]
+            })
+        if len(rows) == FEED_MAX_CHANGES:
+            version = rows[-1][5]
+        elif rows:
+            version = max(version, rows[-1][5])
+    
+    payload = json.dumps({'version': version, 'changes': changes})
+    
+    if 'text/event-stream' in (runtime.get_header(event, 'Accept') or ''):
+        body = f'retry: {FEED_SSE_RETRY_MS}\nid: {version}\n'
+        body += f'event: changes\ndata: {payload}\n\n' if changes else ': no changes\n\n'
         return {
             'statusCode': 200,
             'headers': {
-                'Content-Type': 'application/json',
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({'success': True}),
+            'body': body,
             'isBase64Encoded': False
         }
     
-    cur.close()
-    conn.close()
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Cache-Control': 'no-store',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': payload,
+        'isBase64Encoded': False
+    }
+
+
+def resolve_stream(platform: str, channel: str) -> Optional[str]:
+    '''
+    Ссылка на стрим через кэш; при промахе одновременные запросы
+    одного (platform, channel) разделяют единственный запрос к платформе
+    '''
+    found, stream_url = _stream_cache.lookup(platform, channel)
+    if found:
+        return stream_url
+    
+    return refresh_stream(platform, channel)
+
+
+def refresh_stream(platform: str, channel: str, ttl: Optional[float] = None) -> Optional[str]:
+    '''
+    Разрешает ссылку в обход кэша и кладёт результат в кэш на ttl секунд
+    Запрос к платформе идёт через её circuit breaker с адаптивным таймаутом; при отказе платформы
+    или разомкнутой цепи отдаётся последняя известная живая ссылка, если она есть
+    '''
+    key = _stream_cache.make_key(platform, channel)
+    
+    def resolve() -> Optional[str]:
+        try:
+            resolved = _breakers[platform].call(lambda timeout: RESOLVERS[platform](channel, timeout))
+        except Exception as e:
+            last_good = _last_good.get(key)
+            if last_good is None:
+                raise
+            instrumentation.log('warning', 'resolve.serving_last_good', platform=platform, channel=channel, error=str(e))
+            return last_good[0]
+        
+        _stream_cache.store(platform, channel, resolved, ttl)
+        if resolved:
+            _last_good.set(key, resolved, time.time() + LAST_GOOD_TTL)
+        else:
+            _last_good.delete(key)
+        return resolved
+    
+    return _resolve_flights.do(key, resolve)
+
+
+def get_variants(stream_url: str) -> Optional[List[Dict[str, Any]]]:
+    '''
+    Варианты master-плейлиста от лучшего к худшему; разобранный манифест живёт в кэше HLS_MANIFEST_TTL секунд
+    [] - ссылка не на master-плейлист, None - манифест получить не удалось (ссылка на стрим при этом остаётся рабочей)
+    '''
+    if '.m3u8' not in stream_url:
+        return []
+    
+    variants = _manifests.get(stream_url)
+    if variants is not None:
+        return variants
+    
+    def fetch() -> List[Dict[str, Any]]:
+        text = _upstream.get(stream_url, timeout=HLS_MANIFEST_TIMEOUT).text(errors='ignore')
+        parsed = parse_master(text, stream_url) if is_master(text) else []
+        _manifests.set(stream_url, parsed, HLS_MANIFEST_TTL)
+        return parsed
+    
+    try:
+        return _resolve_flights.do(f'manifest:{stream_url}', fetch, timeout=HLS_MANIFEST_TIMEOUT * 2)
+    except Exception as e:
+        instrumentation.log('warning', 'hls.manifest_failed', url=stream_url, error=str(e))
+        return None
+
+
+def relay_url(url: str) -> str:
+    '''Подписанная ссылка на плейлист через релей; без HLS_RELAY_BASE_URL - относительно текущего плейлиста'''
+    return f'{HLS_RELAY_BASE_URL}?action=hls&u={quote(url, safe="")}&sig={sign_url(url, HLS_RELAY_SECRET)}'
+
+
+def fetch_relay_playlist(url: str) -> Tuple[str, float]:
+    '''
+    Загружает плейлист и переписывает ссылки: вложенные плейлисты - через релей, сегменты и ключи - абсолютными
+    ссылками на исходный CDN; возвращает (тело, момент истечения) и кладёт их в кэш
+    master-плейлист живёт HLS_MASTER_TTL, живой media-плейлист - EXT-X-TARGETDURATION, VOD - HLS_VOD_TTL
+    '''
+    text = _upstream.get(url, timeout=HLS_MANIFEST_TIMEOUT).text(errors='ignore')
+    if not text.lstrip().startswith('#EXTM3U'):
+        raise ValueError(f'Not an HLS playlist: {url}')
+    
+    if is_master(text):
+        ttl = HLS_MASTER_TTL
+    elif is_endlist(text):
+        ttl = HLS_VOD_TTL
+    else:
+        ttl = target_duration(text) or HLS_MEDIA_DEFAULT_TTL
+    
+    body = rewrite_playlist(text, url, lambda uri, is_playlist: relay_url(uri) if is_playlist else uri)
+    entry = (body, time.monotonic() + ttl)
+    _playlists.set(url, entry, ttl)
+    return entry
+
+
+@router.route('GET', 'hls')
+def get_relay_playlist(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Отдаёт плейлист платформы из кэша релея; все зрители инстанса делят один запрос к платформе за интервал
+    Ссылки подписаны HMAC (HLS_RELAY_SECRET), поэтому релей не проксирует произвольные адреса
+    '''
+    url = params.get('u') or ''
+    
+    if not HLS_RELAY_SECRET:
+        return runtime.error(404, 'HLS relay is disabled')
     
+    if not url.startswith(('https://', 'http://')) or not verify_url(url, params.get('sig') or '', HLS_RELAY_SECRET):
+        return runtime.error(403, 'Invalid playlist signature')
+    
+    entry = _playlists.get(url)
+    if entry is None:
+        try:
+            entry = _resolve_flights.do(f'playlist:{url}', lambda: fetch_relay_playlist(url), timeout=HLS_MANIFEST_TIMEOUT * 2)
+        except FlightTimeout:
+            return runtime.error(504, 'Playlist fetch timed out')
+        except Exception as e:
+            instrumentation.log('warning', 'hls.relay_failed', url=url, error=str(e))
+            return runtime.error(502, 'Playlist fetch failed')
+    
+    body, expires_at = entry
+    max_age = max(0, int(expires_at - time.monotonic()))
     return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'}),
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/vnd.apple.mpegurl',
+            'Cache-Control': f'public, max-age={max_age}',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': body,
         'isBase64Encoded': False
     }
 
 
-def get_kick_stream(channel: str) -> Optional[str]:
-    '''Получает HLS ссылку на стрим Kick через API v2'''
+def run_live_poll() -> Dict[str, Any]:
+    '''
+    Опрос всех трансляций для таймер-триггера; результаты также прогревают кэш ссылок,
+    поэтому get-stream между запусками отвечает без запросов к платформам
+    '''
+    stats = poll_live_status(
+        lambda platform, channel: refresh_stream(platform, channel, LIVE_POLL_CACHE_TTL),
+        batch_size=LIVE_POLL_BATCH_SIZE,
+        concurrency=LIVE_POLL_CONCURRENCY
+    )
+    instrumentation.log('info', 'live_poll', **stats)
+    if stats['updated']:
+        snapshots.invalidate()
+    return stats
+
+
+def resolve_streams(entries: List[Any], deadline: float) -> List[Dict[str, Any]]:
+    '''
+    Параллельно разрешает список {platform, channel} в ограниченном пуле потоков
+    Не уложившиеся в общий deadline получают статус timeout, остальные - live/offline/error/unavailable/invalid
+    '''
+    results: List[Dict[str, Any]] = []
+    futures = {}
+    
+    for index, entry in enumerate(entries):
+        entry = entry if isinstance(entry, dict) else {}
+        platform = str(entry.get('platform') or 'kick').lower()
+        channel = str(entry.get('channel') or '')
+        results.append({'platform': platform, 'channel': channel})
+        
+        if not channel or platform not in RESOLVERS:
+            results[index]['status'] = 'invalid'
+            continue
+        
+        futures[_batch_executor.submit(instrumentation.bind(resolve_stream), platform, channel)] = index
+    
+    done, _ = wait(futures, timeout=deadline)
+    
+    for future, index in futures.items():
+        result = results[index]
+        if future not in done:
+            result['status'] = 'timeout'
+            continue
+        
+        error = future.exception()
+        if isinstance(error, FlightTimeout):
+            result['status'] = 'timeout'
+        elif isinstance(error, CircuitOpen):
+            result['status'] = 'unavailable'
+        elif error is not None:
+            instrumentation.log('warning', 'resolve.failed', platform=result['platform'], channel=result['channel'], error=str(error))
+            result['status'] = 'error'
+        else:
+            stream_url = future.result()
+            result['status'] = 'live' if stream_url else 'offline'
+            result['stream_url'] = stream_url
+    
+    return results
+
+
+def get_kick_stream(channel: str, timeout: Optional[float] = None) -> Optional[str]:
+    '''Получает HLS ссылку на стрим Kick через API v2; None - канал офлайн, ошибки платформы пробрасываются'''
+    url = f'{KICK_BASE_URL}/api/v2/channels/{channel}/livestream'
     try:
-        url = f'https://kick.com/api/v2/channels/{channel}/livestream'
-        req = urllib.request.Request(url, headers={
+        response = _upstream.get(url, headers={
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': 'application/json',
             'Referer': f'https://kick.com/{channel}'
-        })
-        
-        with urllib.request.urlopen(req, timeout=10) as response:
-            result = json.loads(response.read().decode())
-            
-            data = result.get('data')
-            
-            print(f'[Kick] Livestream data for {channel}: {data}')
-            
-            if not data:
-                print(f'[Kick] Channel offline: {channel}')
-                return None
-            
-            playback_url = data.get('playback_url')
-            
-            print(f'[Kick] playback_url: {playback_url}')
-            
-            if playback_url:
-                return playback_url
-            
-            print(f'[Kick] No playback URL')
+        }, timeout=timeout)
+    except UpstreamError as e:
+        if e.status == 404:
+            instrumentation.log('debug', 'kick.not_found', channel=channel)
             return None
-        
-    except Exception as e:
-        print(f'[Kick] Error for {channel}: {str(e)}')
+        raise
+    result = response.json()
+    
+    data = result.get('data')
+    
+    if not data:
+        instrumentation.log('debug', 'kick.offline', channel=channel)
         return None
+    
+    playback_url = data.get('playback_url')
+    
+    if playback_url:
+        return playback_url
+    
+    instrumentation.log('debug', 'kick.no_playback_url', channel=channel)
+    return None
 
 
-def get_twitch_stream(channel: str) -> Optional[str]:
-    '''Получает информацию о стриме Twitch (возвращает embed URL)'''
+def get_twitch_stream(channel: str, timeout: Optional[float] = None) -> Optional[str]:
+    '''Получает информацию о стриме Twitch (возвращает embed URL); страница читается до первого признака эфира'''
+    url = f'{TWITCH_BASE_URL}/{channel}'
     try:
-        url = f'https://www.twitch.tv/{channel}'
-        req = urllib.request.Request(url, headers={
+        with closing(_upstream.iter_body(url, headers={
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        
-        with urllib.request.urlopen(req, timeout=10) as response:
-            html = response.read().decode()
-            
-            if 'isLiveBroadcast' in html or '"isLive":true' in html:
-                return f'https://player.twitch.tv/?channel={channel}&parent=localhost&muted=false'
-        
-        return None
-    except Exception:
-        return None
+        }, timeout=timeout)) as chunks:
+            found = scan(chunks, TWITCH_LIVE_PATTERNS, stop_index=len(TWITCH_LIVE_PATTERNS) - 1)
+    except UpstreamError as e:
+        if e.status == 404:
+            return None
+        raise
+    
+    if found:
+        return f'https://player.twitch.tv/?channel={channel}&parent=localhost&muted=false'
+    
+    return None
 
 
-def get_vk_stream(video_id: str) -> Optional[str]:
-    '''Получает HLS ссылку через video_ext.php endpoint VK'''
-    import re
-    
+def _vk_quality(index: int, match: Any) -> int:
+    '''urlNNN - высота кадра варианта; из нескольких ссылок одного вида берётся наибольшая'''
+    return int(match.group(1)) if index in (0, 2) else 0
+
+
+def _vk_stream_url(index: int, match: Any) -> Optional[str]:
+    clean_url = match.group(match.lastindex).decode('utf-8', errors='ignore')
+    clean_url = clean_url.replace('\\/', '/').replace('\\u0026', '&').replace('\\"', '')
+    if '.m3u8' in clean_url or '.mp4' in clean_url:
+        return clean_url
+    return None
+
+
+def get_vk_stream(video_id: str, timeout: Optional[float] = None) -> Optional[str]:
+    '''Получает HLS ссылку через video_ext.php endpoint VK; лучшая ссылка выбирается по всей странице (до PAGE_SCAN_MAX_BYTES)'''
     try:
         oid, vid = video_id.split('_')
-        
-        url = f'https://vk.com/video_ext.php?oid={oid}&id={vid}'
-        req = urllib.request.Request(url, headers={
+    except ValueError:
+        instrumentation.log('debug', 'vk.invalid_video_id', video_id=video_id)
+        return None
+    
+    url = f'{VK_BASE_URL}/video_ext.php?oid={oid}&id={vid}'
+    try:
+        with closing(_upstream.iter_body(url, headers={
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml',
             'Accept-Language': 'ru-RU,ru;q=0.9',
             'Referer': 'https://vk.com/'
-        })
-        
-        with urllib.request.urlopen(req, timeout=10) as response:
-            html = response.read().decode('utf-8', errors='ignore')
-            
-            patterns = [
-                r'"url(\d+)":"([^"]+\.m3u8[^"]*)"',
-                r'"hls":"([^"]+\.m3u8[^"]*)"',
-                r'"url(\d+)":"([^"]+\.mp4[^"]*)"',
-                r'\\u0022url\d+\\u0022:\\u0022([^\\]+)',
-                r'"player_urls":\[([^\]]+)\]'
-            ]
-            
-            found_urls = []
-            
-            for pattern in patterns:
-                matches = re.findall(pattern, html)
-                for match in matches:
-                    url_match = match if isinstance(match, str) else (match[1] if len(match) > 1 else match[0])
-                    if url_match:
-                        clean_url = url_match.replace('\\/', '/').replace('\\u0026', '&').replace('\\"', '')
-                        if '.m3u8' in clean_url or '.mp4' in clean_url:
-                            found_urls.append(clean_url)
-            
-            if found_urls:
-                best_url = found_urls[0]
-                print(f'[VK] Found stream URL: {best_url}')
-                return best_url
-            
-            print(f'[VK] No stream URL found for {video_id}')
+        }, timeout=timeout)) as chunks:
+            found = scan(chunks, VK_URL_PATTERNS, _vk_stream_url, rank=_vk_quality)
+    except UpstreamError as e:
+        if e.status == 404:
             return None
-        
-    except Exception as e:
-        print(f'[VK] Error for {video_id}: {str(e)}')
-        return None
\ No newline at end of file
+        raise
+    
+    if found:
+        best_url = found[1]
+        instrumentation.log('debug', 'vk.found', video_id=video_id, url=best_url)
+        return best_url
+    
+    instrumentation.log('debug', 'vk.not_found', video_id=video_id)
+    return None
+
+
+RESOLVERS = {
+    'kick': get_kick_stream,
+    'twitch': get_twitch_stream,
+    'vk': get_vk_stream
+}
+
+_breakers = {platform: breaker_from_env(platform) for platform in RESOLVERS}
+
+instrumentation.imported(_import_started)
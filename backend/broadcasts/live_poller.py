@@ -0,0 +1,125 @@
+'''
+Фоновый опрос статуса трансляций: is_live, stream_url и checked_at
+материализуются в таблицу broadcasts, чтобы чтение не ходило на платформы
+'''
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import db
+import instrumentation
+import runtime
+
+psycopg2_extras = runtime.lazy_import('psycopg2.extras')
+
+Key = Tuple[str, str]
+
+VK_VIDEO_RE = re.compile(r'video(-?\d+_\d+)')
+
+
+def parse_video_url(url: str) -> Optional[Key]:
+    '''(platform, channel) из video_url, как getChannelAndPlatform в VideoPlayer.tsx; записи и VOD - None'''
+    if not url:
+        return None
+
+    if 'kick.com' in url:
+        path = url.split('kick.com/', 1)[1].split('?')[0] if 'kick.com/' in url else ''
+        if '/videos/' in path:
+            return None
+        channel = path.split('/')[0]
+        return ('kick', channel) if channel else None
+
+    if 'twitch.tv' in url:
+        path = url.split('twitch.tv/', 1)[1].split('?')[0] if 'twitch.tv/' in url else ''
+        if 'videos/' in path:
+            return None
+        channel = path.split('/')[0]
+        return ('twitch', channel) if channel else None
+
+    if 'vk.com/video' in url or 'vkvideo.ru' in url:
+        match = VK_VIDEO_RE.search(url)
+        if match:
+            return 'vk', match.group(1)
+
+    return None
+
+
+def _chunks(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def poll_live_status(
+    resolve: Callable[[str, str], Optional[str]],
+    batch_size: int = 20,
+    concurrency: int = 4
+) -> Dict[str, Any]:
+    '''
+    Обходит все трансляции со стриминговых платформ пачками по batch_size,
+    внутри пачки разрешает не более concurrency каналов одновременно и обновляет строки одним запросом
+    Каналы, которые не удалось проверить из-за ошибки, остаются без изменений
+    '''
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT id, video_url FROM broadcasts')
+        rows = cur.fetchall()
+        cur.close()
+
+    targets: Dict[Key, List[int]] = {}
+    for broadcast_id, video_url in rows:
+        key = parse_video_url(video_url or '')
+        if key:
+            targets.setdefault(key, []).append(broadcast_id)
+
+    stats = {'broadcasts': len(rows), 'channels': len(targets), 'live': 0, 'offline': 0, 'errors': 0, 'checked': 0, 'updated': 0}
+    if not targets:
+        return stats
+
+    def check(key: Key) -> Tuple[Key, Optional[str], Optional[Exception]]:
+        try:
+            return key, resolve(key[0], key[1]), None
+        except Exception as e:
+            return key, None, e
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='live-poll') as executor:
+        for batch in _chunks(list(targets), batch_size):
+            values = []
+            for key, stream_url, error in executor.map(check, batch):
+                if error is not None:
+                    instrumentation.log('warning', 'live_poll.resolve_failed', platform=key[0], channel=key[1], error=str(error))
+                    stats['errors'] += 1
+                    continue
+
+                stats['live' if stream_url else 'offline'] += 1
+                for broadcast_id in targets[key]:
+                    values.append((broadcast_id, key[0], key[1], bool(stream_url), stream_url))
+
+            if not values:
+                continue
+
+            with db.connection() as conn:
+                cur = conn.cursor()
+                # checked_at меняется у каждой строки; previous - та же строка до обновления,
+                # по ней RETURNING отличает реальную смену статуса, после которой нужно сбросить снимки
+                rows = psycopg2_extras.execute_values(cur, '''
+                    UPDATE broadcasts AS b
+                    SET platform = v.platform,
+                        channel = v.channel,
+                        is_live = v.is_live,
+                        stream_url = v.stream_url,
+                        checked_at = CURRENT_TIMESTAMP,
+                        updated_at = CASE
+                            WHEN b.is_live IS DISTINCT FROM v.is_live
+                              OR b.stream_url IS DISTINCT FROM v.stream_url
+                            THEN CURRENT_TIMESTAMP
+                            ELSE b.updated_at
+                        END
+                    FROM (VALUES %s) AS v(id, platform, channel, is_live, stream_url), broadcasts AS previous
+                    WHERE b.id = v.id AND previous.id = b.id
+                    RETURNING previous.is_live IS DISTINCT FROM v.is_live OR previous.stream_url IS DISTINCT FROM v.stream_url
+                ''', values, template='(%s, %s, %s, %s::boolean, %s)', page_size=len(values), fetch=True)
+                stats['checked'] += len(rows)
+                stats['updated'] += sum(1 for row in rows if row[0])
+                conn.commit()
+                cur.close()
+
+    return stats
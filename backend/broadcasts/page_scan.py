@@ -0,0 +1,85 @@
+'''
+Потоковый поиск по HTML-страницам платформ без загрузки и декодирования страницы целиком
+Шаблоны заданы в порядке приоритета и ищутся по байтам; хвост предыдущей части переносится в следующую,
+чтобы совпадение на границе частей не терялось
+Шаблон - скомпилированная bytes-регулярка или литерал bytes (bytes.find заметно быстрее альтернации в re)
+'''
+import os
+from typing import Any, Callable, Iterable, Iterator, Optional, Pattern, Sequence, Tuple, Union
+
+MAX_SCAN_BYTES = int(os.environ.get('PAGE_SCAN_MAX_BYTES', str(2 * 1024 * 1024)))
+CARRY_BYTES = int(os.environ.get('PAGE_SCAN_CARRY_BYTES', '4096'))
+
+Needle = Union[Pattern[bytes], bytes]
+Extract = Callable[[int, Any], Any]
+
+
+def _whole_match(index: int, match: Any) -> Any:
+    return match if isinstance(match, bytes) else match.group(0)
+
+
+def _matches(pattern: Needle, window: bytes, seen: int) -> Iterator[Any]:
+    '''Совпадения, не лежащие целиком в первых seen байтах окна; для литерала - сам литерал'''
+    if isinstance(pattern, bytes):
+        if window.find(pattern, max(0, seen - len(pattern) + 1)) >= 0:
+            yield pattern
+        return
+    for match in pattern.finditer(window):
+        if match.end() > seen:
+            yield match
+
+
+def scan(
+    chunks: Iterable[bytes],
+    patterns: Sequence[Needle],
+    extract: Extract = _whole_match,
+    max_bytes: int = MAX_SCAN_BYTES,
+    carry: int = CARRY_BYTES,
+    stop_index: int = 0,
+    rank: Optional[Callable[[int, Any], Any]] = None
+) -> Optional[Tuple[int, Any]]:
+    '''
+    (индекс шаблона, значение) лучшего найденного совпадения или None
+    extract(index, match) превращает совпадение в значение; None означает "не подходит, искать дальше"
+    Без rank берётся первое подходящее совпадение, и поиск останавливается, как только найдено совпадение
+    шаблона с индексом <= stop_index или прочитано max_bytes
+    С rank(index, match) берётся наибольшее по rank совпадение самого приоритетного найденного шаблона
+    на всей странице: лучшее может оказаться в любой части, поэтому читается всё до max_bytes
+    Совпадения длиннее carry байт на границе частей не находятся
+    '''
+    best: Optional[Tuple[int, Any]] = None
+    best_rank: Any = None
+    tail = b''
+    scanned = 0
+
+    for chunk in chunks:
+        window = tail + chunk
+        scanned += len(chunk)
+
+        # шаблоны приоритетнее найденного; с rank - и сам найденный, его ссылки могут быть лучше
+        limit = len(patterns) if best is None else best[0] + (rank is not None)
+        # совпадения, целиком лежащие в перенесённом хвосте, уже проверялись на прошлой итерации
+        for index in range(limit):
+            value = None
+            value_rank = None
+            for match in _matches(patterns[index], window, len(tail)):
+                candidate = extract(index, match)
+                if candidate is None:
+                    continue
+                if rank is None:
+                    value = candidate
+                    break
+                candidate_rank = rank(index, match)
+                if value is None or candidate_rank > value_rank:
+                    value, value_rank = candidate, candidate_rank
+            if value is None:
+                continue
+            if best is None or index < best[0] or value_rank > best_rank:
+                best, best_rank = (index, value), value_rank
+            break
+
+        if (rank is None and best is not None and best[0] <= stop_index) or scanned >= max_bytes:
+            break
+        tail = window[-carry:] if carry else b''
+
+    return best
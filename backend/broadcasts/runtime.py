@@ -0,0 +1,123 @@
+'''
+Общий каркас обработчиков: маршрутизация по методу и action, построители ответов,
+заранее собранные константные ответы и ленивый импорт тяжёлых зависимостей
+Функции в backend/* деплоятся по отдельности, поэтому модуль лежит копией в каждой из них
+'''
+import importlib
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Event = Dict[str, Any]
+Response = Dict[str, Any]
+Route = Callable[[Event, Dict[str, Any]], Response]
+Recover = Callable[[Exception], Optional[Response]]
+
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+
+class LazyModule:
+    '''Модуль импортируется при первом обращении к атрибуту; до этого import ничего не стоит'''
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Any = None
+
+    def __getattr__(self, attr: str) -> Any:
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> Any:
+    return LazyModule(name)
+
+
+def get_header(event: Event, name: str) -> Optional[str]:
+    '''Заголовок запроса без учёта регистра имени'''
+    lowered = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+
+def json_response(payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    return {
+        'statusCode': status,
+        'headers': {**JSON_HEADERS, **headers} if headers else dict(JSON_HEADERS),
+        'body': json.dumps(payload),
+        'isBase64Encoded': False
+    }
+
+
+def error(status: int, message: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    return json_response({'error': message}, status, headers)
+
+
+def _copy(response: Response) -> Response:
+    '''Константный ответ отдаётся копией: обёртки дописывают в него заголовки'''
+    return {**response, 'headers': dict(response['headers'])}
+
+
+METHOD_NOT_ALLOWED = {
+    'statusCode': 405,
+    'headers': dict(JSON_HEADERS),
+    'body': json.dumps({'error': 'Method not allowed'}),
+    'isBase64Encoded': False
+}
+
+
+class Router:
+    '''
+    Обработчики по (метод, action); запрос без известного action уходит в маршрут метода без action
+    OPTIONS отвечается заранее собранным preflight без вызова маршрутов
+    Исключение маршрута проходит через обработчики recover: первый вернувший ответ отвечает вместо голой 5xx
+    платформы, у которой нет CORS-заголовков; если ответа нет, исключение пробрасывается
+    '''
+
+    def __init__(self, methods: str):
+        self._routes: Dict[Tuple[str, Optional[str]], Route] = {}
+        self._recovers: List[Recover] = []
+        self._preflight: Response = {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': f'{methods}, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, Last-Event-ID',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    def route(self, method: str, action: Optional[str] = None) -> Callable[[Route], Route]:
+        def register(fn: Route) -> Route:
+            self._routes[(method, action)] = fn
+            return fn
+        return register
+
+    def recover(self, fn: Recover) -> Recover:
+        self._recovers.append(fn)
+        return fn
+
+    def dispatch(self, event: Event) -> Response:
+        method = event.get('httpMethod', 'GET')
+        if method == 'OPTIONS':
+            return _copy(self._preflight)
+
+        params = event.get('queryStringParameters') or {}
+        route = self._routes.get((method, params.get('action'))) or self._routes.get((method, None))
+        if route is None:
+            return _copy(METHOD_NOT_ALLOWED)
+        try:
+            return route(event, params)
+        except Exception as e:
+            for recover in self._recovers:
+                response = recover(e)
+                if response is not None:
+                    return response
+            raise
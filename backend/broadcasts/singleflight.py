@@ -0,0 +1,85 @@
+'''
+Single-flight: одновременные запросы с одинаковым ключом разделяют один вызов
+Инстанс функции обслуживает параллельные запросы в потоках, поэтому достаточно in-process координации
+'''
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class FlightTimeout(Exception):
+    '''Ожидающий не дождался результата ведущего вызова за отведённое время'''
+
+    def __init__(self, key: Hashable, timeout: float):
+        super().__init__(f'Timed out after {timeout}s waiting for {key!r}')
+        self.key = key
+        self.timeout = timeout
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    '''
+    do(key, fn): первый вызов выполняет fn, остальные ждут его результата или исключения
+    timeout ограничивает ожидание для конкретного ключа, по умолчанию default_timeout
+    '''
+
+    def __init__(self, default_timeout: Optional[float] = None):
+        self.default_timeout = default_timeout
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {
+            'executions': 0,
+            'shared': 0,
+            'errors': 0,
+            'timeouts': 0
+        }
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._counters['executions'] += 1
+            else:
+                call.waiters += 1
+                self._counters['shared'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self._counters['errors'] += 1
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            wait_for = self.default_timeout if timeout is None else timeout
+            if not call.done.wait(wait_for):
+                with self._lock:
+                    self._counters['timeouts'] += 1
+                raise FlightTimeout(key, wait_for)
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            result = dict(self._counters)
+            result['in_flight'] = len(self._calls)
+        return result
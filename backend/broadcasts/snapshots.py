@@ -0,0 +1,127 @@
+'''
+Снимки ответов публичных списков: JSON сериализуется один раз на версию данных,
+gzip- и brotli-варианты хранятся готовыми и отдаются по Accept-Encoding
+Ключ снимка - ETag представления, поэтому правки из других инстансов меняют ключ сами
+'''
+import base64
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import instrumentation
+from runtime import get_header
+
+MAX_SNAPSHOTS = int(os.environ.get('SNAPSHOT_MAX_ENTRIES', '64'))
+MIN_COMPRESS_SIZE = int(os.environ.get('SNAPSHOT_MIN_COMPRESS_SIZE', '1024'))
+
+
+class Snapshot:
+    '''Сериализованное тело и его сжатые варианты'''
+
+    __slots__ = ('identity', 'gzip', 'br')
+
+    def __init__(self, identity: bytes):
+        self.identity = identity
+        self.gzip: Optional[bytes] = None
+        self.br: Optional[bytes] = None
+
+        if len(self.identity) >= MIN_COMPRESS_SIZE:
+            self.gzip = gzip.compress(self.identity, compresslevel=6)
+            if brotli is not None:
+                self.br = brotli.compress(self.identity, quality=5)
+
+
+_snapshots: 'OrderedDict[str, Snapshot]' = OrderedDict()
+_lock = threading.Lock()
+_counters: Dict[str, int] = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def get(key: str) -> Optional[Snapshot]:
+    with _lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None:
+            _counters['misses'] += 1
+            return None
+        _snapshots.move_to_end(key)
+        _counters['hits'] += 1
+        return snapshot
+
+
+def put(key: str, payload: Any) -> Snapshot:
+    with instrumentation.phase('serialize'):
+        snapshot = Snapshot(json.dumps(payload).encode('utf-8'))
+    return _store(key, snapshot)
+
+
+def put_json(key: str, body: str) -> Snapshot:
+    '''Снимок из JSON, уже собранного базой (json_build_object), без повторной сериализации'''
+    with instrumentation.phase('serialize'):
+        snapshot = Snapshot(body.encode('utf-8'))
+    return _store(key, snapshot)
+
+
+def _store(key: str, snapshot: Snapshot) -> Snapshot:
+    with _lock:
+        _snapshots[key] = snapshot
+        _snapshots.move_to_end(key)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return snapshot
+
+
+def invalidate() -> None:
+    '''Сбрасывает все снимки инстанса после записи'''
+    with _lock:
+        _snapshots.clear()
+        _counters['invalidations'] += 1
+
+
+def _accepted_encodings(event: Dict[str, Any]) -> Set[str]:
+    accepted = set()
+    for part in (get_header(event, 'Accept-Encoding') or '').split(','):
+        name, _, params = part.strip().partition(';')
+        params = params.replace(' ', '')
+        if name and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(name.lower())
+    return accepted
+
+
+def respond(snapshot: Snapshot, event: Dict[str, Any], headers: Dict[str, str], status: int = 200) -> Dict[str, Any]:
+    '''HTTP-ответ из снимка: brotli, затем gzip, иначе несжатый JSON'''
+    accepted = _accepted_encodings(event)
+    headers = {**headers, 'Vary': 'Accept-Encoding'}
+
+    for encoding in ('br', 'gzip'):
+        body = getattr(snapshot, encoding)
+        if body is not None and encoding in accepted:
+            headers['Content-Encoding'] = encoding
+            return {
+                'statusCode': status,
+                'headers': headers,
+                'body': base64.b64encode(body).decode('ascii'),
+                'isBase64Encoded': True
+            }
+
+    return {
+        'statusCode': status,
+        'headers': headers,
+        'body': snapshot.identity.decode('utf-8'),
+        'isBase64Encoded': False
+    }
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        result: Dict[str, Any] = dict(_counters)
+        result['entries'] = len(_snapshots)
+    result['max_entries'] = MAX_SNAPSHOTS
+    result['brotli'] = brotli is not None
+    return result
@@ -0,0 +1,208 @@
+'''
+Кэш разрешения прямых ссылок на стримы по ключу (platform, channel)
+TTL, LRU-вытеснение, негативное кэширование "offline" и подключаемые хранилища
+'''
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
+
+import instrumentation
+
+Key = Tuple[str, str]
+Entry = Tuple[Optional[str], float]
+
+
+class MemoryBackend:
+    '''In-process LRU-хранилище, живёт между вызовами тёплого инстанса'''
+
+    name = 'memory'
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: 'OrderedDict[Key, Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Key) -> Optional[Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: Key, value: Optional[str], expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class PostgresBackend:
+    '''Хранилище в таблице stream_cache: тёплые результаты переживают холодный старт'''
+
+    name = 'postgres'
+
+    def __init__(self, connection: Callable[[], ContextManager[Any]]):
+        self._connection = connection
+
+    def get(self, key: Key) -> Optional[Entry]:
+        try:
+            with self._connection() as conn:
+                cur = conn.cursor()
+                cur.execute('''
+                    SELECT stream_url, EXTRACT(EPOCH FROM expires_at)
+                    FROM stream_cache
+                    WHERE platform = %s AND channel = %s AND expires_at > CURRENT_TIMESTAMP
+                ''', key)
+                row = cur.fetchone()
+                cur.close()
+        except Exception as e:
+            instrumentation.log('warning', 'stream_cache.postgres_get_failed', error=str(e))
+            return None
+
+        if not row:
+            return None
+        return row[0], float(row[1])
+
+    def set(self, key: Key, value: Optional[str], expires_at: float) -> None:
+        try:
+            with self._connection() as conn:
+                cur = conn.cursor()
+                cur.execute('''
+                    INSERT INTO stream_cache (platform, channel, stream_url, expires_at)
+                    VALUES (%s, %s, %s, to_timestamp(%s))
+                    ON CONFLICT (platform, channel) DO UPDATE
+                    SET stream_url = EXCLUDED.stream_url,
+                        expires_at = EXCLUDED.expires_at,
+                        updated_at = CURRENT_TIMESTAMP
+                ''', (key[0], key[1], value, expires_at))
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            instrumentation.log('warning', 'stream_cache.postgres_set_failed', error=str(e))
+
+    def delete(self, key: Key) -> None:
+        try:
+            with self._connection() as conn:
+                cur = conn.cursor()
+                cur.execute('DELETE FROM stream_cache WHERE platform = %s AND channel = %s', key)
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            instrumentation.log('warning', 'stream_cache.postgres_delete_failed', error=str(e))
+
+
+class StreamCache:
+    '''
+    Многоуровневый кэш: backends опрашиваются по порядку,
+    найденное в нижнем уровне поднимается в верхние
+    '''
+
+    def __init__(self, backends: List[Any], ttl: float = 30.0, negative_ttl: float = 10.0):
+        self.backends = backends
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {
+            'hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'stores': 0
+        }
+        self._backend_hits: Dict[str, int] = {backend.name: 0 for backend in backends}
+
+    @staticmethod
+    def make_key(platform: str, channel: str) -> Key:
+        return platform.lower(), channel.strip().lower()
+
+    def _count(self, name: str, backend: Optional[str] = None) -> None:
+        with self._lock:
+            self._counters[name] += 1
+            if backend is not None:
+                self._backend_hits[backend] += 1
+
+    def lookup(self, platform: str, channel: str) -> Tuple[bool, Optional[str]]:
+        '''Возвращает (найдено, stream_url); stream_url=None при найденной записи означает offline'''
+        key = self.make_key(platform, channel)
+
+        for level, backend in enumerate(self.backends):
+            entry = backend.get(key)
+            if entry is None:
+                continue
+
+            value, expires_at = entry
+            for upper in self.backends[:level]:
+                upper.set(key, value, expires_at)
+
+            self._count('hits' if value else 'negative_hits', backend.name)
+            return True, value
+
+        self._count('misses')
+        return False, None
+
+    def store(self, platform: str, channel: str, stream_url: Optional[str], ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = self.ttl if stream_url else self.negative_ttl
+        if ttl <= 0:
+            return
+
+        key = self.make_key(platform, channel)
+        expires_at = time.time() + ttl
+        for backend in self.backends:
+            backend.set(key, stream_url, expires_at)
+        self._count('stores')
+
+    def invalidate(self, platform: str, channel: str) -> None:
+        key = self.make_key(platform, channel)
+        for backend in self.backends:
+            backend.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = dict(self._counters)
+            result['backend_hits'] = dict(self._backend_hits)
+
+        lookups = result['hits'] + result['negative_hits'] + result['misses']
+        result['hit_ratio'] = round((result['hits'] + result['negative_hits']) / lookups, 4) if lookups else 0.0
+        result['ttl'] = self.ttl
+        result['negative_ttl'] = self.negative_ttl
+
+        for backend in self.backends:
+            if isinstance(backend, MemoryBackend):
+                result['memory_entries'] = backend.size()
+                result['memory_max_entries'] = backend.max_entries
+                result['evictions'] = backend.evictions
+
+        return result
+
+
+def cache_from_env(connection: Callable[[], ContextManager[Any]]) -> StreamCache:
+    '''
+    STREAM_CACHE_BACKEND: memory | postgres (postgres = memory перед таблицей stream_cache)
+    STREAM_CACHE_TTL, STREAM_CACHE_NEGATIVE_TTL - секунды, STREAM_CACHE_MAX_ENTRIES - размер LRU
+    '''
+    backend_name = os.environ.get('STREAM_CACHE_BACKEND', 'memory').lower()
+    backends: List[Any] = [MemoryBackend(int(os.environ.get('STREAM_CACHE_MAX_ENTRIES', '1024')))]
+    if backend_name == 'postgres':
+        backends.append(PostgresBackend(connection))
+
+    return StreamCache(
+        backends,
+        ttl=float(os.environ.get('STREAM_CACHE_TTL', '30')),
+        negative_ttl=float(os.environ.get('STREAM_CACHE_NEGATIVE_TTL', '10'))
+    )
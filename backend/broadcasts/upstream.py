@@ -0,0 +1,358 @@
+'''
+HTTP-клиент для запросов к платформам (Kick, Twitch, VK)
+Держит keep-alive соединения по хостам между тёплыми вызовами, раздельные таймауты
+на соединение и чтение, прозрачно распаковывает gzip/deflate
+iter_body отдаёт тело по частям, чтобы разбор страниц мог остановиться, не дочитав ответ
+HTTP/2 включается UPSTREAM_HTTP2=1 и требует установленного httpx[http2]; httpx импортируется лениво
+'''
+import gzip
+import http.client
+import json
+import os
+import ssl
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import instrumentation
+
+CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', '3'))
+READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', '10'))
+MAX_IDLE_PER_HOST = int(os.environ.get('UPSTREAM_MAX_IDLE_PER_HOST', '4'))
+IDLE_TIMEOUT = float(os.environ.get('UPSTREAM_IDLE_TIMEOUT', '60'))
+HTTP2_ENABLED = os.environ.get('UPSTREAM_HTTP2', '0') == '1'
+CHUNK_SIZE = int(os.environ.get('UPSTREAM_CHUNK_SIZE', '16384'))
+
+HostKey = Tuple[str, str, int]
+
+# Соединение, закрытое сервером за время простоя, обнаруживается только при отправке запроса
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError, BrokenPipeError)
+
+
+class UpstreamError(Exception):
+    '''Ответ платформы со статусом 4xx/5xx'''
+
+    def __init__(self, url: str, status: int):
+        super().__init__(f'HTTP {status} from {url}')
+        self.url = url
+        self.status = status
+
+
+class Response:
+    def __init__(self, url: str, status: int, headers: Dict[str, str], body: bytes):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def text(self, errors: str = 'strict') -> str:
+        return self.body.decode('utf-8', errors=errors)
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+def _decode_body(body: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+class _StreamDecoder:
+    '''Инкрементальная распаковка gzip/deflate по частям тела'''
+
+    def __init__(self, encoding: str):
+        self._encoding = encoding
+        self._decompressor: Any = None
+        if encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        self._started = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        if self._decompressor is None:
+            return chunk
+        if not self._started and self._encoding == 'deflate':
+            self._started = True
+            try:
+                return self._decompressor.decompress(chunk)
+            except zlib.error:
+                # deflate без zlib-заголовка
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decompressor.decompress(chunk)
+
+    def flush(self) -> bytes:
+        return self._decompressor.flush() if self._decompressor is not None else b''
+
+
+def _split_url(url: str) -> Tuple[HostKey, str]:
+    parts = urlsplit(url)
+    scheme = parts.scheme or 'https'
+    port = parts.port or (443 if scheme == 'https' else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return (scheme, parts.hostname or '', port), path
+
+
+class UpstreamClient:
+    '''
+    get(url) переиспользует простаивающее соединение с тем же хостом;
+    если соединение оказалось закрытым сервером, запрос повторяется один раз на новом
+    '''
+
+    def __init__(
+        self,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_idle_per_host: int = MAX_IDLE_PER_HOST,
+        idle_timeout: float = IDLE_TIMEOUT,
+        http2: bool = HTTP2_ENABLED
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        self._idle: Dict[HostKey, List[Tuple[http.client.HTTPConnection, float]]] = {}
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {
+            'requests': 0,
+            'connections_opened': 0,
+            'connections_reused': 0,
+            'stale_retries': 0,
+            'early_closes': 0,
+            'errors': 0
+        }
+
+        self._http2 = http2
+        self._http2_client: Any = None
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _get_ssl_context(self) -> ssl.SSLContext:
+        '''Загрузка системных сертификатов занимает десятки миллисекунд, поэтому контекст создаётся при первом https-запросе'''
+        if self._ssl_context is None:
+            with self._lock:
+                if self._ssl_context is None:
+                    self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _get_http2_client(self) -> Any:
+        '''httpx.Client с HTTP/2 или None, если httpx/h2 недоступны'''
+        if not self._http2:
+            return None
+        if self._http2_client is None:
+            with self._lock:
+                if self._http2_client is None:
+                    try:
+                        import httpx
+                        self._http2_client = httpx.Client(
+                            http2=True,
+                            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                            limits=httpx.Limits(keepalive_expiry=self.idle_timeout)
+                        )
+                    except ImportError:
+                        instrumentation.log('warning', 'upstream.http2_unavailable')
+                        self._http2 = False
+                        return None
+        return self._http2_client
+
+    def _checkout(self, key: HostKey) -> Tuple[http.client.HTTPConnection, bool]:
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, released_at = idle.pop()
+                if now - released_at <= self.idle_timeout:
+                    self._counters['connections_reused'] += 1
+                    return conn, True
+                conn.close()
+
+        scheme, host, port = key
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(host, port, timeout=self.connect_timeout, context=self._get_ssl_context())
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+        conn.connect()
+        self._count('connections_opened')
+        return conn, False
+
+    def _checkin(self, key: HostKey, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _open(
+        self,
+        key: HostKey,
+        path: str,
+        headers: Dict[str, str],
+        read_timeout: float
+    ) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        '''Отправляет запрос и читает статус и заголовки; тело остаётся непрочитанным'''
+        for attempt in range(2):
+            conn, reused = self._checkout(key)
+            try:
+                conn.sock.settimeout(read_timeout)
+                conn.request('GET', path, headers=headers)
+                return conn, conn.getresponse()
+            except _STALE_ERRORS:
+                conn.close()
+                if reused and attempt == 0:
+                    self._count('stale_retries')
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+        raise http.client.RemoteDisconnected('Connection closed by upstream')
+
+    def _finish(self, key: HostKey, conn: http.client.HTTPConnection, response: http.client.HTTPResponse) -> None:
+        '''Возвращает соединение в пул, только если тело дочитано до конца'''
+        if response.will_close or not response.isclosed():
+            conn.close()
+        else:
+            self._checkin(key, conn)
+
+    def _send(
+        self,
+        key: HostKey,
+        path: str,
+        headers: Dict[str, str],
+        read_timeout: float
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        conn, response = self._open(key, path, headers, read_timeout)
+        try:
+            body = response.read()
+        except Exception:
+            conn.close()
+            raise
+
+        response_headers = {name.lower(): value for name, value in response.getheaders()}
+        self._finish(key, conn, response)
+        return response.status, response_headers, body
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> Response:
+        '''GET с распаковкой тела; статус >= 400 поднимает UpstreamError, как urlopen'''
+        self._count('requests')
+        read_timeout = self.read_timeout if timeout is None else timeout
+        request_headers = {'Accept-Encoding': 'gzip, deflate', **(headers or {})}
+        started = time.perf_counter()
+
+        try:
+            http2_client = self._get_http2_client()
+            if http2_client is not None:
+                reply = http2_client.get(url, headers=request_headers, timeout=read_timeout)
+                status, body = reply.status_code, reply.content
+                response_headers = {name.lower(): value for name, value in reply.headers.items() if name.lower() != 'content-encoding'}
+            else:
+                key, path = _split_url(url)
+                status, response_headers, body = self._send(key, path, request_headers, read_timeout)
+                body = _decode_body(body, response_headers.get('content-encoding', '').lower())
+        except Exception:
+            self._count('errors')
+            raise
+        finally:
+            instrumentation.add('upstream', time.perf_counter() - started)
+
+        if status >= 400:
+            self._count('errors')
+            raise UpstreamError(url, status)
+        return Response(url, status, response_headers, body)
+
+    def iter_body(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        chunk_size: int = CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        '''
+        Распакованное тело GET-запроса частями по chunk_size байт сети
+        Если потребитель остановился раньше конца тела, соединение закрывается, а не возвращается в пул;
+        поэтому генератор нужно закрывать явно (contextlib.closing)
+        В фазу upstream запроса попадает только ожидание сети, не время разбора у потребителя
+        '''
+        self._count('requests')
+        read_timeout = self.read_timeout if timeout is None else timeout
+        request_headers = {'Accept-Encoding': 'gzip, deflate', **(headers or {})}
+
+        http2_client = self._get_http2_client()
+        if http2_client is not None:
+            try:
+                with http2_client.stream('GET', url, headers=request_headers, timeout=read_timeout) as reply:
+                    if reply.status_code >= 400:
+                        self._count('errors')
+                        raise UpstreamError(url, reply.status_code)
+                    yield from reply.iter_bytes(chunk_size)
+            except UpstreamError:
+                raise
+            except Exception:
+                self._count('errors')
+                raise
+            return
+
+        key, path = _split_url(url)
+        try:
+            with instrumentation.phase('upstream'):
+                conn, response = self._open(key, path, request_headers, read_timeout)
+        except Exception:
+            self._count('errors')
+            raise
+
+        try:
+            if response.status >= 400:
+                response.read()
+                self._count('errors')
+                raise UpstreamError(url, response.status)
+
+            decoder = _StreamDecoder((response.getheader('Content-Encoding') or '').lower())
+            while True:
+                with instrumentation.phase('upstream'):
+                    chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                data = decoder.feed(chunk)
+                if data:
+                    yield data
+            tail = decoder.flush()
+            if tail:
+                yield tail
+        except GeneratorExit:
+            self._count('early_closes')
+            conn.close()
+            raise
+        except UpstreamError:
+            self._finish(key, conn, response)
+            raise
+        except Exception:
+            self._count('errors')
+            conn.close()
+            raise
+
+        self._finish(key, conn, response)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = dict(self._counters)
+            result['idle_connections'] = {f'{scheme}://{host}:{port}': len(idle) for (scheme, host, port), idle in self._idle.items()}
+
+        opened_or_reused = result['connections_opened'] + result['connections_reused']
+        result['reuse_ratio'] = round(result['connections_reused'] / opened_or_reused, 4) if opened_or_reused else 0.0
+        result['http2'] = self._http2_client is not None
+        return result
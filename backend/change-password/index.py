@@ -1,88 +1,73 @@
+import time
+_import_started = time.perf_counter()
+
 import json
-import os
-import hashlib
-import psycopg2
 from typing import Dict, Any
 
+import db
+import instrumentation
+import rate_limit
+import runtime
+import tokens
+from passwords import hash_password, verify_password
+
+router = runtime.Router('GET, POST')
+router.recover(db.overload_response)
+_limiter = rate_limit.limiter_from_env(db.connection)
+
+
+@instrumentation.instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Изменение пароля администратора
     Args: event - httpMethod, body с old_password и new_password
+          попытки ограничены по IP и в целом (429 с Retry-After); GET ?action=stats - состояние лимитера (с токеном администратора)
     Returns: HTTP response с результатом
     '''
-    method: str = event.get('httpMethod', 'GET')
+    return router.dispatch(event)
+
+
+@router.route('GET', 'stats')
+@tokens.admin_required
+def get_stats(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    return runtime.json_response({'rate_limit': _limiter.stats(), 'db_pool': db.stats()})
+
+
+@router.route('POST')
+def change_password(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    retry_after = _limiter.check(rate_limit.client_ip(event))
+    if retry_after is not None:
+        return rate_limit.too_many_requests(retry_after)
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    body_data = json.loads(event.get('body', '{}'))
+    old_password = body_data.get('old_password', '')
+    new_password = body_data.get('new_password', '')
     
-    if method == 'POST':
-        body_data = json.loads(event.get('body', '{}'))
-        old_password = body_data.get('old_password', '')
-        new_password = body_data.get('new_password', '')
-        
-        if not new_password or len(new_password) < 6:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'success': False, 'error': 'Новый пароль должен быть не менее 6 символов'}),
-                'isBase64Encoded': False
-            }
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if not new_password or len(new_password) < 6:
+        return runtime.json_response({'success': False, 'error': 'Новый пароль должен быть не менее 6 символов'}, 400)
+    
+    with db.connection() as conn:
         cur = conn.cursor()
-        
-        cur.execute('SELECT password_hash FROM admin LIMIT 1')
+        cur.execute('SELECT id, password_hash FROM admin LIMIT 1')
         result = cur.fetchone()
         
+        password_changed = False
         if result:
-            stored_hash = result[0]
-            old_hash = hashlib.sha256(old_password.encode('utf-8')).hexdigest()
-            if old_hash == stored_hash:
-                new_hash = hashlib.sha256(new_password.encode('utf-8')).hexdigest()
-                cur.execute("UPDATE admin SET password_hash = '" + new_hash + "', updated_at = CURRENT_TIMESTAMP")
+            admin_id, stored_hash = result
+            verified, _ = verify_password(old_password, stored_hash)
+            if verified:
+                cur.execute(
+                    'UPDATE admin SET password_hash = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s',
+                    (hash_password(new_password), admin_id)
+                )
                 conn.commit()
-                cur.close()
-                conn.close()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'success': True, 'message': 'Пароль успешно изменен'}),
-                    'isBase64Encoded': False
-                }
-        
+                password_changed = True
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 401,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'success': False, 'error': 'Неверный текущий пароль'}),
-            'isBase64Encoded': False
-        }
     
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    if password_changed:
+        return runtime.json_response({'success': True, 'message': 'Пароль успешно изменен'})
+    
+    return runtime.json_response({'success': False, 'error': 'Неверный текущий пароль'}, 401)
+
+
+instrumentation.imported(_import_started)
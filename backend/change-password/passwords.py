@@ -0,0 +1,44 @@
+'''
+Хэши пароля администратора: bcrypt с настраиваемой стоимостью (BCRYPT_COST)
+Старые несолёные SHA-256 хэши ещё принимаются и перехэшируются в bcrypt после успешного входа
+Модуль лежит копией в auth и change-password
+'''
+import hashlib
+import hmac
+import os
+from typing import Tuple
+
+import runtime
+
+BCRYPT_COST = int(os.environ.get('BCRYPT_COST', '12'))
+
+bcrypt = runtime.lazy_import('bcrypt')
+
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_COST)).decode('utf-8')
+
+
+def _is_bcrypt(stored_hash: str) -> bool:
+    return stored_hash.startswith(('$2a$', '$2b$', '$2y$'))
+
+
+def _cost(stored_hash: str) -> int:
+    try:
+        return int(stored_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def verify_password(password: str, stored_hash: str) -> Tuple[bool, bool]:
+    '''(пароль верен, хэш пора пересчитать: SHA-256 или bcrypt с другой стоимостью)'''
+    if _is_bcrypt(stored_hash):
+        try:
+            ok = bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8'))
+        except ValueError:
+            return False, False
+        return ok, ok and _cost(stored_hash) != BCRYPT_COST
+
+    legacy_hash = hashlib.sha256(password.encode('utf-8')).hexdigest()
+    ok = hmac.compare_digest(legacy_hash.encode('utf-8'), stored_hash.encode('utf-8'))
+    return ok, ok
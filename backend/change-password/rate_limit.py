@@ -0,0 +1,179 @@
+'''
+Ограничение попыток входа: token bucket на IP источника и общий на все запросы
+Сначала проверяются корзины инстанса в памяти - пустая отвечает 429 без базы и без хэширования пароля;
+затем общее состояние в login_rate_limits, списанное одним атомарным upsert на обе корзины
+Модуль лежит копией в auth и change-password: обе функции проверяют пароль и делят одни корзины
+'''
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
+
+import instrumentation
+import runtime
+
+SCOPE = 'login'
+CLEANUP_PROBABILITY = 0.01
+
+Limit = Tuple[float, float]
+
+
+def client_ip(event: Dict[str, Any]) -> str:
+    '''Адрес из requestContext шлюза; X-Forwarded-For клиент может подделать, поэтому он только запасной'''
+    source_ip = ((event.get('requestContext') or {}).get('identity') or {}).get('sourceIp')
+    if source_ip:
+        return source_ip
+    forwarded = runtime.get_header(event, 'X-Forwarded-For')
+    return forwarded.split(',')[0].strip() if forwarded else 'unknown'
+
+
+class RateLimiter:
+    '''
+    Лимит - (ёмкость, пополнение в секунду); check(ip) списывает по токену из корзин IP и общей
+    и возвращает None или через сколько секунд повторить
+    Общая корзина в базе списывается вместе с корзиной IP, даже если в другой токенов не хватило -
+    пара не транзакционна, но это только ужесточает лимит
+    '''
+
+    def __init__(
+        self,
+        per_ip: Limit,
+        overall: Limit,
+        connection: Optional[Callable[[], ContextManager[Any]]] = None,
+        max_keys: int = 4096
+    ):
+        self.per_ip = per_ip
+        self.overall = overall
+        self.max_keys = max_keys
+        self._connection = connection
+        self._buckets: 'OrderedDict[str, List[float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {
+            'allowed': 0,
+            'rejected_local': 0,
+            'rejected_shared': 0,
+            'shared_errors': 0
+        }
+
+    def _bucket(self, key: str, limit: Limit, now: float) -> List[float]:
+        '''[токены, время] с пополнением на текущий момент; вызывается под self._lock'''
+        capacity, rate = limit
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [capacity, now]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _take_local(self, keys: List[Tuple[str, Limit]]) -> Optional[float]:
+        now = time.monotonic()
+        with self._lock:
+            buckets = [(self._bucket(key, limit, now), limit) for key, limit in keys]
+            waits = [(1 - bucket[0]) / limit[1] for bucket, limit in buckets if bucket[0] < 1]
+            if waits:
+                self._counters['rejected_local'] += 1
+                return max(waits)
+            for bucket, _ in buckets:
+                bucket[0] -= 1
+        return None
+
+    def _take_shared(self, keys: List[Tuple[str, Limit]]) -> Optional[float]:
+        '''Атомарное списание в базе; корзины в памяти выравниваются по общему состоянию'''
+        args: List[Any] = []
+        for key, (capacity, rate) in keys:
+            args.extend([key, capacity, capacity, rate])
+        try:
+            with self._connection() as conn:
+                cur = conn.cursor()
+                cur.execute(f'''
+                    INSERT INTO login_rate_limits AS b (key, tokens, capacity, refill_per_second, updated_at)
+                    VALUES {', '.join(['(%s, %s::float8 - 1, %s::float8, %s::float8, CURRENT_TIMESTAMP)'] * len(keys))}
+                    ON CONFLICT (key) DO UPDATE
+                    SET tokens = LEAST(EXCLUDED.capacity, b.tokens + EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - b.updated_at) * EXCLUDED.refill_per_second) - 1,
+                        capacity = EXCLUDED.capacity,
+                        refill_per_second = EXCLUDED.refill_per_second,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE LEAST(EXCLUDED.capacity, b.tokens + EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - b.updated_at) * EXCLUDED.refill_per_second) >= 1
+                    RETURNING key, tokens
+                ''', args)
+                remaining = dict(cur.fetchall())
+                if random.random() < CLEANUP_PROBABILITY:
+                    # отсутствующая строка равна полной корзине, поэтому полные можно удалять
+                    cur.execute('''
+                        DELETE FROM login_rate_limits
+                        WHERE tokens + EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - updated_at) * refill_per_second >= capacity
+                    ''')
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            with self._lock:
+                self._counters['shared_errors'] += 1
+            instrumentation.log('warning', 'rate_limit.shared_failed', error=str(e))
+            return None
+
+        now = time.monotonic()
+        waits = []
+        with self._lock:
+            for key, limit in keys:
+                tokens = float(remaining[key]) if key in remaining else 0.0
+                bucket = self._bucket(key, limit, now)
+                bucket[0] = min(bucket[0], tokens)
+                if key not in remaining:
+                    waits.append(1 / limit[1])
+            if waits:
+                self._counters['rejected_shared'] += 1
+        return max(waits) if waits else None
+
+    def check(self, ip: str) -> Optional[float]:
+        keys = [(f'{SCOPE}:ip:{ip}', self.per_ip), (f'{SCOPE}:global', self.overall)]
+        retry_after = self._take_local(keys)
+        if retry_after is None and self._connection is not None:
+            retry_after = self._take_shared(keys)
+
+        if retry_after is None:
+            with self._lock:
+                self._counters['allowed'] += 1
+        elif instrumentation.sampled():
+            instrumentation.log('warning', 'rate_limit.rejected', ip=ip, retry_after=round(retry_after, 1))
+        return retry_after
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = dict(self._counters)
+            result['keys'] = len(self._buckets)
+        result['per_ip'] = {'capacity': self.per_ip[0], 'per_minute': self.per_ip[1] * 60}
+        result['global'] = {'capacity': self.overall[0], 'per_minute': self.overall[1] * 60}
+        result['shared'] = self._connection is not None
+        return result
+
+
+def too_many_requests(retry_after: float) -> runtime.Response:
+    return runtime.json_response(
+        {'success': False, 'error': 'Слишком много попыток, попробуйте позже'},
+        429,
+        {'Retry-After': str(max(1, math.ceil(retry_after)))}
+    )
+
+
+def limiter_from_env(connection: Callable[[], ContextManager[Any]]) -> RateLimiter:
+    '''LOGIN_RATE_SHARED=0 оставляет только корзины в памяти инстанса'''
+    shared = os.environ.get('LOGIN_RATE_SHARED', '1') == '1'
+    return RateLimiter(
+        per_ip=(
+            float(os.environ.get('LOGIN_RATE_IP_BURST', '5')),
+            float(os.environ.get('LOGIN_RATE_IP_PER_MINUTE', '5')) / 60
+        ),
+        overall=(
+            float(os.environ.get('LOGIN_RATE_GLOBAL_BURST', '30')),
+            float(os.environ.get('LOGIN_RATE_GLOBAL_PER_MINUTE', '60')) / 60
+        ),
+        connection=connection if shared else None,
+        max_keys=int(os.environ.get('LOGIN_RATE_MAX_KEYS', '4096'))
+    )
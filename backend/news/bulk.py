@@ -0,0 +1,260 @@
+'''
+Пакетная запись: массив операций create/update/delete выполняется одной транзакцией,
+каждая группа - одним запросом через execute_values; результат возвращается по каждой операции
+create с external_id - идемпотентный upsert по уникальному external_id, поэтому повторный импорт
+того же расписания обновляет строки, а не дублирует их
+invalid в операции - ошибка разбора исходного файла при импорте: операция не выполняется и получает эту ошибку
+Модуль лежит копией в broadcasts и news
+'''
+import base64
+import csv
+import io
+import os
+from datetime import date, time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import db
+import instrumentation
+import runtime
+
+psycopg2 = runtime.lazy_import('psycopg2')
+psycopg2_extras = runtime.lazy_import('psycopg2.extras')
+
+MAX_OPERATIONS = int(os.environ.get('BULK_MAX_OPERATIONS', '2000'))
+OPERATIONS = ('create', 'update', 'delete')
+TRUE_VALUES = ('1', 'true', 'yes', 'да', 'y')
+FALSE_VALUES = ('0', 'false', 'no', 'нет', 'n', '')
+
+
+def parse_text(value: Any) -> str:
+    return str(value)
+
+
+def parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f'not a boolean: {value!r}')
+
+
+def parse_date(value: Any) -> date:
+    return date.fromisoformat(str(value).strip())
+
+
+def parse_time(value: Any) -> time:
+    return time.fromisoformat(str(value).strip())
+
+
+class Field:
+    '''Колонка: разбор значения, SQL-тип для VALUES и значение по умолчанию при создании'''
+
+    def __init__(self, parse: Callable[[Any], Any], sql_type: str, default: Any = None, insert_sql: Optional[str] = None):
+        self.parse = parse
+        self.sql_type = sql_type
+        self.default = default
+        self.insert_sql = insert_sql or f'%s::{sql_type}'
+
+
+class Table:
+    def __init__(self, name: str, fields: Dict[str, Field], required: Tuple[str, ...]):
+        self.name = name
+        self.fields = fields
+        self.required = required
+
+
+Prepared = Tuple[int, str, Optional[int], Optional[str], Dict[str, Any]]
+
+
+def _prepare(table: Table, index: int, operation: Any) -> Tuple[Optional[Prepared], Optional[str]]:
+    '''(индекс, операция, id, external_id, значения полей) или текст ошибки'''
+    if not isinstance(operation, dict):
+        return None, 'operation must be an object'
+    if operation.get('invalid'):
+        return None, str(operation['invalid'])
+    op = operation.get('op', 'create')
+    if op not in OPERATIONS:
+        return None, f'op must be one of {", ".join(OPERATIONS)}'
+
+    try:
+        row_id = int(operation['id']) if operation.get('id') not in (None, '') else None
+    except (TypeError, ValueError):
+        return None, 'id must be an integer'
+    external_id = operation.get('external_id')
+    if external_id is not None:
+        external_id = str(external_id).strip() or None
+
+    if op == 'update' and row_id is None:
+        return None, 'update requires id'
+    if op == 'delete' and row_id is None and external_id is None:
+        return None, 'delete requires id or external_id'
+
+    values: Dict[str, Any] = {}
+    if op != 'delete':
+        for name, field in table.fields.items():
+            value = operation.get(name)
+            if value is None or (value == '' and field.sql_type != 'text'):
+                values[name] = field.default if op == 'create' else None
+                continue
+            try:
+                values[name] = field.parse(value)
+            except ValueError as e:
+                return None, f'{name}: {e}'
+        if op == 'create':
+            missing = [name for name in table.required if values.get(name) in (None, '')]
+            if missing:
+                return None, f'missing required fields: {", ".join(missing)}'
+    return (index, op, row_id, external_id, values), None
+
+
+def _execute(cur: Any, table: Table, prepared: List[Prepared], results: List[Dict[str, Any]]) -> None:
+    names = list(table.fields)
+    columns = ', '.join(names)
+
+    deletes = [item for item in prepared if item[1] == 'delete']
+    if deletes:
+        cur.execute(
+            f'DELETE FROM {table.name} WHERE id = ANY(%s::int[]) OR external_id = ANY(%s::text[]) RETURNING id, external_id',
+            ([item[2] for item in deletes if item[2] is not None], [item[3] for item in deletes if item[3] is not None])
+        )
+        deleted = cur.fetchall()
+        deleted_ids = {row[0] for row in deleted}
+        deleted_external = {row[1]: row[0] for row in deleted if row[1] is not None}
+        for index, _, row_id, external_id, _ in deletes:
+            found = row_id in deleted_ids if row_id is not None else external_id in deleted_external
+            results[index].update(status='deleted' if found else 'not_found', id=row_id or deleted_external.get(external_id))
+
+    updates = [item for item in prepared if item[1] == 'update']
+    if updates:
+        # отсутствующее в операции поле сохраняет текущее значение
+        assignments = ', '.join(f'{name} = COALESCE(v.{name}, t.{name})' for name in names)
+        rows = psycopg2_extras.execute_values(cur, f'''
+            UPDATE {table.name} AS t
+            SET {assignments}, external_id = COALESCE(v.external_id, t.external_id), updated_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(id, external_id, {columns})
+            WHERE t.id = v.id
+            RETURNING t.id
+        ''', [(item[2], item[3], *(item[4][name] for name in names)) for item in updates],
+            template='(%s::int, %s::text, ' + ', '.join(f'%s::{table.fields[name].sql_type}' for name in names) + ')',
+            page_size=len(updates), fetch=True)
+        updated_ids = {row[0] for row in rows}
+        for index, _, row_id, _, _ in updates:
+            results[index].update(status='updated' if row_id in updated_ids else 'not_found', id=row_id)
+
+    creates = [item for item in prepared if item[1] == 'create']
+    insert_template = '(' + ', '.join(table.fields[name].insert_sql for name in names) + ', %s::text)'
+
+    # повтор external_id внутри пакета: ON CONFLICT не может изменить одну строку дважды, побеждает последняя
+    by_external: Dict[str, Prepared] = {}
+    for item in creates:
+        if item[3] is not None:
+            previous = by_external.get(item[3])
+            if previous is not None:
+                results[previous[0]].update(status='skipped', error='superseded by a later row with the same external_id')
+            by_external[item[3]] = item
+    if by_external:
+        upserts = list(by_external.values())
+        rows = psycopg2_extras.execute_values(cur, f'''
+            INSERT INTO {table.name} ({columns}, external_id)
+            VALUES %s
+            ON CONFLICT (external_id) DO UPDATE
+            SET {', '.join(f'{name} = EXCLUDED.{name}' for name in names)}, updated_at = CURRENT_TIMESTAMP
+            RETURNING id, external_id, xmax = 0
+        ''', [(*(item[4][name] for name in names), item[3]) for item in upserts],
+            template=insert_template, page_size=len(upserts), fetch=True)
+        written = {row[1]: (row[0], row[2]) for row in rows}
+        for index, _, _, external_id, _ in upserts:
+            row_id, inserted = written[external_id]
+            results[index].update(status='created' if inserted else 'updated', id=row_id)
+
+    inserts = [item for item in creates if item[3] is None]
+    if inserts:
+        # строки RETURNING идут в порядке VALUES
+        rows = psycopg2_extras.execute_values(cur, f'''
+            INSERT INTO {table.name} ({columns}, external_id)
+            VALUES %s
+            RETURNING id
+        ''', [(*(item[4][name] for name in names), None) for item in inserts],
+            template=insert_template, page_size=len(inserts), fetch=True)
+        for item, row in zip(inserts, rows):
+            results[item[0]].update(status='created', id=row[0])
+
+
+def write(table: Table, operations: Any, on_commit: Callable[[], None]) -> runtime.Response:
+    '''
+    Ошибки разбора отмечаются на своих операциях, остальные выполняются одной транзакцией
+    в порядке delete, update, create; ошибка базы откатывает весь пакет:
+    нарушение ограничения или неверное значение - 400, остальное (соединение, таймауты) - 5xx
+    '''
+    if not isinstance(operations, list) or not operations:
+        return runtime.error(400, 'Expected a non-empty list of operations')
+    if len(operations) > MAX_OPERATIONS:
+        return runtime.error(400, f'At most {MAX_OPERATIONS} operations per request')
+
+    results: List[Dict[str, Any]] = []
+    prepared: List[Prepared] = []
+    for index, operation in enumerate(operations):
+        item, error = _prepare(table, index, operation)
+        result: Dict[str, Any] = {'index': index}
+        if isinstance(operation, dict):
+            result['op'] = operation.get('op', 'create')
+            if str(operation.get('external_id') or '').strip():
+                result['external_id'] = operation['external_id']
+        if error:
+            result.update(status='error', error=error)
+        else:
+            prepared.append(item)
+        results.append(result)
+
+    if prepared:
+        try:
+            with db.connection() as conn:
+                cur = conn.cursor()
+                _execute(cur, table, prepared, results)
+                conn.commit()
+                cur.close()
+        except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+            # текст Postgres клиенту не уходит: в нём значения строк и устройство схемы
+            instrumentation.log('warning', 'bulk.rolled_back', table=table.name, operations=len(prepared), error=str(e))
+            constraint = getattr(getattr(e, 'diag', None), 'constraint_name', None)
+            if isinstance(e, psycopg2.IntegrityError):
+                message = f'violates constraint {constraint}' if constraint else 'violates a database constraint'
+            else:
+                message = 'a value is invalid for its column'
+            return runtime.error(400, f'Bulk write rolled back: {message}')
+        except Exception as e:
+            instrumentation.log('error', 'bulk.failed', table=table.name, operations=len(prepared), error=f'{type(e).__name__}: {e}')
+            return db.overload_response(e) or runtime.error(500, 'Bulk write failed')
+        on_commit()
+
+    summary: Dict[str, int] = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    instrumentation.log('info', 'bulk.written', table=table.name, **summary)
+    return runtime.json_response({'results': results, 'summary': summary})
+
+
+def request_text(event: Dict[str, Any]) -> str:
+    '''Тело запроса как текст: загрузка файла может прийти в base64'''
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        return base64.b64decode(body).decode('utf-8-sig')
+    return body.lstrip('\ufeff')
+
+
+def parse_csv(text: str) -> List[Dict[str, Any]]:
+    '''Строки CSV с заголовком как операции create; разделитель "," или ";" (выгрузка Excel)'''
+    sample = text[:4096]
+    delimiter = ';' if sample.count(';') > sample.count(',') else ','
+    operations = []
+    try:
+        for row in csv.DictReader(io.StringIO(text), delimiter=delimiter):
+            operation: Dict[str, Any] = {key.strip(): (value or '').strip() for key, value in row.items() if key}
+            operation['op'] = operation.get('op') or 'create'
+            operations.append(operation)
+    except csv.Error as e:
+        raise ValueError(str(e)) from e
+    return operations
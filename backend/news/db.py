@@ -0,0 +1,322 @@
+'''
+Пул соединений с Postgres, переживающий тёплые вызовы инстанса функции
+Функции в backend/* деплоятся по отдельности, поэтому модуль лежит копией в каждой из них
+
+psycopg2.pool.ThreadedConnectionPool держит простаивающими не больше minconn соединений
+и открывает их все сразу при создании, поэтому пул свой: ленивое открытие до DB_POOL_MAX_SIZE
+
+Публичные чтения (connection(replica=True)) идут в DATABASE_REPLICA_URL, если реплика задана,
+доступна и отстаёт не больше DB_REPLICA_MAX_LAG; иначе, как и все записи, - в DATABASE_URL
+'''
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+import instrumentation
+import runtime
+
+# psycopg2 грузит libpq; OPTIONS и ответы из кэша обходятся без него
+psycopg2 = runtime.lazy_import('psycopg2')
+psycopg2_extensions = runtime.lazy_import('psycopg2.extensions')
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '5'))
+POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+# Таймаут запроса по умолчанию задаётся при открытии соединения; маршрут может сузить его для своей транзакции
+STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '10000'))
+REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', '5'))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_LAG_CHECK_INTERVAL', '10'))
+REPLICA_RETRY_INTERVAL = float(os.environ.get('DB_REPLICA_RETRY_INTERVAL', '30'))
+# Retry-After ответов 503/504, когда пул занят или запрос оборван statement_timeout
+OVERLOAD_RETRY_AFTER = os.environ.get('DB_OVERLOAD_RETRY_AFTER', '2')
+
+# Реплика без новых записей на мастере тоже "отстаёт" по времени последней транзакции,
+# поэтому при полностью применённом WAL отставание считается нулевым
+REPLICA_LAG_QUERY = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - pg_last_xact_replay_timestamp()), 0)
+    END::float8
+'''
+
+
+class PoolTimeout(Exception):
+    '''Все соединения пула заняты дольше DB_POOL_ACQUIRE_TIMEOUT'''
+
+
+class Pool:
+    '''Соединения с одной базой; адрес берётся из переменной окружения dsn_env при первом открытии'''
+
+    def __init__(self, dsn_env: str):
+        self.dsn_env = dsn_env
+        self._slots = threading.BoundedSemaphore(POOL_MAX_SIZE)
+        self._lock = threading.Lock()
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self._in_use = 0
+        self._counters: Dict[str, int] = {
+            'acquired': 0,
+            'opened': 0,
+            'closed': 0,
+            'reused': 0,
+            'idle_closed': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+            'acquire_timeouts': 0
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _open(self) -> Any:
+        conn = psycopg2.connect(os.environ[self.dsn_env], options=f'-c statement_timeout={STATEMENT_TIMEOUT_MS}')
+        self._count('opened')
+        return conn
+
+    def _close(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._count('closed')
+
+    def _is_healthy(self, conn: Any) -> bool:
+        self._count('health_checks')
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            instrumentation.log('warning', 'db.health_check_failed', pool=self.dsn_env, error=str(e))
+            self._count('health_check_failures')
+            return False
+
+    def _take_idle(self) -> Any:
+        '''Самое свежее простаивающее соединение; просроченные и битые закрываются'''
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                conn, released_at = self._idle.pop()
+
+            idle_for = time.time() - released_at
+            if conn.closed or idle_for > POOL_IDLE_TIMEOUT:
+                self._count('idle_closed')
+                self._close(conn)
+                continue
+            if idle_for > POOL_HEALTH_CHECK_INTERVAL and not self._is_healthy(conn):
+                self._close(conn)
+                continue
+            return conn
+
+    def acquire(self) -> Any:
+        '''Берёт соединение из пула или открывает новое, если свободных нет'''
+        if not self._slots.acquire(timeout=POOL_ACQUIRE_TIMEOUT):
+            self._count('acquire_timeouts')
+            raise PoolTimeout(f'No free DB connection within {POOL_ACQUIRE_TIMEOUT}s')
+
+        try:
+            conn = self._take_idle()
+            if conn is None:
+                conn = self._open()
+            else:
+                self._count('reused')
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._counters['acquired'] += 1
+        return conn
+
+    def release(self, conn: Any, broken: bool = False) -> None:
+        '''Возвращает соединение в пул; незавершённая транзакция откатывается'''
+        try:
+            if not broken and not conn.closed:
+                if conn.get_transaction_status() != psycopg2_extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        broken = True
+            else:
+                broken = True
+
+            if broken:
+                self._close(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.time()))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = dict(self._counters)
+            result['in_use'] = self._in_use
+            result['idle'] = len(self._idle)
+
+        result['max_size'] = POOL_MAX_SIZE
+        result['idle_timeout'] = POOL_IDLE_TIMEOUT
+        result['health_check_interval'] = POOL_HEALTH_CHECK_INTERVAL
+        return result
+
+
+class ReplicaRouter:
+    '''
+    Решает, можно ли читать с реплики: отставание проверяется не чаще DB_REPLICA_LAG_CHECK_INTERVAL
+    на взятом соединении, ошибка подключения выключает реплику на DB_REPLICA_RETRY_INTERVAL
+    '''
+
+    def __init__(self, pool: Pool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._lag = 0.0
+        self._lag_checked_at = 0.0
+        self._down_until = 0.0
+        self._counters: Dict[str, int] = {
+            'replica_reads': 0,
+            'fallback_lagging': 0,
+            'fallback_busy': 0,
+            'fallback_unavailable': 0
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def mark_down(self, error: Exception, now: float) -> None:
+        with self._lock:
+            self._down_until = now + REPLICA_RETRY_INTERVAL
+            self._counters['fallback_unavailable'] += 1
+        instrumentation.log('warning', 'db.replica_unavailable', error=str(error), retry_in=REPLICA_RETRY_INTERVAL)
+
+    def _lag_is_acceptable(self, conn: Any, now: float) -> bool:
+        with self._lock:
+            due = now - self._lag_checked_at >= REPLICA_LAG_CHECK_INTERVAL
+            if due:
+                # одна проверка на интервал, остальные потоки берут прошлое значение
+                self._lag_checked_at = now
+        if due:
+            cur = conn.cursor()
+            cur.execute(REPLICA_LAG_QUERY)
+            lag = float(cur.fetchone()[0])
+            cur.close()
+            conn.rollback()
+            with self._lock:
+                self._lag = lag
+            if lag > REPLICA_MAX_LAG:
+                instrumentation.log('warning', 'db.replica_lagging', lag=round(lag, 1), max_lag=REPLICA_MAX_LAG)
+        return self._lag <= REPLICA_MAX_LAG
+
+    def acquire(self) -> Optional[Any]:
+        '''Соединение с репликой или None, если читать нужно с мастера'''
+        now = time.monotonic()
+        if now < self._down_until:
+            self._count('fallback_unavailable')
+            return None
+
+        try:
+            conn = self.pool.acquire()
+        except PoolTimeout:
+            # реплика жива, просто занята - мастер выручит этот запрос, но не следующие
+            self._count('fallback_busy')
+            return None
+        except Exception as e:
+            self.mark_down(e, now)
+            return None
+
+        try:
+            acceptable = self._lag_is_acceptable(conn, now)
+        except Exception as e:
+            self.pool.release(conn, broken=True)
+            self.mark_down(e, now)
+            return None
+
+        if not acceptable:
+            self.pool.release(conn)
+            self._count('fallback_lagging')
+            return None
+        self._count('replica_reads')
+        return conn
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result: Dict[str, Any] = dict(self._counters)
+            result['lag'] = round(self._lag, 3)
+            result['available'] = time.monotonic() >= self._down_until
+        result['max_lag'] = REPLICA_MAX_LAG
+        result['pool'] = self.pool.stats()
+        return result
+
+
+_primary = Pool('DATABASE_URL')
+_replica = ReplicaRouter(Pool('DATABASE_REPLICA_URL')) if os.environ.get('DATABASE_REPLICA_URL') else None
+
+
+@contextmanager
+def connection(replica: bool = False, statement_timeout: Optional[int] = None) -> Iterator[Any]:
+    '''
+    with db.connection() as conn: соединение из пула на время блока; фазы db_connect и db_query запроса
+    replica=True - только для чтений, которым допустимо отставание реплики (не чтение после своей записи)
+    statement_timeout (мс) действует до конца первой транзакции блока
+    '''
+    with instrumentation.phase('db_connect'):
+        pool = _primary
+        conn = _replica.acquire() if replica and _replica is not None else None
+        if conn is None:
+            conn = _primary.acquire()
+        else:
+            pool = _replica.pool
+    broken = False
+    started = time.perf_counter()
+    try:
+        if statement_timeout and statement_timeout != STATEMENT_TIMEOUT_MS:
+            cur = conn.cursor()
+            cur.execute('SET LOCAL statement_timeout = %s', (statement_timeout,))
+            cur.close()
+        yield conn
+    except psycopg2.Error as e:
+        broken = bool(conn.closed)
+        if broken and pool is not _primary:
+            _replica.mark_down(e, time.monotonic())
+        if isinstance(e, psycopg2_extensions.QueryCanceledError):
+            instrumentation.log('warning', 'db.statement_timeout', pool=pool.dsn_env, timeout=statement_timeout or STATEMENT_TIMEOUT_MS)
+        raise
+    finally:
+        pool.release(conn, broken)
+        instrumentation.add('db_query', time.perf_counter() - started)
+
+
+def public_read(event: Dict[str, Any]) -> bool:
+    '''Чтение без токена администратора можно отдать реплике; админка читает с токеном сразу после своих правок'''
+    return _replica is not None and not runtime.get_header(event, 'X-Auth-Token')
+
+
+def overload_response(error: Exception) -> Optional[Dict[str, Any]]:
+    '''
+    router.recover(db.overload_response): пул занят - 503, запрос оборван statement_timeout - 504, оба с Retry-After
+    Остальные ошибки - None, их обрабатывает платформа
+    '''
+    if isinstance(error, PoolTimeout):
+        return runtime.error(503, 'Database is busy, retry later', {'Retry-After': OVERLOAD_RETRY_AFTER})
+    if isinstance(error, psycopg2_extensions.QueryCanceledError):
+        return runtime.error(504, 'Database query timed out, retry later', {'Retry-After': OVERLOAD_RETRY_AFTER})
+    return None
+
+
+def stats() -> Dict[str, Any]:
+    result = _primary.stats()
+    result['statement_timeout'] = STATEMENT_TIMEOUT_MS
+    if _replica is not None:
+        result['replica'] = _replica.stats()
+    return result
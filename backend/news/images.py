@@ -0,0 +1,275 @@
+'''
+Адаптивные варианты картинок новостей: исходник из image_url (http(s) или data:) уменьшается до IMAGE_WIDTHS
+и кодируется в AVIF и WebP; файлы лежат в IMAGE_CACHE_DIR под хэшем содержимого исходника,
+поэтому одна картинка в нескольких новостях и повторная обработка не кодируются заново
+Кодирование идёт в пуле процессов: запись новости его не ждёт, готовая карта srcset пишется в news.image_variants
+IMAGE_CACHE_DIR - смонтированный в функцию бакет Object Storage, IMAGE_PUBLIC_BASE_URL - его публичный адрес;
+без Pillow или без IMAGE_PUBLIC_BASE_URL конвейер выключен и клиенты получают только image_url
+'''
+import base64
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import threading
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import db
+import instrumentation
+import runtime
+
+# Пул процессов и HTTP-клиент нужны только при обработке картинки, холодный старт их не грузит
+Image = runtime.lazy_import('PIL.Image')
+ImageOps = runtime.lazy_import('PIL.ImageOps')
+multiprocessing = runtime.lazy_import('multiprocessing')
+futures_process = runtime.lazy_import('concurrent.futures.process')
+urllib_request = runtime.lazy_import('urllib.request')
+
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', '/tmp/news-images')
+IMAGE_PUBLIC_BASE_URL = os.environ.get('IMAGE_PUBLIC_BASE_URL', '').rstrip('/')
+IMAGE_WIDTHS = tuple(sorted({int(width) for width in os.environ.get('IMAGE_WIDTHS', '320,640,960').split(',')}))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '1'))
+IMAGE_FETCH_TIMEOUT = float(os.environ.get('IMAGE_FETCH_TIMEOUT', '10'))
+IMAGE_MAX_SOURCE_BYTES = int(os.environ.get('IMAGE_MAX_SOURCE_BYTES', str(10 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', '40000000'))
+# file:// только для локальных прогонов на файлах-образцах: в проде URL приходит из админки
+IMAGE_ALLOW_FILE_URLS = os.environ.get('IMAGE_ALLOW_FILE_URLS', '0') == '1'
+
+# Порядок - порядок <source> в <picture>: браузер берёт первый поддерживаемый формат
+FORMATS: Dict[str, Dict[str, Any]] = {
+    'avif': {'quality': int(os.environ.get('IMAGE_AVIF_QUALITY', '50')), 'speed': 6},
+    'webp': {'quality': int(os.environ.get('IMAGE_WEBP_QUALITY', '75')), 'method': 4}
+}
+
+EXIF_ORIENTATION = 0x0112
+
+# Варианты актуальны, пока source совпадает с md5(image_url); выражение для SELECT вместо image_variants
+SRCSET_SQL = "CASE WHEN image_variants->>'source' = md5(image_url) THEN image_variants->'srcset' END"
+
+
+def source_key(image_url: str) -> str:
+    '''Совпадает с md5(image_url) в Postgres'''
+    return hashlib.md5(image_url.encode('utf-8')).hexdigest()
+
+
+def _fetch(image_url: str) -> bytes:
+    if image_url.startswith('data:'):
+        header, _, data = image_url.partition(',')
+        if not header.endswith(';base64'):
+            raise ValueError('Only base64 data URLs are supported')
+        source = base64.b64decode(data)
+    else:
+        if not image_url.startswith(('http://', 'https://')) and not (IMAGE_ALLOW_FILE_URLS and image_url.startswith('file://')):
+            raise ValueError('Unsupported image URL scheme')
+        request = urllib_request.Request(image_url, headers={'User-Agent': 'news-images/1.0'})
+        with urllib_request.urlopen(request, timeout=IMAGE_FETCH_TIMEOUT) as response:
+            source = response.read(IMAGE_MAX_SOURCE_BYTES + 1)
+    if len(source) > IMAGE_MAX_SOURCE_BYTES:
+        raise ValueError(f'Image is larger than {IMAGE_MAX_SOURCE_BYTES} bytes')
+    return source
+
+
+def _widths(source_width: int) -> List[int]:
+    '''Ширины из IMAGE_WIDTHS меньше исходной плюс сама исходная, если она меньше наибольшей; без увеличения'''
+    widths = [width for width in IMAGE_WIDTHS if width < source_width]
+    if source_width <= IMAGE_WIDTHS[-1]:
+        widths.append(source_width)
+    return widths
+
+
+def _save(image: Any, path: str, image_format: str) -> None:
+    '''Запись через временный файл: параллельный процесс не увидит недописанный вариант'''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    image.save(temporary, format=image_format.upper(), **FORMATS[image_format])
+    os.replace(temporary, path)
+
+
+def supported_formats() -> List[str]:
+    Image.init()
+    return [image_format for image_format in FORMATS if image_format.upper() in Image.SAVE]
+
+
+def render(image_url: str) -> Dict[str, Any]:
+    '''
+    Выполняется в процессе пула: скачивает исходник и кодирует недостающие варианты
+    Returns: значение для image_variants - source, размеры исходника и srcset по форматам
+    '''
+    source = _fetch(image_url)
+    digest = hashlib.sha256(source).hexdigest()[:32]
+    formats = supported_formats()
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+    with Image.open(io.BytesIO(source)) as opened:
+        # размеры в ориентации показа: EXIF 5-8 поворачивает кадр на 90 градусов
+        rotated = opened.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8)
+        source_width, source_height = (opened.height, opened.width) if rotated else opened.size
+        largest = _widths(source_width)[-1]
+        scaled = (largest, max(1, round(source_height * largest / source_width)))
+        # JPEG декодируется сразу в уменьшенном масштабе, если наибольший вариант это позволяет
+        opened.draft('RGB', scaled[::-1] if rotated else scaled)
+        image = ImageOps.exif_transpose(opened)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+        width, height = image.size
+        widths = _widths(width)
+
+        srcset: Dict[str, List[str]] = {image_format: [] for image_format in formats}
+        # от большей ширины к меньшей; каждый размер считается один раз для всех форматов
+        for target_width in reversed(widths):
+            names = {
+                image_format: f'{digest[:2]}/{digest}-{target_width}-q{FORMATS[image_format]["quality"]}.{image_format}'
+                for image_format in formats
+            }
+            missing = [image_format for image_format, name in names.items() if not os.path.exists(os.path.join(IMAGE_CACHE_DIR, name))]
+            if missing:
+                target_height = max(1, round(height * target_width / width))
+                resized = image if target_width == width else image.resize((target_width, target_height), Image.Resampling.LANCZOS)
+                for image_format in missing:
+                    _save(resized, os.path.join(IMAGE_CACHE_DIR, names[image_format]), image_format)
+            for image_format, name in names.items():
+                srcset[image_format].insert(0, f'{IMAGE_PUBLIC_BASE_URL}/{name} {target_width}w')
+
+    return {
+        'source': source_key(image_url),
+        'width': source_width,
+        'height': source_height,
+        'srcset': {image_format: ', '.join(entries) for image_format, entries in srcset.items()}
+    }
+
+
+_enabled: Optional[bool] = None
+_executor: Any = None
+_lock = threading.Lock()
+_pending: Dict[int, Future] = {}
+_counters: Dict[str, int] = {'scheduled': 0, 'stored': 0, 'superseded': 0, 'failed': 0}
+
+
+def enabled() -> bool:
+    global _enabled
+    if _enabled is None:
+        _enabled = bool(IMAGE_PUBLIC_BASE_URL) and importlib.util.find_spec('PIL') is not None
+    return _enabled
+
+
+def _submit(image_url: str) -> Future:
+    '''
+    Пул создаётся при первой картинке: импорт модуля и OPTIONS его не ждут
+    forkserver, а не fork: в инстансе уже работают потоки (пулы, опрос, колбэки), и fork копирует
+    захваченные ими блокировки в дочерний процесс, который может на них зависнуть; процессы пула
+    форкаются от однопоточного сервера, который заранее импортирует этот модуль
+    Пул с упавшим процессом (например, по памяти на огромной картинке) пересоздаётся
+    '''
+    global _executor
+    for _ in range(2):
+        with _lock:
+            if _executor is None:
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+                _executor = futures_process.ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=context)
+            executor = _executor
+        try:
+            return executor.submit(render, image_url)
+        except futures_process.BrokenProcessPool:
+            instrumentation.log('warning', 'images.pool_restarted')
+            with _lock:
+                if _executor is executor:
+                    _executor = None
+    raise futures_process.BrokenProcessPool('Image pool failed to restart')
+
+
+def _store(news_id: int, image_url: str, future: Future, on_stored: Callable[[], None]) -> None:
+    '''Колбэк готовности: ошибка кодирования тоже записывается, чтобы картинку не пытались обработать снова'''
+    with _lock:
+        if _pending.get(news_id) is future:
+            del _pending[news_id]
+    try:
+        variants = future.result()
+    except Exception as e:
+        instrumentation.log('warning', 'images.render_failed', news_id=news_id, error=f'{type(e).__name__}: {e}')
+        variants = {'source': source_key(image_url), 'error': str(e)[:200]}
+        counter = 'failed'
+    else:
+        counter = 'stored'
+
+    try:
+        with db.connection() as conn:
+            cur = conn.cursor()
+            # картинку успели сменить - результат для старого URL не нужен
+            cur.execute('''
+                UPDATE news SET image_variants = %s::jsonb, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND md5(image_url) = %s
+            ''', (json.dumps(variants), news_id, variants['source']))
+            stored = cur.rowcount
+            conn.commit()
+            cur.close()
+    except Exception as e:
+        instrumentation.log('warning', 'images.store_failed', news_id=news_id, error=str(e))
+        return
+
+    with _lock:
+        _counters[counter if stored else 'superseded'] += 1
+    if stored:
+        on_stored()
+
+
+def schedule(news_id: int, image_url: Optional[str], on_stored: Callable[[], None]) -> Optional[Future]:
+    '''
+    Ставит картинку новости в пул и сразу возвращается
+    Returns: future, завершающийся после записи результата в базу; None, если обрабатывать нечего
+    '''
+    if not image_url or not enabled():
+        return None
+    rendered = _submit(image_url)
+    stored: Future = Future()
+    with _lock:
+        _pending[news_id] = rendered
+        _counters['scheduled'] += 1
+
+    def finish(done: Future) -> None:
+        try:
+            _store(news_id, image_url, done, on_stored)
+        finally:
+            stored.set_result(None)
+
+    rendered.add_done_callback(finish)
+    return stored
+
+
+def process_pending(limit: int, timeout: float, on_stored: Callable[[], None]) -> Dict[str, Any]:
+    '''
+    Новости без актуальных вариантов (новые, после bulk-записи или смены картинки, не дождавшиеся пула
+    из-за заморозки инстанса); ждёт до timeout секунд, 0 - только поставить в пул
+    '''
+    if not enabled():
+        return {'enabled': False}
+
+    with _lock:
+        busy = list(_pending)
+    with db.connection() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT id, image_url FROM news
+            WHERE image_url <> '' AND image_variants->>'source' IS DISTINCT FROM md5(image_url)
+                AND NOT id = ANY(%s::int[])
+            ORDER BY id DESC
+            LIMIT %s
+        ''', (busy, limit))
+        rows: List[Tuple[int, str]] = cur.fetchall()
+        cur.close()
+
+    futures = [future for future in (schedule(news_id, image_url, on_stored) for news_id, image_url in rows) if future]
+    done, not_done = wait(futures, timeout=timeout) if futures and timeout > 0 else (set(), futures)
+    return {'enabled': True, 'scheduled': len(futures), 'done': len(done), 'pending': len(not_done)}
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        result: Dict[str, Any] = dict(_counters)
+        result['in_progress'] = len(_pending)
+    result['enabled'] = enabled()
+    result['widths'] = list(IMAGE_WIDTHS)
+    result['workers'] = IMAGE_WORKERS
+    return result
@@ -1,147 +1,380 @@
+import time
+_import_started = time.perf_counter()
+
+import html
 import json
 import os
-import psycopg2
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+
+import bulk
+import db
+import images
+import instrumentation
+import runtime
+import snapshots
+import tokens
+from http_cache import is_not_modified, not_modified_response, table_version, validators
+from pagination import cursor_date, cursor_float, cursor_int, decode_cursor, encode_cursor, parse_fields, parse_limit
+
+NEWS_FIELDS = ('id', 'title', 'excerpt', 'content', 'image_url', 'image_srcset', 'published_date')
+# Поля, которые не колонки таблицы
+NEWS_FIELD_SQL = {'image_srcset': f'{images.SRCSET_SQL} AS image_srcset'}
+NEWS_MAX_LIMIT = 100
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+SEARCH_MAX_QUERY_LENGTH = 200
+PUBLIC_READ_TIMEOUT_MS = int(os.environ.get('PUBLIC_READ_TIMEOUT_MS', '3000'))
+SEARCH_TIMEOUT_MS = int(os.environ.get('SEARCH_TIMEOUT_MS', '2000'))
+IMAGE_BATCH_SIZE = int(os.environ.get('IMAGE_BATCH_SIZE', '20'))
+IMAGE_BATCH_DEADLINE = float(os.environ.get('IMAGE_BATCH_DEADLINE', '25'))
+# ts_headline размечает совпадения управляющими символами: текст новости экранируется уже после разметки,
+# а маркеры заменяются на <mark> - так разметка из самой новости не попадает в ответ как HTML
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_STOP = '\x03'
+SEARCH_TITLE_HEADLINE_OPTIONS = f'HighlightAll=true, StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_STOP}"'
+SEARCH_HEADLINE_OPTIONS = f'StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_STOP}", MaxFragments=2, MaxWords=30, MinWords=10, FragmentDelimiter=" … "'
+
+NEWS_TABLE = bulk.Table('news', {
+    'title': bulk.Field(bulk.parse_text, 'text'),
+    'excerpt': bulk.Field(bulk.parse_text, 'text'),
+    'content': bulk.Field(bulk.parse_text, 'text', default=''),
+    'image_url': bulk.Field(bulk.parse_text, 'text', default=''),
+    'published_date': bulk.Field(bulk.parse_date, 'date', insert_sql='COALESCE(%s::date, CURRENT_DATE)')
+}, required=('title', 'excerpt'))
+
+router = runtime.Router('GET, POST, PUT, DELETE')
+router.recover(db.overload_response)
+
 
+@instrumentation.instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Управление новостями
-    Args: event - httpMethod GET/POST/PUT/DELETE
+    Args: event - httpMethod GET/POST/PUT/DELETE; GET: id, либо limit/cursor/fields для списка,
+          либо action=search с q/limit/cursor для полнотекстового поиска
+          POST/PUT/DELETE требуют токен из auth в X-Auth-Token;
+          событие таймер-триггера обрабатывает картинки, у которых ещё нет вариантов
     Returns: HTTP response с данными или результатом
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
+    if 'httpMethod' not in event and event.get('messages'):
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
+            'body': json.dumps(images.process_pending(IMAGE_BATCH_SIZE, IMAGE_BATCH_DEADLINE, snapshots.invalidate)),
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
+    return router.dispatch(event)
+
+
+@router.route('GET', 'stats')
+def get_stats(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    return runtime.json_response({'db_pool': db.stats(), 'snapshots': snapshots.stats(), 'images': images.stats()})
+
+
+@router.route('GET', 'metrics')
+def get_metrics(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    return runtime.json_response(instrumentation.metrics())
+
+
+@router.route('GET')
+def list_news(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    if params.get('id'):
+        return get_news_item(event, params)
+    
+    try:
+        fields = parse_fields(params.get('fields'), NEWS_FIELDS)
+        limit = parse_limit(params.get('limit'), NEWS_MAX_LIMIT)
+        cursor = decode_cursor(params.get('cursor'), (cursor_date, cursor_int))
+    except ValueError as e:
+        return runtime.error(400, str(e))
     
-    if method == 'GET':
-        cur.execute('''
-            SELECT id, title, excerpt, content, image_url, published_date 
-            FROM news 
-            ORDER BY published_date DESC
-        ''')
-        rows = cur.fetchall()
-        news_items = []
-        for row in rows:
-            news_items.append({
-                'id': row[0],
-                'title': row[1],
-                'excerpt': row[2],
-                'content': row[3],
-                'image_url': row[4],
-                'published_date': str(row[5]) if row[5] else None
-            })
+    columns = [field for field in NEWS_FIELDS if field in fields or field in ('id', 'published_date')]
+    query = f'SELECT {", ".join(NEWS_FIELD_SQL.get(column, column) for column in columns)} FROM news'
+    query_args: List[Any] = []
+    if cursor:
+        query += ' WHERE (published_date, id) < (%s::date, %s)'
+        query_args.extend(cursor)
+    query += ' ORDER BY published_date DESC, id DESC'
+    if limit:
+        query += ' LIMIT %s'
+        query_args.append(limit + 1)
+    
+    with db.connection(replica=db.public_read(event), statement_timeout=PUBLIC_READ_TIMEOUT_MS) as conn:
+        cur = conn.cursor()
+        cache_headers = validators(table_version(cur, 'news'), params)
+        if is_not_modified(event, cache_headers):
+            cur.close()
+            return not_modified_response(cache_headers)
         
+        snapshot = snapshots.get(cache_headers['ETag'])
+        if snapshot is None:
+            cur.execute(query, query_args)
+            rows = cur.fetchall()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'news': news_items}),
-            'isBase64Encoded': False
-        }
     
-    if method == 'POST':
-        body_data = json.loads(event.get('body', '{}'))
-        title = body_data.get('title')
-        excerpt = body_data.get('excerpt')
-        content = body_data.get('content', '')
-        image_url = body_data.get('image_url', '')
-        published_date = body_data.get('published_date')
+    response_headers = {**runtime.JSON_HEADERS, **cache_headers}
+    if snapshot is not None:
+        return snapshots.respond(snapshot, event, response_headers)
+    
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last = dict(zip(columns, rows[-1]))
+        next_cursor = encode_cursor([str(last['published_date']), last['id']])
+    
+    news_items = []
+    for row in rows:
+        record = dict(zip(columns, row))
+        record['published_date'] = str(record['published_date']) if record['published_date'] else None
+        news_items.append({field: record[field] for field in columns if field in fields or field == 'id'})
+    
+    snapshot = snapshots.put(cache_headers['ETag'], {'news': news_items, 'next_cursor': next_cursor})
+    return snapshots.respond(snapshot, event, response_headers)
+
+
+def highlight_html(text: str) -> str:
+    '''Вывод ts_headline с маркерами HIGHLIGHT_* -> экранированный HTML с <mark>'''
+    return html.escape(text).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>')
+
+
+@router.route('GET', 'search')
+def search_news(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Полнотекстовый поиск по search_vector (GIN): q в синтаксисе websearch ("фраза", -исключить, or),
+    результаты по убыванию ts_rank, keyset-пагинация по (rank, published_date, id)
+    headline и snippet - HTML-экранированный текст, в котором только совпадения обёрнуты в <mark>
+    ts_headline считается только для строк страницы
+    '''
+    search_query = (params.get('q') or '').strip()
+    if not search_query:
+        return runtime.error(400, 'q parameter required')
+    if len(search_query) > SEARCH_MAX_QUERY_LENGTH:
+        return runtime.error(400, f'q must be at most {SEARCH_MAX_QUERY_LENGTH} characters')
+    
+    try:
+        limit = parse_limit(params.get('limit'), SEARCH_MAX_LIMIT, SEARCH_DEFAULT_LIMIT)
+        cursor = decode_cursor(params.get('cursor'), (cursor_float, cursor_date, cursor_int))
+    except ValueError as e:
+        return runtime.error(400, str(e))
+    
+    query_args: List[Any] = [SEARCH_TITLE_HEADLINE_OPTIONS, SEARCH_HEADLINE_OPTIONS, search_query]
+    cursor_condition = ''
+    if cursor:
+        cursor_condition = 'WHERE (rank, published_date, id) < (%s::float8, %s::date, %s)'
+        query_args.extend(cursor)
+    query_args.append(limit + 1)
+    
+    with db.connection(replica=db.public_read(event), statement_timeout=SEARCH_TIMEOUT_MS) as conn:
+        cur = conn.cursor()
+        cache_headers = validators(table_version(cur, 'news'), params)
+        if is_not_modified(event, cache_headers):
+            cur.close()
+            return not_modified_response(cache_headers)
         
+        snapshot = snapshots.get(cache_headers['ETag'])
+        if snapshot is None:
+            cur.execute(f'''
+                SELECT id, title,
+                       ts_headline('russian', title, query, %s),
+                       excerpt,
+                       ts_headline('russian', COALESCE(NULLIF(content, ''), excerpt, ''), query, %s),
+                       image_url, published_date, rank
+                FROM (
+                    SELECT * FROM (
+                        SELECT id, title, excerpt, content, image_url, published_date, query,
+                               ts_rank(search_vector, query)::float8 AS rank
+                        FROM news, websearch_to_tsquery('russian', %s) AS query
+                        WHERE search_vector @@ query
+                    ) AS matches
+                    {cursor_condition}
+                    ORDER BY rank DESC, published_date DESC, id DESC
+                    LIMIT %s
+                ) AS page
+                ORDER BY rank DESC, published_date DESC, id DESC
+            ''', query_args)
+            rows = cur.fetchall()
+        cur.close()
+    
+    response_headers = {**runtime.JSON_HEADERS, **cache_headers}
+    if snapshot is not None:
+        return snapshots.respond(snapshot, event, response_headers)
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last[7], str(last[6]), last[0]])
+    
+    results = []
+    for row in rows:
+        results.append({
+            'id': row[0],
+            'title': row[1],
+            'headline': highlight_html(row[2]),
+            'excerpt': row[3],
+            'snippet': highlight_html(row[4]),
+            'image_url': row[5],
+            'published_date': str(row[6]) if row[6] else None,
+            'rank': row[7]
+        })
+    
+    snapshot = snapshots.put(cache_headers['ETag'], {'results': results, 'next_cursor': next_cursor})
+    return snapshots.respond(snapshot, event, response_headers)
+
+
+@router.route('POST')
+@tokens.admin_required
+def create_news(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    body_data = json.loads(event.get('body', '{}'))
+    title = body_data.get('title')
+    excerpt = body_data.get('excerpt')
+    content = body_data.get('content', '')
+    image_url = body_data.get('image_url', '')
+    published_date = body_data.get('published_date')
+    
+    with db.connection() as conn:
+        cur = conn.cursor()
         cur.execute('''
             INSERT INTO news (title, excerpt, content, image_url, published_date)
-            VALUES (%s, %s, %s, %s, %s)
+            VALUES (%s, %s, %s, %s, COALESCE(%s, CURRENT_DATE))
             RETURNING id
         ''', (title, excerpt, content, image_url, published_date))
-        
+    
         new_id = cur.fetchone()[0]
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'success': True, 'id': new_id}),
-            'isBase64Encoded': False
-        }
+    snapshots.invalidate()
+    schedule_image(new_id, image_url)
     
-    if method == 'PUT':
-        body_data = json.loads(event.get('body', '{}'))
-        news_id = body_data.get('id')
-        title = body_data.get('title')
-        excerpt = body_data.get('excerpt')
-        content = body_data.get('content', '')
-        image_url = body_data.get('image_url', '')
-        published_date = body_data.get('published_date')
-        
+    return runtime.json_response({'success': True, 'id': new_id}, 201)
+
+
+@router.route('PUT')
+@tokens.admin_required
+def update_news(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    body_data = json.loads(event.get('body', '{}'))
+    news_id = body_data.get('id')
+    title = body_data.get('title')
+    excerpt = body_data.get('excerpt')
+    content = body_data.get('content', '')
+    image_url = body_data.get('image_url', '')
+    published_date = body_data.get('published_date')
+    
+    with db.connection() as conn:
+        cur = conn.cursor()
         cur.execute('''
             UPDATE news 
             SET title = %s, excerpt = %s, content = %s, 
-                image_url = %s, published_date = %s, updated_at = CURRENT_TIMESTAMP
+                image_url = %s, published_date = COALESCE(%s, published_date), updated_at = CURRENT_TIMESTAMP
             WHERE id = %s
+            RETURNING image_variants->>'source' IS DISTINCT FROM md5(image_url)
         ''', (title, excerpt, content, image_url, published_date, news_id))
-        
+        row = cur.fetchone()
+    
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'success': True}),
-            'isBase64Encoded': False
-        }
+    snapshots.invalidate()
+    if row and row[0]:
+        schedule_image(news_id, image_url)
     
-    if method == 'DELETE':
-        body_data = json.loads(event.get('body', '{}'))
-        news_id = body_data.get('id')
-        
+    return runtime.json_response({'success': True})
+
+
+@router.route('DELETE')
+@tokens.admin_required
+def delete_news(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    body_data = json.loads(event.get('body', '{}'))
+    news_id = body_data.get('id')
+    
+    with db.connection() as conn:
+        cur = conn.cursor()
         cur.execute('DELETE FROM news WHERE id = %s', (news_id,))
         conn.commit()
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'success': True}),
-            'isBase64Encoded': False
-        }
+    snapshots.invalidate()
+    
+    return runtime.json_response({'success': True})
+
+
+@router.route('POST', 'bulk')
+@tokens.admin_required
+def bulk_write(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    body_data = json.loads(event.get('body') or '{}')
+    operations = body_data.get('operations') if isinstance(body_data, dict) else body_data
+    return bulk.write(NEWS_TABLE, operations, after_bulk_write)
+
+
+@router.route('POST', 'import')
+@tokens.admin_required
+def import_news(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    if params.get('format', 'csv') != 'csv':
+        return runtime.error(400, 'format must be csv')
     
-    cur.close()
-    conn.close()
+    try:
+        operations = bulk.parse_csv(bulk.request_text(event))
+    except ValueError as e:
+        return runtime.error(400, f'Invalid csv file: {e}')
     
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
+    return bulk.write(NEWS_TABLE, operations, after_bulk_write)
+
+
+def schedule_image(news_id: int, image_url: Optional[str]) -> None:
+    '''
+    Запись уже закоммичена: сбой пула или плохой URL не должен превращать её в 500, иначе повтор из админки
+    создаст дубль; необработанную картинку подберёт process_pending по таймеру
+    '''
+    try:
+        images.schedule(news_id, image_url, snapshots.invalidate)
+    except Exception as e:
+        instrumentation.log('warning', 'images.schedule_failed', news_id=news_id, error=f'{type(e).__name__}: {e}')
+
+
+def after_bulk_write() -> None:
+    '''Картинки новых и изменённых строк ставятся в пул без ожидания, остальное доделает таймер'''
+    snapshots.invalidate()
+    try:
+        images.process_pending(IMAGE_BATCH_SIZE, 0, snapshots.invalidate)
+    except Exception as e:
+        instrumentation.log('warning', 'images.schedule_failed', error=f'{type(e).__name__}: {e}')
+
+
+def get_news_item(event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Полная новость по id для страницы статьи'''
+    try:
+        news_id = int(params['id'])
+    except ValueError:
+        news_id = None
+    
+    row = None
+    if news_id is not None:
+        with db.connection(replica=db.public_read(event), statement_timeout=PUBLIC_READ_TIMEOUT_MS) as conn:
+            cur = conn.cursor()
+            cur.execute(f'''
+                SELECT id, title, excerpt, content, image_url, published_date, updated_at, {images.SRCSET_SQL}
+                FROM news
+                WHERE id = %s
+            ''', (news_id,))
+            row = cur.fetchone()
+            cur.close()
+    
+    if not row:
+        return runtime.error(404, 'News not found')
+    
+    cache_headers = validators((1, row[6]), params, collection=False)
+    if is_not_modified(event, cache_headers):
+        return not_modified_response(cache_headers)
+    
+    return runtime.json_response({
+        'article': {
+            'id': row[0],
+            'title': row[1],
+            'excerpt': row[2],
+            'content': row[3],
+            'image_url': row[4],
+            'image_srcset': row[7],
+            'published_date': str(row[5]) if row[5] else None
+        }
+    }, headers=cache_headers)
+
+
+instrumentation.imported(_import_started)
@@ -0,0 +1,79 @@
+'''
+Keyset-пагинация списков: лимит, непрозрачный курсор и проекция полей
+'''
+import base64
+import json
+import math
+from datetime import date, time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+
+def parse_limit(value: Optional[str], max_limit: int, default: Optional[int] = None) -> Optional[int]:
+    '''limit из query string, не больше max_limit; None - без ограничения'''
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = 0
+    if limit < 1:
+        # текст ошибки int() с эхом запроса клиенту не отдаётся
+        raise ValueError(f'limit must be an integer between 1 and {max_limit}')
+    return min(limit, max_limit)
+
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def cursor_int(value: Any) -> int:
+    if type(value) is not int:
+        raise ValueError('not an integer')
+    return value
+
+
+def cursor_float(value: Any) -> float:
+    if type(value) not in (int, float) or not math.isfinite(value):
+        raise ValueError('not a finite number')
+    return float(value)
+
+
+def cursor_date(value: Any) -> date:
+    if not isinstance(value, str):
+        raise ValueError('not a date')
+    return date.fromisoformat(value)
+
+
+def cursor_time(value: Any) -> time:
+    if not isinstance(value, str):
+        raise ValueError('not a time')
+    return time.fromisoformat(value)
+
+
+def decode_cursor(value: Optional[str], parsers: Sequence[Callable[[Any], Any]]) -> Optional[List[Any]]:
+    '''
+    Значения ключа сортировки последней отданной строки, разобранные по одному парсеру на элемент:
+    курсор приходит от клиента, и любое несовпадение типов - 400, а не ошибка приведения типов в базе
+    '''
+    if not value:
+        return None
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError('wrong size')
+        return [parse(item) for parse, item in zip(parsers, values)]
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+
+def parse_fields(value: Optional[str], allowed: Sequence[str]) -> Tuple[str, ...]:
+    '''fields=a,b,c из разрешённого списка; по умолчанию все поля'''
+    if not value:
+        return tuple(allowed)
+    fields = tuple(field.strip() for field in value.split(',') if field.strip())
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return fields
@@ -0,0 +1,101 @@
+'''
+Подписанные токены администратора: выдаёт auth, проверяют пишущие маршруты без обращения к базе
+Формат как у JWT HS256: base64url(заголовок).base64url(данные).base64url(HMAC-SHA256), в заголовке kid ключа
+Функции в backend/* деплоятся по отдельности, поэтому модуль лежит копией в каждой из них
+
+AUTH_TOKEN_KEYS - "kid:секрет,kid:секрет": первым ключом подписываются новые токены, остальные только проверяются,
+поэтому ротация - добавить новый ключ первым, а старый убрать после AUTH_TOKEN_TTL
+'''
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from functools import wraps
+from typing import Any, Dict, Optional
+
+import instrumentation
+import runtime
+
+TOKEN_TTL = int(os.environ.get('AUTH_TOKEN_TTL', '43200'))
+CLOCK_SKEW = int(os.environ.get('AUTH_TOKEN_CLOCK_SKEW', '30'))
+HEADER_NAME = 'X-Auth-Token'
+
+
+def _parse_keys(spec: str) -> Dict[str, 'hmac.HMAC']:
+    '''kid -> HMAC с уже загруженным ключом; на проверку его копия дешевле, чем новый hmac.new'''
+    keys: Dict[str, 'hmac.HMAC'] = {}
+    for item in spec.split(','):
+        kid, _, secret = item.strip().partition(':')
+        if kid and secret:
+            keys[kid] = hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha256)
+    return keys
+
+
+_keys = _parse_keys(os.environ.get('AUTH_TOKEN_KEYS', ''))
+_signing_kid: Optional[str] = next(iter(_keys), None)
+
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(kid: str, signing_input: str) -> bytes:
+    mac = _keys[kid].copy()
+    mac.update(signing_input.encode('ascii'))
+    return mac.digest()
+
+
+def enabled() -> bool:
+    return _signing_kid is not None
+
+
+def issue(subject: str = 'admin', ttl: int = TOKEN_TTL) -> Dict[str, Any]:
+    '''Новый токен и момент его истечения (unix time); ValueError, если ключи не заданы'''
+    if _signing_kid is None:
+        raise ValueError('AUTH_TOKEN_KEYS is not configured')
+
+    now = int(time.time())
+    header = _encode(json.dumps({'alg': 'HS256', 'typ': 'JWT', 'kid': _signing_kid}, separators=(',', ':')).encode('utf-8'))
+    claims = {'sub': subject, 'iat': now, 'exp': now + ttl}
+    payload = _encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    signing_input = f'{header}.{payload}'
+    return {'token': f'{signing_input}.{_encode(_sign(_signing_kid, signing_input))}', 'expires_at': claims['exp']}
+
+
+def verify(token: str) -> Optional[Dict[str, Any]]:
+    '''Данные токена, если подпись верна и срок не истёк, иначе None'''
+    try:
+        header_part, payload_part, signature_part = token.split('.')
+        header = json.loads(_decode(header_part))
+        kid = header.get('kid')
+        if header.get('alg') != 'HS256' or kid not in _keys:
+            return None
+        expected = _sign(kid, f'{header_part}.{payload_part}')
+        if not hmac.compare_digest(expected, _decode(signature_part)):
+            return None
+        claims = json.loads(_decode(payload_part))
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+    now = time.time()
+    if not isinstance(claims, dict) or claims.get('exp', 0) + CLOCK_SKEW < now or claims.get('iat', 0) - CLOCK_SKEW > now:
+        return None
+    return claims
+
+
+def admin_required(route: runtime.Route) -> runtime.Route:
+    '''Маршрут отвечает 401 без действующего токена в X-Auth-Token'''
+    @wraps(route)
+    def wrapper(event: runtime.Event, params: Dict[str, Any]) -> runtime.Response:
+        token = runtime.get_header(event, HEADER_NAME)
+        if not token or verify(token) is None:
+            instrumentation.log('warning', 'auth.token_rejected', present=bool(token))
+            return runtime.error(401, 'Invalid or expired token')
+        return route(event, params)
+    return wrapper
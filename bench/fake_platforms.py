@@ -0,0 +1,118 @@
+'''
+Локальный фейковый Kick / Twitch / VK для бенчмарков с настраиваемой задержкой и долей отказов
+Страницы Twitch и VK берутся из bench/corpus, ответы Kick API генерируются; канал "в эфире",
+если его номер делится на live_every (kick-0, kick-3, ... при live_every=3)
+'''
+import gzip
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+CHANNEL_NUMBER = re.compile(r'(\d+)')
+
+
+def _load(name: str) -> bytes:
+    with gzip.open(os.path.join(CORPUS, name)) as f:
+        return f.read()
+
+
+class FakePlatforms:
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 20.0, failure_rate: float = 0.0, live_every: int = 2):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.live_every = live_every
+        self.hits: Counter = Counter()
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._pages = {
+            'twitch_live': _load('twitch_live.html.gz'),
+            'twitch_offline': _load('twitch_offline.html.gz'),
+            'vk_live': _load('vk_video_ext_live.html.gz'),
+            'vk_offline': _load('vk_video_ext_unavailable.html.gz')
+        }
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+
+    def is_live(self, channel: str) -> bool:
+        match = CHANNEL_NUMBER.search(channel)
+        return bool(match) and int(match.group(1)) % self.live_every == 0
+
+    def _respond(self, path: str):
+        '''(platform, status, content type, body)'''
+        if path.startswith('/api/v2/channels/'):
+            channel = path.split('/')[4]
+            data = {'playback_url': f'https://fake-cdn.local/kick/{channel}/master.m3u8'} if self.is_live(channel) else None
+            return 'kick', 200, 'application/json', json.dumps({'data': data}).encode('utf-8')
+        if path.startswith('/video_ext.php'):
+            live = self.is_live(parse_qs(urlsplit(path).query).get('id', [''])[0])
+            return 'vk', 200, 'text/html', self._pages['vk_live' if live else 'vk_offline']
+        channel = path.strip('/').split('?')[0]
+        return 'twitch', 200, 'text/html', self._pages['twitch_live' if self.is_live(channel) else 'twitch_offline']
+
+    def start(self) -> str:
+        platforms = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self) -> None:
+                super().setup()
+                with platforms._lock:
+                    platforms.connections += 1
+
+            def handle(self) -> None:
+                # резолверы закрывают соединение, не дочитав страницу
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def do_GET(self) -> None:
+                platform, status, content_type, body = platforms._respond(self.path)
+                delay = max(0.0, random.gauss(platforms.latency_ms, platforms.jitter_ms)) / 1000
+                time.sleep(delay)
+                if random.random() < platforms.failure_rate:
+                    status, content_type, body = 503, 'text/plain', b'upstream failure'
+
+                with platforms._lock:
+                    platforms.hits[f'{platform} {status}'] += 1
+
+                if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+                    body = gzip.compress(body, compresslevel=1)
+                    encoding = 'gzip'
+                else:
+                    encoding = None
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                if encoding:
+                    self.send_header('Content-Encoding', encoding)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            result = dict(self.hits)
+            result['requests'] = sum(self.hits.values())
+            result['connections'] = self.connections
+        return result
@@ -0,0 +1,114 @@
+'''
+Проверка HLS-релея broadcasts против локального фейкового HLS-источника
+Источник отдаёт master-плейлист с двумя вариантами и живые media-плейлисты со скользящим окном сегментов;
+зрители в потоках вызывают handler так же, как это делал бы плеер, и опрашивают media-плейлист раз в target duration
+Запуск: python bench/hls_relay.py [зрителей] [секунд]
+'''
+import http.server
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TARGET_DURATION = 2
+
+
+class FakeOrigin(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    hits: Counter = Counter()
+    lock = threading.Lock()
+
+    def do_GET(self) -> None:
+        with self.lock:
+            self.hits[self.path] += 1
+
+        if self.path == '/live/master.m3u8':
+            body = (
+                '#EXTM3U\n'
+                '#EXT-X-STREAM-INF:BANDWIDTH=6000000,RESOLUTION=1920x1080,CODECS="avc1.64002a,mp4a.40.2"\n'
+                '1080p/index.m3u8\n'
+                '#EXT-X-STREAM-INF:BANDWIDTH=1200000,RESOLUTION=852x480,CODECS="avc1.4d401f,mp4a.40.2"\n'
+                '480p/index.m3u8\n'
+            )
+        elif self.path.endswith('/index.m3u8'):
+            sequence = int(time.time() / TARGET_DURATION)
+            segments = ''.join(f'#EXTINF:{TARGET_DURATION}.000,\nseg{number}.ts\n' for number in range(sequence, sequence + 4))
+            body = (
+                '#EXTM3U\n#EXT-X-VERSION:3\n'
+                f'#EXT-X-TARGETDURATION:{TARGET_DURATION}\n#EXT-X-MEDIA-SEQUENCE:{sequence}\n'
+                '#EXT-X-KEY:METHOD=AES-128,URI="../keys/k1.key"\n' + segments
+            )
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_origin() -> str:
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeOrigin)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def relay_get(index, link: str):
+    params = {name: values[0] for name, values in parse_qs(urlsplit(link).query).items()}
+    return index.handler({'httpMethod': 'GET', 'queryStringParameters': params}, None)
+
+
+def viewer(index, master_link: str, duration: float, statuses: Counter) -> None:
+    response = relay_get(index, master_link)
+    statuses[response['statusCode']] += 1
+    media_link = next(line for line in response['body'].splitlines() if line.startswith('?action=hls'))
+
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        response = relay_get(index, media_link)
+        statuses[response['statusCode']] += 1
+        segments = [line for line in response['body'].splitlines() if line and not line.startswith('#')]
+        assert all(segment.startswith('http://127.0.0.1') for segment in segments), segments
+        time.sleep(TARGET_DURATION)
+
+
+def main() -> None:
+    viewers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    origin = start_origin()
+    os.environ.setdefault('DATABASE_URL', 'postgresql://localhost/unused')
+    os.environ['HLS_RELAY_SECRET'] = 'bench-secret'
+    os.environ.setdefault('LOG_SAMPLE_RATE', '0')
+    sys.path.insert(0, os.path.join(ROOT, '..', 'backend', 'broadcasts'))
+    import index
+
+    master_link = index.relay_url(f'{origin}/live/master.m3u8')
+    statuses: Counter = Counter()
+    threads = [threading.Thread(target=viewer, args=(index, master_link, duration, statuses)) for _ in range(viewers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    requests = sum(statuses.values())
+    upstream = sum(FakeOrigin.hits.values())
+    print(f'viewers={viewers} seconds={time.monotonic() - started:.1f} relay_requests={requests} statuses={dict(statuses)}')
+    print(f'upstream_fetches={upstream} ({dict(FakeOrigin.hits)})')
+    print(f'relay_cache={index._playlists.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+'''
+Конвейер картинок новостей на локальных образцах: генерирует фикстуры (JPEG 800x450 как в сиде,
+большой JPEG с EXIF-поворотом, PNG с прозрачностью), прогоняет их через images.render в пуле процессов
+и печатает время, ширины и размер вариантов против исходника; второй прогон проверяет кэш по содержимому
+
+Пример:
+    python bench/images.py
+    python bench/images.py --widths 320,640,960,1280 --workers 2
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+NEWS = os.path.join(ROOT, '..', 'backend', 'news')
+
+
+def make_fixtures(directory: str) -> Dict[str, str]:
+    from PIL import Image, ImageDraw
+
+    def scene(width: int, height: int, mode: str = 'RGB') -> Image.Image:
+        image = Image.new(mode, (width, height), (30, 90, 160, 255) if mode == 'RGBA' else (30, 90, 160))
+        draw = ImageDraw.Draw(image)
+        for step in range(0, width, max(1, width // 24)):
+            draw.ellipse((step, height // 4, step + width // 6, height // 4 + width // 6), fill=(240, 200 - step % 150, 40))
+        return image
+
+    fixtures = {
+        'seed_800x450.jpg': (scene(800, 450), {'quality': 90}),
+        'camera_4000x3000_rotated.jpg': (scene(4000, 3000), {'quality': 92}),
+        'logo_600x600_alpha.png': (scene(600, 600, 'RGBA'), {})
+    }
+    paths = {}
+    for name, (image, options) in fixtures.items():
+        path = os.path.join(directory, name)
+        if 'rotated' in name:
+            exif = Image.Exif()
+            exif[0x0112] = 6
+            options['exif'] = exif
+        image.save(path, **options)
+        paths[name] = path
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--widths', default='320,640,960')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='news-images-')
+    os.environ.update({
+        'IMAGE_CACHE_DIR': os.path.join(work, 'cache'),
+        'IMAGE_PUBLIC_BASE_URL': 'https://images.example',
+        'IMAGE_WIDTHS': args.widths,
+        'IMAGE_ALLOW_FILE_URLS': '1',
+        'DATABASE_URL': os.environ.get('DATABASE_URL', 'postgresql://localhost/unused'),
+        'LOG_SAMPLE_RATE': '0'
+    })
+    sys.path.insert(0, NEWS)
+    import images  # noqa: E402
+
+    fixtures = make_fixtures(work)
+    urls = [f'file://{path}' for path in fixtures.values()]
+    print('formats:', ', '.join(images.supported_formats()) or 'none (Pillow without AVIF/WebP)')
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for label in ('cold', 'cached'):
+            started = time.perf_counter()
+            results = list(executor.map(images.render, urls))
+            print(f'\n{label}: {len(urls)} images in {(time.perf_counter() - started) * 1000:.0f} ms')
+            if label == 'cold':
+                for (name, path), result in zip(fixtures.items(), results):
+                    print(f'  {name}: {os.path.getsize(path) // 1024} KB source, {result["width"]}x{result["height"]}')
+                    for image_format, srcset in result['srcset'].items():
+                        sizes: List[str] = []
+                        for entry in srcset.split(', '):
+                            url, width = entry.split(' ')
+                            file_path = os.path.join(images.IMAGE_CACHE_DIR, url[len(images.IMAGE_PUBLIC_BASE_URL) + 1:])
+                            sizes.append(f'{width} {os.path.getsize(file_path) // 1024} KB')
+                        print(f'    {image_format}: ' + ', '.join(sizes))
+
+    print(f'\nfiles kept in {work}')
+
+
+if __name__ == '__main__':
+    main()
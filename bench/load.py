@@ -0,0 +1,290 @@
+'''
+Нагрузочная симуляция облачных функций в процессе: handler вызывается с синтетическими событиями,
+платформы подменяются локальным FakePlatforms, база - локальный Postgres (BENCH_DATABASE_URL)
+
+Трафик: N зрителей опрашивают get-stream своего канала раз в poll-interval секунд
+и поток открытий главной страницы (один запрос action=home, как Index.tsx; новости приходят в нём же),
+часть которых открывает статью запросом к функции news по id, как openNews в Index.tsx
+Отчёт: пропускная способность, p50/p95/p99 по маршрутам, запросы и соединения к платформам,
+соединения пулов функций и пик соединений в Postgres
+
+Примеры:
+    python bench/load.py --viewers 500 --poll-interval 30 --duration 120
+    BENCH_DATABASE_URL=postgresql://localhost/freesport python bench/load.py --migrate --seed 200 --page-rate 20
+    python bench/load.py --latency-ms 800 --failure-rate 0.3   # деградация платформ
+'''
+import argparse
+import glob
+import heapq
+import importlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(ROOT, '..', 'backend')
+MIGRATIONS = os.path.join(ROOT, '..', 'db_migrations')
+
+sys.path.insert(0, ROOT)
+
+from fake_platforms import FakePlatforms  # noqa: E402
+
+
+def load_function(name: str) -> Dict[str, ModuleType]:
+    '''
+    Импортирует backend/<name>/index.py со всеми его модулями и убирает их из sys.modules,
+    чтобы одноимённые db.py, snapshots.py и т.п. разных функций не пересекались
+    '''
+    directory = os.path.abspath(os.path.join(BACKEND, name))
+    local = {os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(directory, '*.py'))}
+    shadowed = {module: sys.modules.pop(module) for module in local if module in sys.modules}
+
+    sys.path.insert(0, directory)
+    try:
+        importlib.import_module('index')
+    finally:
+        sys.path.remove(directory)
+
+    modules = {module: sys.modules.pop(module) for module in local if module in sys.modules}
+    sys.modules.update(shadowed)
+    return modules
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def call(self, route: str, handler: Callable[[Dict[str, Any], Any], Dict[str, Any]], event: Dict[str, Any]) -> None:
+        started = time.perf_counter()
+        try:
+            status = handler(event, None)['statusCode']
+        except Exception as e:
+            print(f'[Bench] {route} raised {type(e).__name__}: {e}', file=sys.stderr)
+            status = 599
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            self.statuses[route][status] += 1
+
+    def report(self, seconds: float) -> Dict[str, Any]:
+        routes = {}
+        with self._lock:
+            for route, values in sorted(self.latencies.items()):
+                ordered = sorted(values)
+                routes[route] = {
+                    'requests': len(ordered),
+                    'rps': round(len(ordered) / seconds, 2),
+                    'p50_ms': round(percentile(ordered, 0.5), 2),
+                    'p95_ms': round(percentile(ordered, 0.95), 2),
+                    'p99_ms': round(percentile(ordered, 0.99), 2),
+                    'max_ms': round(ordered[-1], 2),
+                    'statuses': dict(self.statuses[route])
+                }
+        return routes
+
+
+class ConnectionSampler(threading.Thread):
+    '''Раз в секунду считает соединения к базе бенчмарка в pg_stat_activity и запоминает пик'''
+
+    def __init__(self, database_url: str):
+        super().__init__(daemon=True)
+        self.database_url = database_url
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def run(self) -> None:
+        import psycopg2
+        conn = psycopg2.connect(self.database_url)
+        conn.autocommit = True
+        cur = conn.cursor()
+        while not self._stop.is_set():
+            cur.execute('SELECT count(*) - 1 FROM pg_stat_activity WHERE datname = current_database()')
+            self.peak = max(self.peak, cur.fetchone()[0])
+            self._stop.wait(1)
+        conn.close()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def prepare_database(database_url: str, migrate: bool, seed: int, channels: List[Tuple[str, str]]) -> None:
+    import psycopg2
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+    if migrate:
+        for path in sorted(glob.glob(os.path.join(MIGRATIONS, 'V*.sql'))):
+            with open(path, encoding='utf-8') as f:
+                cur.execute(f.read())
+        conn.commit()
+
+    if seed:
+        urls = {
+            'kick': 'https://kick.com/{}',
+            'twitch': 'https://www.twitch.tv/{}',
+            'vk': 'https://vk.com/video{}'
+        }
+        rows = []
+        for number in range(seed):
+            platform, channel = channels[number % len(channels)]
+            day = f'2026-{1 + number % 12:02d}-{1 + number % 28:02d}'
+            rows.append((f'Трансляция {number}', urls[platform].format(channel), False, f'{number % 24:02d}:00', day))
+        cur.executemany(
+            'INSERT INTO broadcasts (title, video_url, is_live, scheduled_time, scheduled_date) VALUES (%s, %s, %s, %s, %s)',
+            rows
+        )
+        cur.executemany(
+            'INSERT INTO news (title, excerpt, content, image_url, published_date) VALUES (%s, %s, %s, %s, %s)',
+            [(f'Новость {number}', 'Краткое описание ' * 8, 'Полный текст новости. ' * 200, None, f'2026-01-{1 + number % 28:02d}')
+             for number in range(seed)]
+        )
+        conn.commit()
+    conn.close()
+
+
+def latest_news_ids(database_url: str, limit: int) -> List[int]:
+    '''id новостей, которые главная показывает карточками: из них открываются статьи'''
+    import psycopg2
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+    cur.execute('SELECT id FROM news ORDER BY published_date DESC, id DESC LIMIT %s', (limit,))
+    ids = [row[0] for row in cur.fetchall()]
+    conn.close()
+    return ids
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='In-process load simulation for backend functions')
+    parser.add_argument('--viewers', type=int, default=200)
+    parser.add_argument('--channels', type=int, default=20, help='distinct channels viewers are spread over')
+    parser.add_argument('--platforms', default='kick,twitch,vk')
+    parser.add_argument('--poll-interval', type=float, default=30.0, help='seconds between get-stream polls of one viewer')
+    parser.add_argument('--page-rate', type=float, default=5.0, help='home page loads per second (needs a database)')
+    parser.add_argument('--article-share', type=float, default=0.3, help='share of page loads that open a news article')
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--concurrency', type=int, default=64, help='simulated concurrent function invocations')
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--live-every', type=int, default=2)
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--migrate', action='store_true', help='apply db_migrations before the run')
+    parser.add_argument('--seed', type=int, default=0, help='insert this many broadcasts and news rows')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    platforms = FakePlatforms(args.latency_ms, args.jitter_ms, args.failure_rate, args.live_every)
+    base_url = platforms.start()
+    os.environ.update(KICK_BASE_URL=base_url, TWITCH_BASE_URL=base_url, VK_BASE_URL=base_url)
+    os.environ.setdefault('LOG_SAMPLE_RATE', '0')
+    os.environ['DATABASE_URL'] = args.database_url or 'postgresql://127.0.0.1:1/unavailable'
+
+    names = args.platforms.split(',')
+    channels = []
+    for number in range(args.channels):
+        platform = names[number % len(names)]
+        channels.append((platform, f'-1_{number}' if platform == 'vk' else f'{platform}-{number}'))
+    if args.database_url and (args.migrate or args.seed):
+        prepare_database(args.database_url, args.migrate, args.seed, channels)
+
+    functions = {name: load_function(name) for name in ('broadcasts', 'news')}
+    broadcasts = functions['broadcasts']['index'].handler
+    news = functions['news']['index'].handler
+    article_ids = latest_news_ids(args.database_url, functions['broadcasts']['index'].HOME_NEWS_LIMIT) if args.database_url else []
+
+    recorder = Recorder()
+    sampler = ConnectionSampler(args.database_url) if args.database_url else None
+    if sampler:
+        sampler.start()
+
+    # Очередь (время, тип, параметр): первый опрос зрителя - в случайной точке интервала
+    schedule: List[Tuple[float, int, str, Any]] = []
+    started = time.monotonic()
+    for viewer in range(args.viewers):
+        # каналы популярны неравномерно: первые получают больше зрителей
+        channel = channels[min(int(random.paretovariate(1.2)) - 1, len(channels) - 1)]
+        heapq.heappush(schedule, (started + random.uniform(0, args.poll_interval), viewer, 'viewer', channel))
+    if args.database_url and args.page_rate > 0:
+        heapq.heappush(schedule, (started + random.expovariate(args.page_rate), -1, 'page', None))
+
+    def page_load() -> None:
+        recorder.call('broadcasts GET home', broadcasts, {
+            'httpMethod': 'GET', 'headers': {'Accept-Encoding': 'gzip, br'},
+            'queryStringParameters': {'action': 'home'}
+        })
+        if article_ids and random.random() < args.article_share:
+            recorder.call('news GET article', news, {
+                'httpMethod': 'GET', 'headers': {'Accept-Encoding': 'gzip, br'},
+                'queryStringParameters': {'id': str(random.choice(article_ids))}
+            })
+
+    deadline = started + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        while schedule and schedule[0][0] < deadline:
+            at, order, kind, payload = heapq.heappop(schedule)
+            delay = at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            if kind == 'viewer':
+                platform, channel = payload
+                executor.submit(recorder.call, f'broadcasts get-stream {platform}', broadcasts, {
+                    'httpMethod': 'GET',
+                    'queryStringParameters': {'action': 'get-stream', 'platform': platform, 'channel': channel}
+                })
+                heapq.heappush(schedule, (at + args.poll_interval, order, kind, payload))
+            else:
+                executor.submit(page_load)
+                heapq.heappush(schedule, (at + random.expovariate(args.page_rate), order, kind, payload))
+
+    elapsed = time.monotonic() - started
+    if sampler:
+        sampler.stop()
+
+    broadcasts_modules = functions['broadcasts']
+    report = {
+        'duration_s': round(elapsed, 1),
+        'routes': recorder.report(elapsed),
+        'upstream': platforms.stats(),
+        'upstream_client': broadcasts_modules['index']._upstream.stats(),
+        'breakers': {platform: breaker.stats()['state'] for platform, breaker in broadcasts_modules['index']._breakers.items()},
+        'db_pool': {name: modules['db'].stats() for name, modules in functions.items()},
+        'postgres_peak_connections': sampler.peak if sampler else None
+    }
+    platforms.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print(f'duration {report["duration_s"]}s, viewers {args.viewers}, channels {args.channels}, '
+          f'upstream latency {args.latency_ms}ms, failure rate {args.failure_rate}')
+    print(f'{"route":34} {"req":>7} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8}  statuses')
+    for route, row in report['routes'].items():
+        print(f'{route:34} {row["requests"]:>7} {row["rps"]:>8} {row["p50_ms"]:>8} {row["p95_ms"]:>8} {row["p99_ms"]:>8}  {row["statuses"]}')
+    print(f'upstream: {report["upstream"]}')
+    print(f'upstream client: opened {report["upstream_client"]["connections_opened"]}, '
+          f'reused {report["upstream_client"]["connections_reused"]}, early closes {report["upstream_client"]["early_closes"]}')
+    print(f'breakers: {report["breakers"]}')
+    for name, pool in report['db_pool'].items():
+        print(f'db pool {name}: opened {pool["opened"]}, reused {pool["reused"]}, acquired {pool["acquired"]}, timeouts {pool["acquire_timeouts"]}')
+    if sampler:
+        print(f'postgres peak connections: {report["postgres_peak_connections"]}')
+
+
+if __name__ == '__main__':
+    main()
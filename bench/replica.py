@@ -0,0 +1,71 @@
+'''
+Маршрутизация чтений db.py на двух локальных Postgres: мастер и реплика (или просто второй инстанс)
+Показывает, какой сервер ответил на публичное чтение, на чтение с токеном и на запись,
+и что таймаут маршрута обрывает медленный запрос; в конце - счётчики db.stats()
+
+Примеры:
+    DATABASE_URL=postgresql://localhost:5432/app DATABASE_REPLICA_URL=postgresql://localhost:5433/app \
+        python bench/replica.py
+    ... python bench/replica.py --reads 200 --timeout-ms 200
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, '..', 'backend', 'broadcasts'))
+
+import db  # noqa: E402
+
+SERVER_QUERY = "SELECT current_setting('port'), pg_is_in_recovery()"
+
+
+def server(replica: bool, event: Dict[str, Any]) -> str:
+    with db.connection(replica=replica and db.public_read(event)) as conn:
+        cur = conn.cursor()
+        cur.execute(SERVER_QUERY)
+        port, in_recovery = cur.fetchone()
+        cur.close()
+    return f'port {port}' + (' (replica)' if in_recovery else '')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--reads', type=int, default=50)
+    parser.add_argument('--timeout-ms', type=int, default=100)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL') or not os.environ.get('DATABASE_REPLICA_URL'):
+        sys.exit('Set DATABASE_URL and DATABASE_REPLICA_URL')
+
+    public_event: Dict[str, Any] = {'headers': {}}
+    admin_event: Dict[str, Any] = {'headers': {'X-Auth-Token': 'any'}}
+    print('public read :', server(True, public_event))
+    print('admin read  :', server(True, admin_event))
+    print('write       :', server(False, public_event))
+
+    started = time.perf_counter()
+    answered: Dict[str, int] = {}
+    for _ in range(args.reads):
+        name = server(True, public_event)
+        answered[name] = answered.get(name, 0) + 1
+    elapsed = time.perf_counter() - started
+    print(f'{args.reads} public reads in {elapsed * 1000:.0f} ms:', answered)
+
+    started = time.perf_counter()
+    try:
+        with db.connection(replica=True, statement_timeout=args.timeout_ms) as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT pg_sleep(%s)', (args.timeout_ms / 1000 * 5,))
+        print('slow query  : not cancelled')
+    except db.psycopg2.Error as e:
+        print(f'slow query  : cancelled after {(time.perf_counter() - started) * 1000:.0f} ms ({type(e).__name__})')
+
+    print(json.dumps(db.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
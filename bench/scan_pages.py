@@ -0,0 +1,100 @@
+'''
+Сравнение разбора страниц платформ: эталонный проход регулярками по всей странице
+и потоковый page_scan.scan с ранним выходом, как в index.py; результаты обязаны совпадать
+при любом делении страницы на части (SPLITS - размеры частей, которые сверяются)
+Корпус - сохранённые страницы в bench/corpus/*.html.gz; запуск: python bench/scan_pages.py [повторов]
+'''
+import gzip
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, '..', 'backend', 'broadcasts'))
+
+os.environ.setdefault('DATABASE_URL', 'postgresql://localhost/unused')
+os.environ.setdefault('LOG_SAMPLE_RATE', '0')
+
+# Шаблоны, извлечение и ранжирование - те же, что в get_vk_stream/get_twitch_stream, иначе сверка ничего не доказывает
+from index import TWITCH_LIVE_PATTERNS, VK_URL_PATTERNS, _vk_quality, _vk_stream_url  # noqa: E402
+from page_scan import scan  # noqa: E402
+
+CHUNK_SIZE = 16384
+# мелкие части делят ссылки VK разных качеств между окнами
+SPLITS = (CHUNK_SIZE, 4096, 1000, 170, 150, 120, 64)
+
+
+def twitch_full(body: bytes):
+    html = body.decode('utf-8')
+    return 'isLiveBroadcast' in html or '"isLive":true' in html
+
+
+def twitch_stream(chunks):
+    return scan(chunks, TWITCH_LIVE_PATTERNS, stop_index=len(TWITCH_LIVE_PATTERNS) - 1) is not None
+
+
+def vk_full(body: bytes):
+    '''Эталон: первый вид ссылки по приоритету, из его ссылок - лучшая по _vk_quality на всей странице'''
+    for index, pattern in enumerate(VK_URL_PATTERNS):
+        best = None
+        for match in pattern.finditer(body):
+            url = _vk_stream_url(index, match)
+            if url is not None and (best is None or _vk_quality(index, match) > best[0]):
+                best = (_vk_quality(index, match), url)
+        if best is not None:
+            return best[1]
+    return None
+
+
+def vk_stream(chunks):
+    found = scan(chunks, VK_URL_PATTERNS, _vk_stream_url, rank=_vk_quality)
+    return found[1] if found else None
+
+
+class Counted:
+    '''Итератор частей тела, считающий прочитанные байты'''
+
+    def __init__(self, body: bytes, chunk_size: int = CHUNK_SIZE):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.read = 0
+
+    def __iter__(self):
+        for offset in range(0, len(self.body), self.chunk_size):
+            chunk = self.body[offset:offset + self.chunk_size]
+            self.read += len(chunk)
+            yield chunk
+
+
+def measure(fn, arg_factory, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(arg_factory())
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main() -> None:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    corpus = os.path.join(ROOT, 'corpus')
+
+    print(f'{"page":32} {"size":>9} {"read":>9} {"full us":>9} {"stream us":>10} result')
+    for name in sorted(os.listdir(corpus)):
+        if not name.endswith('.html.gz'):
+            continue
+        with gzip.open(os.path.join(corpus, name)) as f:
+            body = f.read()
+
+        full, stream = (twitch_full, twitch_stream) if name.startswith('twitch') else (vk_full, vk_stream)
+        expected = full(body)
+        for chunk_size in SPLITS:
+            assert stream(Counted(body, chunk_size)) == expected, f'{name}: streaming result differs from full parse with {chunk_size}-byte chunks'
+        counted = Counted(body)
+        result = stream(counted)
+
+        full_us = measure(full, lambda: body, repeat)
+        stream_us = measure(stream, lambda: Counted(body), repeat)
+        print(f'{name[:-3]:32} {len(body):>9} {counted.read:>9} {full_us:>9.1f} {stream_us:>10.1f} {result}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+'''
+Холодный старт функций: каждый замер - новый интерпретатор, как новый инстанс под всплеском событий
+Меряются импорт index.py, первый OPTIONS и первый вызов, которому нужна база,
+а также был ли psycopg2 загружен к моменту ответа на preflight
+
+Примеры:
+    python bench/startup.py
+    python bench/startup.py --runs 20 --ref HEAD~1   # сравнение с другой ревизией backend/
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(ROOT, '..', 'backend')
+FUNCTIONS = ('broadcasts', 'news', 'auth', 'change-password')
+
+# Выполняется в дочернем процессе внутри каталога функции
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import index
+imported = time.perf_counter()
+index.handler({'httpMethod': 'OPTIONS'}, None)
+preflight = time.perf_counter()
+driver_after_preflight = 'psycopg2' in sys.modules
+try:
+    import psycopg2
+    driver = time.perf_counter()
+except ImportError:
+    driver = None
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'preflight_ms': (preflight - imported) * 1000,
+    'driver_ms': (driver - preflight) * 1000 if driver else None,
+    'driver_after_preflight': driver_after_preflight,
+    'modules': len(sys.modules)
+}))
+'''
+
+
+def measure(directory: str, runs: int) -> Dict[str, Any]:
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'postgresql://localhost/unused')
+    env.setdefault('LOG_SAMPLE_RATE', '0')
+    # байткод компилируется один раз при деплое, поэтому первый прогон не учитывается
+    samples: List[Dict[str, Any]] = []
+    for _ in range(runs + 1):
+        started_ns = time.perf_counter_ns()
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE], cwd=directory, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample['process_ms'] = (time.perf_counter_ns() - started_ns) / 1e6
+        samples.append(sample)
+    samples = samples[1:]
+
+    def median(name: str) -> Optional[float]:
+        values = [sample[name] for sample in samples if sample[name] is not None]
+        return round(statistics.median(values), 2) if values else None
+
+    return {
+        'import_ms': median('import_ms'),
+        'preflight_ms': median('preflight_ms'),
+        'process_ms': median('process_ms'),
+        'driver_ms': median('driver_ms'),
+        'driver_after_preflight': any(sample['driver_after_preflight'] for sample in samples),
+        'modules': samples[-1]['modules']
+    }
+
+
+def export_ref(ref: str, target: str) -> str:
+    '''backend/ выбранной ревизии во временный каталог через git archive'''
+    archive = subprocess.run(
+        ['git', 'archive', ref, 'backend'], cwd=os.path.join(ROOT, '..'), capture_output=True, check=True
+    ).stdout
+    path = os.path.join(target, 'archive.tar')
+    with open(path, 'wb') as f:
+        f.write(archive)
+    with tarfile.open(path) as tar:
+        tar.extractall(target)
+    return os.path.join(target, 'backend')
+
+
+def report(label: str, results: Dict[str, Dict[str, Any]]) -> None:
+    print(f'{label}:')
+    print(f'  {"function":<16} {"import":>9} {"preflight":>10} {"process":>9} {"driver":>8}  driver on preflight')
+    for name, result in results.items():
+        driver = f'{result["driver_ms"]:.1f}' if result['driver_ms'] is not None else '-'
+        print(
+            f'  {name:<16} {result["import_ms"]:>7.1f}ms {result["preflight_ms"]:>8.2f}ms '
+            f'{result["process_ms"]:>7.1f}ms {driver:>6}ms  {"yes" if result["driver_after_preflight"] else "no"}'
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='холодных стартов на функцию (медиана)')
+    parser.add_argument('--functions', default=','.join(FUNCTIONS))
+    parser.add_argument('--ref', help='git-ревизия для сравнения, например HEAD~1')
+    parser.add_argument('--json', action='store_true', help='вывести результат как JSON')
+    args = parser.parse_args()
+
+    functions = [name for name in args.functions.split(',') if name]
+    results = {'current': {name: measure(os.path.join(BACKEND, name), args.runs) for name in functions}}
+
+    if args.ref:
+        with tempfile.TemporaryDirectory() as target:
+            backend = export_ref(args.ref, target)
+            results[args.ref] = {
+                name: measure(os.path.join(backend, name), args.runs)
+                for name in functions if os.path.isdir(os.path.join(backend, name))
+            }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for label, measured in results.items():
+        report(label, measured)
+
+
+if __name__ == '__main__':
+    main()
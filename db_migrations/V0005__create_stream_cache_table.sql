@@ -0,0 +1,11 @@
+-- Shared cache of resolved stream URLs (platform, channel) for broadcasts get-stream
+CREATE TABLE IF NOT EXISTS stream_cache (
+    platform TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    stream_url TEXT,
+    expires_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (platform, channel)
+);
+
+CREATE INDEX IF NOT EXISTS idx_stream_cache_expires_at ON stream_cache (expires_at);
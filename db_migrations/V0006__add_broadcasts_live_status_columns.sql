@@ -0,0 +1,5 @@
+-- Live status materialized by the broadcasts live poller
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS platform TEXT;
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS channel TEXT;
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS stream_url TEXT;
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS checked_at TIMESTAMP;
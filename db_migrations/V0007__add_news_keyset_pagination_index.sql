@@ -0,0 +1,5 @@
+-- Keyset pagination over news by (published_date, id)
+UPDATE news SET published_date = created_at::date WHERE published_date IS NULL;
+ALTER TABLE news ALTER COLUMN published_date SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_news_published_date_id ON news (published_date DESC, id DESC);
@@ -0,0 +1,8 @@
+-- Schedule ordering / date windows and the live-only filter for the broadcasts listing
+CREATE INDEX IF NOT EXISTS idx_broadcasts_schedule ON broadcasts (
+    (COALESCE(scheduled_date, DATE '0001-01-01')),
+    (COALESCE(scheduled_time, TIME '00:00')),
+    id
+);
+
+CREATE INDEX IF NOT EXISTS idx_broadcasts_live ON broadcasts (scheduled_date, scheduled_time) WHERE is_live;
@@ -0,0 +1,24 @@
+-- Monotonic version of each broadcast's playback status for the change feed
+CREATE SEQUENCE IF NOT EXISTS broadcasts_status_version_seq;
+
+ALTER TABLE broadcasts
+    ADD COLUMN IF NOT EXISTS status_version BIGINT NOT NULL DEFAULT nextval('broadcasts_status_version_seq');
+
+CREATE INDEX IF NOT EXISTS idx_broadcasts_status_version ON broadcasts (status_version);
+
+-- Bump the version whenever the stream URL, liveness or source video changes, whoever writes it
+CREATE OR REPLACE FUNCTION bump_broadcast_status_version() RETURNS trigger AS $$
+BEGIN
+    IF NEW.is_live IS DISTINCT FROM OLD.is_live
+       OR NEW.stream_url IS DISTINCT FROM OLD.stream_url
+       OR NEW.video_url IS DISTINCT FROM OLD.video_url THEN
+        NEW.status_version := nextval('broadcasts_status_version_seq');
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_broadcasts_status_version ON broadcasts;
+CREATE TRIGGER trg_broadcasts_status_version
+    BEFORE UPDATE ON broadcasts
+    FOR EACH ROW EXECUTE FUNCTION bump_broadcast_status_version();
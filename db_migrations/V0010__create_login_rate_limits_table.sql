@@ -0,0 +1,8 @@
+-- Shared token buckets for admin login attempts (auth, change-password); a missing row is a full bucket
+CREATE TABLE IF NOT EXISTS login_rate_limits (
+    key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    capacity DOUBLE PRECISION NOT NULL,
+    refill_per_second DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,9 @@
+-- Full-text search over news (title > excerpt > content) with the russian configuration
+ALTER TABLE news
+    ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', COALESCE(title, '')), 'A') ||
+        setweight(to_tsvector('russian', COALESCE(excerpt, '')), 'B') ||
+        setweight(to_tsvector('russian', COALESCE(content, '')), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_news_search_vector ON news USING GIN (search_vector);
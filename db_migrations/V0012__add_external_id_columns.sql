@@ -0,0 +1,7 @@
+-- Stable ids from imported schedules/feeds: bulk create with external_id upserts instead of duplicating
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS external_id TEXT;
+ALTER TABLE news ADD COLUMN IF NOT EXISTS external_id TEXT;
+
+-- Not partial: ON CONFLICT (external_id) needs a plain unique index, NULLs never conflict anyway
+CREATE UNIQUE INDEX IF NOT EXISTS idx_broadcasts_external_id ON broadcasts (external_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_news_external_id ON news (external_id);
@@ -0,0 +1,3 @@
+-- Responsive variants built by news/images.py: {"source": md5(image_url), "width", "height", "srcset": {"avif": "...", "webp": "..."}}
+-- or {"source", "error"} when the image could not be processed; rows with a stale source are picked up again
+ALTER TABLE news ADD COLUMN IF NOT EXISTS image_variants JSONB;
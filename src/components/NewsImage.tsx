@@ -0,0 +1,18 @@
+interface NewsImageProps {
+  src: string;
+  srcset?: Record<string, string> | null;
+  alt: string;
+  sizes: string;
+  className?: string;
+}
+
+const NewsImage = ({ src, srcset, alt, sizes, className }: NewsImageProps) => (
+  <picture>
+    {Object.entries(srcset || {}).map(([format, value]) => (
+      <source key={format} type={`image/${format}`} srcSet={value} sizes={sizes} />
+    ))}
+    <img src={src} alt={alt} loading="lazy" decoding="async" className={className} />
+  </picture>
+);
+
+export default NewsImage;
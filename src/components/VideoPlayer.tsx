@@ -7,15 +7,18 @@ import 'video.js/dist/video-js.css';
 interface VideoPlayerProps {
   videoUrl: string;
   title?: string;
+  streamUrl?: string | null;
 }
 
 const BROADCASTS_API = 'https://functions.poehali.dev/cb454292-1eb9-4e4c-bfad-cbb5cb1be664';
 
-const VideoPlayer = ({ videoUrl, title }: VideoPlayerProps) => {
+const VideoPlayer = ({ videoUrl, title, streamUrl: initialStreamUrl }: VideoPlayerProps) => {
   const [isPlaying, setIsPlaying] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const videoRef = useRef<HTMLVideoElement | null>(null);
   const playerRef = useRef<any>(null);
+  const feedRef = useRef<EventSource | null>(null);
+  const pollRef = useRef<ReturnType<typeof setInterval> | null>(null);
   
   const isKickVideo = videoUrl.includes('kick.com');
   const isTwitchVideo = videoUrl.includes('twitch.tv');
@@ -109,7 +112,7 @@ const VideoPlayer = ({ videoUrl, title }: VideoPlayerProps) => {
 
     try {
       const response = await fetch(
-        `${BROADCASTS_API}?action=get-stream&channel=${channelInfo.channel}&platform=${channelInfo.platform}`
+        `${BROADCASTS_API}?action=get-stream&channel=${encodeURIComponent(channelInfo.channel)}&platform=${encodeURIComponent(channelInfo.platform)}`
       );
       
       if (!response.ok) {
@@ -127,7 +130,7 @@ const VideoPlayer = ({ videoUrl, title }: VideoPlayerProps) => {
   const initializePlayer = async () => {
     if (!videoRef.current || !useCustomPlayer) return;
 
-    const streamUrl = await fetchStreamUrl();
+    const streamUrl = initialStreamUrl || await fetchStreamUrl();
     if (!streamUrl) {
       setError('Стрим сейчас недоступен');
       return;
@@ -162,21 +165,36 @@ const VideoPlayer = ({ videoUrl, title }: VideoPlayerProps) => {
       setError('Ошибка загрузки стрима');
     });
 
-    const updateInterval = setInterval(async () => {
-      const newStreamUrl = await fetchStreamUrl();
-      if (newStreamUrl && newStreamUrl !== streamUrl && player) {
+    const channelInfo = getChannelAndPlatform(videoUrl);
+    if (!channelInfo) return;
+
+    let currentStreamUrl = streamUrl;
+    const switchStream = (newStreamUrl: string | null | undefined) => {
+      if (newStreamUrl && newStreamUrl !== currentStreamUrl) {
+        currentStreamUrl = newStreamUrl;
         player.src({
           src: newStreamUrl,
           type: newStreamUrl.includes('.m3u8') ? 'application/x-mpegURL' : 'video/mp4'
         });
       }
-    }, 30000);
+    };
 
-    return () => {
-      clearInterval(updateInterval);
-      if (player) {
-        player.dispose();
-      }
+    const feed = new EventSource(
+      `${BROADCASTS_API}?action=changes&channel=${encodeURIComponent(channelInfo.channel)}&platform=${encodeURIComponent(channelInfo.platform)}`
+    );
+    feedRef.current = feed;
+
+    feed.addEventListener('changes', (event) => {
+      const { changes } = JSON.parse((event as MessageEvent).data);
+      switchStream(changes.find((change: any) => change.stream_url)?.stream_url);
+    });
+
+    feed.onerror = () => {
+      if (feed.readyState !== EventSource.CLOSED || pollRef.current) return;
+      feedRef.current = null;
+      pollRef.current = setInterval(async () => {
+        switchStream(await fetchStreamUrl());
+      }, 30000);
     };
   };
 
@@ -186,6 +204,14 @@ const VideoPlayer = ({ videoUrl, title }: VideoPlayerProps) => {
     }
 
     return () => {
+      if (feedRef.current) {
+        feedRef.current.close();
+        feedRef.current = null;
+      }
+      if (pollRef.current) {
+        clearInterval(pollRef.current);
+        pollRef.current = null;
+      }
       if (playerRef.current) {
         playerRef.current.dispose();
         playerRef.current = null;
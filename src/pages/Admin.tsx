@@ -44,12 +44,25 @@ const Admin = () => {
 
   useEffect(() => {
     const token = localStorage.getItem('admin_token');
-    if (token) {
+    const expiresAt = Number(localStorage.getItem('admin_token_expires_at') || 0);
+    if (token && expiresAt * 1000 > Date.now()) {
       setIsAuthenticated(true);
       loadData();
     }
   }, []);
 
+  const authHeaders = () => ({
+    'Content-Type': 'application/json',
+    'X-Auth-Token': localStorage.getItem('admin_token') || '',
+  });
+
+  const handleSessionExpired = () => {
+    localStorage.removeItem('admin_token');
+    localStorage.removeItem('admin_token_expires_at');
+    setIsAuthenticated(false);
+    toast({ title: 'Сессия истекла', description: 'Войдите снова', variant: 'destructive' });
+  };
+
   const handleLogin = async () => {
     try {
       const response = await fetch(API_ENDPOINTS.auth, {
@@ -61,6 +74,7 @@ const Admin = () => {
       
       if (data.success) {
         localStorage.setItem('admin_token', data.token);
+        localStorage.setItem('admin_token_expires_at', String(data.expires_at));
         setIsAuthenticated(true);
         loadData();
         toast({ title: 'Успешно', description: 'Добро пожаловать в админ-панель' });
@@ -74,6 +88,7 @@ const Admin = () => {
 
   const handleLogout = () => {
     localStorage.removeItem('admin_token');
+    localStorage.removeItem('admin_token_expires_at');
     setIsAuthenticated(false);
     navigate('/');
   };
@@ -103,8 +118,8 @@ const Admin = () => {
   const loadData = async () => {
     try {
       const [broadcastsRes, newsRes] = await Promise.all([
-        fetch(API_ENDPOINTS.broadcasts),
-        fetch(API_ENDPOINTS.news),
+        fetch(API_ENDPOINTS.broadcasts, { cache: 'no-cache', headers: authHeaders() }),
+        fetch(API_ENDPOINTS.news, { cache: 'no-cache', headers: authHeaders() }),
       ]);
       const broadcastsData = await broadcastsRes.json();
       const newsData = await newsRes.json();
@@ -121,9 +136,13 @@ const Admin = () => {
       const method = broadcast.id ? 'PUT' : 'POST';
       const response = await fetch(API_ENDPOINTS.broadcasts, {
         method,
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders(),
         body: JSON.stringify(broadcast),
       });
+      if (response.status === 401) {
+        handleSessionExpired();
+        return;
+      }
       const data = await response.json();
       
       if (data.success) {
@@ -138,11 +157,15 @@ const Admin = () => {
 
   const deleteBroadcast = async (id: number) => {
     try {
-      await fetch(API_ENDPOINTS.broadcasts, {
+      const response = await fetch(API_ENDPOINTS.broadcasts, {
         method: 'DELETE',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders(),
         body: JSON.stringify({ id }),
       });
+      if (response.status === 401) {
+        handleSessionExpired();
+        return;
+      }
       toast({ title: 'Успешно', description: 'Трансляция удалена' });
       loadData();
     } catch (error) {
@@ -155,9 +178,13 @@ const Admin = () => {
       const method = newsItem.id ? 'PUT' : 'POST';
       const response = await fetch(API_ENDPOINTS.news, {
         method,
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders(),
         body: JSON.stringify(newsItem),
       });
+      if (response.status === 401) {
+        handleSessionExpired();
+        return;
+      }
       const data = await response.json();
       
       if (data.success) {
@@ -172,11 +199,15 @@ const Admin = () => {
 
   const deleteNews = async (id: number) => {
     try {
-      await fetch(API_ENDPOINTS.news, {
+      const response = await fetch(API_ENDPOINTS.news, {
         method: 'DELETE',
-        headers: { 'Content-Type': 'application/json' },
+        headers: authHeaders(),
         body: JSON.stringify({ id }),
       });
+      if (response.status === 401) {
+        handleSessionExpired();
+        return;
+      }
       toast({ title: 'Успешно', description: 'Новость удалена' });
       loadData();
     } catch (error) {
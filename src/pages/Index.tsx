@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import Header from '@/components/Header';
 import VideoPlayer from '@/components/VideoPlayer';
+import NewsImage from '@/components/NewsImage';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Badge } from '@/components/ui/badge';
 import { Button } from '@/components/ui/button';
@@ -19,23 +20,30 @@ const Index = () => {
 
   const loadData = async () => {
     try {
-      const [broadcastsRes, newsRes] = await Promise.all([
-        fetch('https://functions.poehali.dev/cb454292-1eb9-4e4c-bfad-cbb5cb1be664'),
-        fetch('https://functions.poehali.dev/85778fcb-8560-48d6-9905-7e93224f8844'),
-      ]);
-      const broadcastsData = await broadcastsRes.json();
-      const newsData = await newsRes.json();
+      const response = await fetch('https://functions.poehali.dev/cb454292-1eb9-4e4c-bfad-cbb5cb1be664?action=home');
+      const data = await response.json();
       
-      const allBroadcasts = broadcastsData.broadcasts || [];
-      const live = allBroadcasts.find((b: any) => b.is_live);
-      setLiveBroadcast(live);
-      setBroadcasts(allBroadcasts.filter((b: any) => !b.is_live));
-      setNews(newsData.news || []);
+      setLiveBroadcast((data.live || [])[0] || null);
+      setBroadcasts(data.upcoming || []);
+      setNews(data.news || []);
     } catch (error) {
       console.error('Failed to load data:', error);
     }
   };
 
+  const openNews = async (item: any) => {
+    setSelectedNews(item);
+    try {
+      const response = await fetch(`https://functions.poehali.dev/85778fcb-8560-48d6-9905-7e93224f8844?id=${item.id}`);
+      const data = await response.json();
+      if (data.article) {
+        setSelectedNews(data.article);
+      }
+    } catch (error) {
+      console.error('Failed to load news:', error);
+    }
+  };
+
   return (
     <div className="min-h-screen bg-background">
       <Header />
@@ -53,6 +61,7 @@ const Index = () => {
             <VideoPlayer 
               videoUrl={liveBroadcast.video_url} 
               title={liveBroadcast.title}
+              streamUrl={liveBroadcast.stream_url}
             />
           </section>
         )}
@@ -90,9 +99,11 @@ const Index = () => {
               <Card key={item.id} className="overflow-hidden hover:shadow-lg transition-shadow">
                 {item.image_url && (
                   <div className="aspect-video overflow-hidden">
-                    <img 
-                      src={item.image_url} 
+                    <NewsImage
+                      src={item.image_url}
+                      srcset={item.image_srcset}
                       alt={item.title}
+                      sizes="(min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw"
                       className="w-full h-full object-cover hover:scale-105 transition-transform duration-300"
                     />
                   </div>
@@ -104,7 +115,7 @@ const Index = () => {
                   <p className="text-muted-foreground text-sm mb-4">{item.excerpt}</p>
                   <div className="flex items-center justify-between">
                     <p className="text-xs text-muted-foreground">{item.published_date}</p>
-                    <Button variant="ghost" size="sm" onClick={() => setSelectedNews(item)}>
+                    <Button variant="ghost" size="sm" onClick={() => openNews(item)}>
                       Читать →
                     </Button>
                   </div>
@@ -158,9 +169,11 @@ const Index = () => {
               </CardHeader>
               <CardContent className="space-y-4">
                 {selectedNews.image_url && (
-                  <img 
-                    src={selectedNews.image_url} 
+                  <NewsImage
+                    src={selectedNews.image_url}
+                    srcset={selectedNews.image_srcset}
                     alt={selectedNews.title}
+                    sizes="(min-width: 768px) 768px, 100vw"
                     className="w-full rounded-lg"
                   />
                 )}